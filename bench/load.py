@@ -0,0 +1,377 @@
+"""
+MCP 工具端到端壓測
+
+啟動本機 CBETA 替身伺服器（bench/mock_cbeta.py）與 MCP 服務（main:app），
+透過 /mcp SSE 端點以多個 MCP 會話並發呼叫所有已註冊工具（混合權重工作負載），
+統計吞吐量、p50/p95/p99 延遲、錯誤率與服務端記憶體，結果寫成 JSON 以便比較。
+
+用法：
+    python -m bench.load --duration 30 --concurrency 32 --sessions 4
+    python -m bench.load --duration 30 --compare bench/results/baseline.json --max-regression 0.2
+
+    # 壓測已在執行的服務（不自動啟動子行程）
+    python -m bench.load --target http://127.0.0.1:8000 --no-spawn
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+
+WORKS = ["T0001", "T0099", "T0220", "T0235", "T0251", "T0262", "T0279", "T0366", "T0945", "T1501", "T2008", "X1456"]
+TERMS = ["法鼓", "般若", "菩提", "涅槃", "如來藏", "阿賴耶", "觀世音", "文殊師利"]
+LINEHEADS = [f"T01n0001_p{p:04d}a{l:02d}" for p in range(1, 30) for l in (1, 5, 9)]
+
+
+def _pick(seq):
+    return random.choice(seq)
+
+
+# 工具名稱 -> (權重, 參數產生器)；權重大致對應實際代理流量（查經文與目次最多）
+WORKLOAD: Dict[str, Tuple[int, Callable[[], dict]]] = {
+    "get_cbeta_catalog": (4, lambda: {"q": _pick(["root", "CBETA", "orig-T", "CBETA.001", "CBETA.003.001"])}),
+    "search_cbeta_texts": (3, lambda: {"q": _pick(["阿含", "般若", "T01", "T08"])}),
+    "search_buddhist_canons_by_vol": (2, lambda: {"canon": "T", "vol_start": random.randint(1, 50), "vol_end": random.randint(51, 55)}),
+    "search_works_by_translator": (3, lambda: _pick([{"creator_id": "A000439"}, {"creator": "竺"}, {"creator_name": "玄奘"}])),
+    "search_cbeta_by_dynasty": (2, lambda: _pick([{"dynasty": "唐"}, {"dynasty": "唐,宋"}, {"time_start": 600, "time_end": 700}])),
+    "cbeta_fulltext_search": (8, lambda: _pick([{"q": _pick(TERMS), "rows": 20, "start": _pick([0, 0, 20, 40])},
+                                                 {"q": _pick(TERMS), "auto_paginate": 1, "max_results": 500}])),
+    "extended_search": (3, lambda: {"q": f'"{_pick(TERMS)}" "{_pick(TERMS)}"', "rows": 20}),
+    "synonym_search": (2, lambda: {"q": _pick(["文殊師利", "觀世音", "舍利弗"])}),
+    "cbeta_search_sc": (3, lambda: {"q": _pick(["四圣谛", "般若", "菩提"])}),
+    "cbeta_facet_query": (2, lambda: {"q": _pick(TERMS), "f": _pick([None, "canon", "dynasty"])}),
+    "cbeta_all_in_one": (6, lambda: {"q": _pick(TERMS), "rows": 10}),
+    "search_cbeta_notes": (2, lambda: {"q": f'"{_pick(TERMS)}"', "rows": 10}),
+    "search_title": (3, lambda: {"q": _pick(["觀無量壽經", "大般若波羅蜜", "金剛般若經"]), "auto_paginate": _pick([0, 0, 1])}),
+    "cbeta_kwic_search": (5, lambda: _pick([
+        {"work": _pick(WORKS), "juan": random.randint(1, 5), "q": _pick(TERMS)},
+        {"work": _pick(WORKS), "juan": random.randint(1, 5), "q": f"{_pick(TERMS)} NEAR/5 {_pick(TERMS)}", "sort": "location"},
+        {"works": [_pick(WORKS), _pick(WORKS)], "q": _pick(TERMS), "mark": 1},
+    ])),
+    "cbeta_similar_search": (1, lambda: {"q": "已得善提捨不證"}),
+    "get_cbeta_work_info": (10, lambda: {"work": _pick(WORKS)}),
+    "get_cbeta_work_info_batch": (2, lambda: {"works": random.sample(WORKS, 4)}),
+    "get_cbeta_toc": (8, lambda: _pick([{"work": _pick(WORKS)}, {"work": _pick(WORKS), "depth": 1}])),
+    "get_cbeta_toc_batch": (2, lambda: {"works": random.sample(WORKS, 3), "depth": 1}),
+    "cbeta_toc_lookup": (4, lambda: _pick([{"linehead": _pick(LINEHEADS)}, {"work": "T0001", "juan": random.randint(1, 4)}])),
+    "get_juan_html": (8, lambda: {"work": _pick(WORKS), "juan": random.randint(1, 5), "work_info": _pick([0, 1]), "toc": _pick([0, 1])}),
+    "cbeta_goto": (4, lambda: _pick([{"linehead": _pick(LINEHEADS)}, {"canon": "T", "vol": 1, "page": random.randint(1, 100), "col": "a", "line": 1},
+                                     {"citations": random.sample(LINEHEADS, 20) + ["T0001_002", "T01, no. 1, p. 11b10"]}])),
+    "get_cbeta_lines": (8, lambda: {"linehead": _pick(LINEHEADS), "before": random.randint(0, 3), "after": random.randint(0, 3)}),
+    "get_cbeta_lines_batch": (3, lambda: {"citations": random.sample(LINEHEADS, 12) + ["T01, no. 1, p. 2b3-8"]}),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def _summary(latencies: List[float], errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / count * 1000, 2) if count else 0.0,
+            "p50": round(_percentile(values, 50) * 1000, 2),
+            "p95": round(_percentile(values, 95) * 1000, 2),
+            "p99": round(_percentile(values, 99) * 1000, 2),
+            "max": round(values[-1] * 1000, 2) if count else 0.0,
+        },
+    }
+
+
+async def _wait_http(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=1)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"服務未在 {timeout} 秒內啟動：{url}")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.recording = False
+
+    def add(self, tool: str, seconds: float, ok: bool):
+        if not self.recording:
+            return
+        self.latencies[tool].append(seconds)
+        if not ok:
+            self.errors[tool] += 1
+
+
+async def _call(session: ClientSession, tool: str, arguments: dict) -> bool:
+    result = await session.call_tool(tool, {"params": arguments})
+    if result.isError:
+        return False
+    for content in result.content:
+        text = getattr(content, "text", None)
+        if text:
+            try:
+                return json.loads(text).get("status") != "error"
+            except (ValueError, AttributeError):
+                return True
+    return True
+
+
+async def _worker(session: ClientSession, tools: List[str], weights: List[int],
+                  recorder: Recorder, clock: dict):
+    while time.monotonic() < clock["stop_at"]:
+        tool = random.choices(tools, weights)[0]
+        arguments = {k: v for k, v in WORKLOAD[tool][1]().items() if v is not None}
+        started = time.perf_counter()
+        try:
+            ok = await _call(session, tool, arguments)
+        except Exception:
+            ok = False
+        recorder.add(tool, time.perf_counter() - started, ok)
+
+
+async def _session_workers(target: str, workers: int, tools: List[str], weights: List[int],
+                           recorder: Recorder, clock: dict, connected: asyncio.Queue,
+                           start: asyncio.Event, registered: List[str]):
+    announced = False
+    try:
+        async with sse_client(f"{target}/mcp", timeout=30) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                if not registered:
+                    registered.extend(tool.name for tool in (await session.list_tools()).tools)
+                connected.put_nowait(None)
+                announced = True
+                await start.wait()
+                await asyncio.gather(*[_worker(session, tools, weights, recorder, clock) for _ in range(workers)])
+    except Exception as e:
+        if not announced:
+            connected.put_nowait(e)
+        raise
+
+
+async def run_load(target: str, duration: float, warmup: float, concurrency: int, sessions: int,
+                   only: Optional[List[str]], server_pid: Optional[int]) -> dict:
+    tools = [name for name in WORKLOAD if not only or name in only]
+    weights = [WORKLOAD[name][0] for name in tools]
+    recorder = Recorder()
+    registered: List[str] = []
+    connected: asyncio.Queue = asyncio.Queue()
+    start = asyncio.Event()
+    clock = {"stop_at": 0.0}
+    memory_samples: List[float] = []
+
+    async def sample_memory():
+        while True:
+            rss = _rss_mb(server_pid) if server_pid else None
+            if rss is not None:
+                memory_samples.append(rss)
+            await asyncio.sleep(0.5)
+
+    per_session = [concurrency // sessions + (1 if i < concurrency % sessions else 0) for i in range(sessions)]
+    tasks = [
+        asyncio.create_task(_session_workers(target, n, tools, weights, recorder, clock, connected, start, registered))
+        for n in per_session if n
+    ]
+    # 所有會話建立完成後同時開始；暖身期間的呼叫不計入統計
+    for _ in tasks:
+        error = await connected.get()
+        if error is not None:
+            for task in tasks:
+                task.cancel()
+            raise RuntimeError(f"無法建立 MCP 會話：{error!r}")
+    sampler = asyncio.create_task(sample_memory())
+    clock["stop_at"] = time.monotonic() + warmup + duration
+    start.set()
+    await asyncio.sleep(warmup)
+    recorder.recording = True
+    measured_from = time.monotonic()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.monotonic() - measured_from
+    sampler.cancel()
+
+    all_latencies = [v for values in recorder.latencies.values() for v in values]
+    report = {
+        "overall": _summary(all_latencies, sum(recorder.errors.values()), elapsed),
+        "tools": {
+            tool: _summary(recorder.latencies.get(tool, []), recorder.errors.get(tool, 0), elapsed)
+            for tool in tools
+        },
+        "memory_mb": {
+            "start": round(memory_samples[0], 1) if memory_samples else None,
+            "peak": round(max(memory_samples), 1) if memory_samples else None,
+            "end": round(memory_samples[-1], 1) if memory_samples else None,
+        },
+        "uncovered_tools": sorted(set(registered) - set(WORKLOAD)),
+    }
+    try:
+        async with httpx.AsyncClient() as client:
+            report["server_stats"] = (await client.get(f"{target}/stats", timeout=5)).json()
+    except (httpx.HTTPError, ValueError):
+        report["server_stats"] = None
+    return report
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> List[str]:
+    """回傳超出容許退化比例的指標；p95 延遲與吞吐量逐工具比較。"""
+    problems = []
+    pairs = [("overall", current["overall"], baseline["overall"])]
+    pairs += [(tool, stats, baseline["tools"].get(tool)) for tool, stats in current["tools"].items()]
+    for name, cur, base in pairs:
+        if not base or not base["requests"] or not cur["requests"]:
+            continue
+        base_p95, cur_p95 = base["latency_ms"]["p95"], cur["latency_ms"]["p95"]
+        if base_p95 and cur_p95 > base_p95 * (1 + max_regression):
+            problems.append(f"{name}: p95 {base_p95}ms -> {cur_p95}ms")
+        if cur["error_rate"] > base["error_rate"] + 0.01:
+            problems.append(f"{name}: error_rate {base['error_rate']} -> {cur['error_rate']}")
+    base_rps, cur_rps = baseline["overall"]["throughput_rps"], current["overall"]["throughput_rps"]
+    if base_rps and cur_rps < base_rps * (1 - max_regression):
+        problems.append(f"overall: throughput {base_rps} -> {cur_rps} rps")
+    return problems
+
+
+def _print_report(report: dict):
+    overall = report["overall"]
+    print(f"\n總計：{overall['requests']} 次，{overall['throughput_rps']} req/s，錯誤率 {overall['error_rate']:.2%}")
+    print(f"延遲 p50/p95/p99：{overall['latency_ms']['p50']} / {overall['latency_ms']['p95']} / {overall['latency_ms']['p99']} ms")
+    print(f"記憶體（MB）：{report['memory_mb']}")
+    print(f"\n{'工具':<32}{'次數':>8}{'錯誤率':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for tool, stats in sorted(report["tools"].items(), key=lambda kv: -kv[1]["latency_ms"]["p95"]):
+        lat = stats["latency_ms"]
+        print(f"{tool:<32}{stats['requests']:>8}{stats['error_rate']:>10.2%}{lat['p50']:>10}{lat['p95']:>10}{lat['p99']:>10}")
+    if report["uncovered_tools"]:
+        print(f"\n⚠️ 未納入工作負載的工具：{', '.join(report['uncovered_tools'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP 工具端到端壓測")
+    parser.add_argument("--duration", type=float, default=30, help="計時秒數")
+    parser.add_argument("--warmup", type=float, default=3, help="暖身秒數（不計入統計）")
+    parser.add_argument("--concurrency", type=int, default=32, help="同時進行的工具呼叫數")
+    parser.add_argument("--sessions", type=int, default=4, help="MCP 會話數")
+    parser.add_argument("--tools", default="", help="只壓測指定工具（逗號分隔）")
+    parser.add_argument("--target", default="", help="已在執行的 MCP 服務位址")
+    parser.add_argument("--no-spawn", action="store_true", help="不啟動 MCP 服務與替身伺服器")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--upstream-jitter-ms", type=float, default=30)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", default="", help="替身伺服器使用的錄製檔目錄")
+    parser.add_argument("--output", default="", help="結果 JSON 路徑（預設 bench/results/<時間>.json）")
+    parser.add_argument("--compare", default="", help="與指定的結果 JSON 比較")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="容許的退化比例")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    procs = []
+    server_pid = None
+    target = args.target.rstrip("/")
+    try:
+        if not args.no_spawn:
+            mock_port, app_port = _free_port(), _free_port()
+            mock_cmd = [sys.executable, "-m", "bench.mock_cbeta", "--port", str(mock_port),
+                        "--latency-ms", str(args.upstream_latency_ms), "--jitter-ms", str(args.upstream_jitter_ms),
+                        "--error-rate", str(args.upstream_error_rate)]
+            if args.fixtures:
+                mock_cmd += ["--fixtures", args.fixtures]
+            procs.append(subprocess.Popen(mock_cmd, cwd=ROOT))
+            # 快取、快照與查詢日誌都寫到暫存目錄，避免替身資料進入專案目錄後被正式服務讀取
+            workdir = tempfile.mkdtemp(prefix="cbeta-bench-")
+            env = dict(os.environ)
+            env.update({
+                "CBETA_API_BASE": f"http://127.0.0.1:{mock_port}",
+                "CBETA_CACHE_DB": os.path.join(workdir, "cache.sqlite3"),
+                "CBETA_WORKS_INDEX_SNAPSHOT": os.path.join(workdir, "works_index.json.gz"),
+                "CBETA_CATALOG_SNAPSHOT": os.path.join(workdir, "catalog_tree.json.gz"),
+                "MCP_LOG_FILE": os.path.join(workdir, "mcp_query_log.ndjson"),
+                "APP_BASE_URL": f"http://127.0.0.1:{app_port}",
+            })
+            app = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+                cwd=ROOT, env=env,
+            )
+            procs.append(app)
+            server_pid = app.pid
+            target = f"http://127.0.0.1:{app_port}"
+            asyncio.run(_wait_http(f"http://127.0.0.1:{mock_port}/__mock__/stats"))
+            asyncio.run(_wait_http(f"{target}/stats"))
+        if not target:
+            parser.error("--no-spawn 時須指定 --target")
+
+        only = [t.strip() for t in args.tools.split(",") if t.strip()] or None
+        report = asyncio.run(run_load(target, args.duration, args.warmup, args.concurrency,
+                                      args.sessions, only, server_pid))
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    _print_report(report)
+
+    output = args.output or os.path.join(ROOT, "bench", "results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📄 結果已寫入 {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.max_regression)
+        if problems:
+            print("\n❌ 效能退化：\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("\n✅ 未超出容許退化範圍")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+CBETA Online API 本機替身伺服器
+
+以錄製檔（見 tools/cebta/_replay.py）回應請求，可注入延遲、抖動與錯誤率；
+未錄製的請求可選擇以合成資料回應，讓壓測在無網路環境（CI）下也能涵蓋所有端點。
+
+用法：
+    python -m bench.mock_cbeta --port 9000 --fixtures recordings/ --latency-ms 80 --jitter-ms 40 --error-rate 0.01
+    CBETA_API_BASE=http://127.0.0.1:9000 python main.py
+
+錄製真實上游：
+    CBETA_RECORD_DIR=recordings/ python main.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request, Response
+from tools.cebta._replay import FixtureStore, FaultInjector, replay_response
+
+
+def _seed(path: str, params: Dict[str, str]) -> int:
+    text = path + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _work(n: int) -> dict:
+    return {
+        "work": f"T{n % 2920:04d}",
+        "title": f"合成經典{n % 97}",
+        "byline": "唐 玄奘譯",
+        "creators": "玄奘",
+        "creators_with_id": "玄奘(A001583)",
+        "category": "般若部類",
+        "orig_category": "般若部",
+        "canon": "T",
+        "vol": f"T{n % 55 + 1:02d}",
+        "juan": n % 20 + 1,
+        "time_dynasty": "唐",
+        "time_from": 600 + n % 300,
+        "time_to": 610 + n % 300,
+        "cjk_chars": 5000 + n % 10000,
+        "en_words": 0,
+        "file": f"T{n % 55 + 1:02d}n{n % 2920:04d}",
+        "juan_start": 1,
+        "places": [],
+    }
+
+
+def synthetic_response(path: str, params: Dict[str, str]) -> dict:
+    """依端點產生形狀與真實 API 相符的合成回應。"""
+    n = _seed(path, params)
+    rows = int(params.get("rows", 20) or 20)
+    if path == "/works":
+        results = [_work(n + i) for i in range(1 if "work" in params else 5)]
+        return {"num_found": len(results), "results": results}
+    if path == "/toc":
+        # 12 品分屬 4 卷，每品下有 2 個子節點
+        mulu = [
+            {"title": f"{i} 品", "file": "T01n0001", "juan": i // 3 + 1, "lb": f"{i + 1:04d}a01", "type": "品", "n": i,
+             "isFolder": True, "children": [
+                 {"title": f"{i}.{j} 節", "file": "T01n0001", "juan": i // 3 + 1, "lb": f"{i + 1:04d}{'bc'[j]}01", "type": "節", "n": j}
+                 for j in range(2)
+             ]}
+            for i in range(12)
+        ]
+        juans = [{"file": "T01n0001", "juan": j + 1, "lb": f"{j * 3 + 1:04d}a01"} for j in range(4)]
+        return {"num_found": 1, "results": [{"mulu": mulu, "juan": juans}]}
+    if path == "/juans":
+        html = "".join(
+            f"<span class='lb' id='T01n0001_p{i // 87 + 1:04d}{'abc'[i // 29 % 3]}{i % 29 + 1:02d}'></span>"
+            f"<p>如是我聞一時佛在舍衛國{i}</p>"
+            for i in range(400 + n % 400)
+        )
+        data = {"num_found": 1, "results": [{"juan": int(params.get("juan", 1)), "html": html}]}
+        if params.get("work_info") == "1":
+            data["work_info"] = _work(n)
+        if params.get("toc") == "1":
+            data["toc"] = synthetic_response("/toc", {"work": params.get("work", "")})["results"][0]
+        return data
+    if path == "/juans/goto":
+        return {"url": "/T01n0001_001"}
+    if path == "/lines":
+        # 每頁 3 欄、每欄 29 行的連續行號
+        def index(linehead):
+            file, _, lb = linehead.partition("_p")
+            return file, (int(lb[:4]) - 1) * 87 + "abc".index(lb[4]) * 29 + int(lb[5:]) - 1
+
+        file, first = index(params.get("linehead") or params.get("linehead_start") or "T01n0001_p0001a01")
+        if "linehead_end" in params:
+            last = min(index(params["linehead_end"])[1], first + 2000)
+        else:
+            first, last = max(0, first - int(params.get("before", 0) or 0)), first + int(params.get("after", 0) or 0)
+        results = [
+            {"linehead": f"{file}_p{i // 87 + 1:04d}{'abc'[i // 29 % 3]}{i % 29 + 1:02d}", "html": f"如是我聞{i}", "notes": {}}
+            for i in range(first, last + 1)
+        ]
+        return {"num_found": len(results), "results": results}
+    if path == "/catalog_entry":
+        # 編號含兩個以上「.」的節點列出佛典葉節點（帶 work），其餘列出下層部類；自 root 起約一百個節點
+        q = params.get("q", "root")
+        if q.count(".") >= 2:
+            results = [
+                {"n": f"{q}.{i:03d}", "label": f"T{(n + i) % 2920:04d} 合成經典", "work": f"T{(n + i) % 2920:04d}",
+                 "file": f"T01n{(n + i) % 2920:04d}", "juan_start": 1}
+                for i in range(1, 6)
+            ]
+        else:
+            results = [{"n": f"{q}.{i:03d}", "label": f"{i:02d} 合成部類"} for i in range(1, 11)]
+        return {"num_found": len(results), "results": results}
+    if path == "/search/synonym":
+        return {"time": 0.001, "num_found": 3, "results": ["妙德", "妙首", "妙吉祥"]}
+    if path.startswith("/search/facet"):
+        facet = [{"value": f"v{i}", "count": (n >> i) % 50 + 1} for i in range(5)]
+        if path != "/search/facet":
+            return facet
+        return {k: facet for k in ("canon", "category", "dynasty", "creator", "work")}
+    if path == "/search/sc":
+        return {"q": params.get("q", ""), "hits": n % 200}
+    if path == "/search/kwic":
+        results = [{"vol": "T36", "lb": f"{i + 1:04d}b03", "kwic": f"前文<mark>{params.get('q', '')}</mark>後文"} for i in range(n % 8 + 1)]
+        return {"num_found": len(results), "time": 0.002, "results": results}
+    if path == "/search/notes":
+        docs = [{"note_place": "foot", "content": "合成註解", "highlight": "<mark>法鼓</mark>"} for _ in range(min(rows, 5))]
+        return {"response": {"numFound": len(docs), "start": 0, "docs": docs}}
+    if path == "/search/similar":
+        return {"query_string": params.get("q", ""), "time": 0.1, "num_found": 0, "results": []}
+    if path == "/search/extended":
+        results = [{"title": f"合成經典{i}", "juan": "卷第一", "content": "...法鼓..."} for i in range(min(rows, 10))]
+        return {"total": 100 + n % 500, "results": results}
+    if path.startswith("/search"):
+        num_found = 100 + n % 2000
+        start = int(params.get("start", 0) or 0)
+        results = []
+        for i in range(start, min(start + rows, num_found)):
+            work = _work(n + i)
+            work.update({"id": n + i, "term_hits": (n + i) % 30 + 1})
+            if path == "/search/all_in_one":
+                work["kwics"] = {"num_found": 1, "results": [{"kwic": "擊於大<mark>法鼓</mark>"}]}
+            if path == "/search/title":
+                work.update({"content": work["title"], "highlight": f"<mark>{work['title']}</mark>"})
+            results.append(work)
+        return {"query_string": params.get("q", ""), "num_found": num_found,
+                "total_term_hits": num_found * 2, "results": results}
+    return {"num_found": 0, "results": []}
+
+
+def create_app(store: FixtureStore, injector: FaultInjector, synthetic: bool = True) -> FastAPI:
+    app = FastAPI(title="CBETA API 替身伺服器")
+    counters = {"requests": 0, "recorded": 0, "synthetic": 0, "injected_errors": 0}
+
+    @app.get("/__mock__/stats", include_in_schema=False)
+    async def mock_stats():
+        return {**counters, "fixtures": len(store), "paths": store.paths()}
+
+    @app.get("/{path:path}")
+    async def serve(path: str, request: Request):
+        counters["requests"] += 1
+        path = "/" + path
+        query = request.url.query
+        await injector.delay()
+        if injector.should_fail():
+            counters["injected_errors"] += 1
+            status, content_type, body = injector.error()
+            return Response(body, status_code=status, media_type=content_type)
+        if synthetic and store.lookup(path, query) is None:
+            counters["synthetic"] += 1
+            data = synthetic_response(path, dict(request.query_params))
+            return Response(json.dumps(data, ensure_ascii=False), media_type="application/json")
+        counters["recorded"] += 1
+        status, content_type, body = replay_response(store, path, query)
+        return Response(body, status_code=status, media_type=content_type)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CBETA Online API 本機替身伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--fixtures", default=os.getenv("CBETA_REPLAY_DIR", ""), help="錄製檔目錄")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--no-synthetic", action="store_true", help="未錄製的請求回 404，而非合成資料")
+    args = parser.parse_args()
+
+    import uvicorn
+    store = FixtureStore(args.fixtures or None)
+    injector = FaultInjector(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status)
+    app = create_app(store, injector, synthetic=not args.no_synthetic)
+    print(f"🧪 CBETA 替身伺服器：http://{args.host}:{args.port}（錄製 {len(store)} 筆）")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,94 @@
 import os
+import sys
+import asyncio
+import hmac
+import json
+import time
 import pathlib
+import functools
 import importlib
-from fastapi import FastAPI
+import importlib.util
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Optional
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi_mcp import add_mcp_server
+from mcp.server.fastmcp import Context
+from tools import _metrics as metrics
+from tools._profiler import current_trace, slow_calls, profiler, ProfilerBusyError
+from tools._manifest import LazyTool, load_manifest, fresh_modules
+from tools._querylog import query_log
+
+# 上游 HTTP 连接池配置（所有工具共用同一个长连接客户端）
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "20"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "0") == "1"
+
+# 为 1 时把每次工具调用（参数、状态、耗时、响应）写入查询日志（见 tools/_querylog.py）
+MCP_QUERY_LOG = os.getenv("MCP_QUERY_LOG", "0") == "1"
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+# 可替换底层传输层（如录制/回放）：factory(http2=..., limits=...) 返回 transport 或 None
+_transport_factory = None
+
+def set_transport_factory(factory):
+    global _transport_factory
+    _transport_factory = factory
+
+def _create_http_client() -> httpx.AsyncClient:
+    http2 = UPSTREAM_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        print("⚠️ 未安装 h2，HTTP/2 已停用（pip install httpx[http2]）")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+    )
+    transport = _transport_factory(http2=http2, limits=limits) if _transport_factory else None
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        limits=limits,
+        transport=transport,
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    """返回共用的上游 HTTP 客户端；生命周期外调用时按需创建。"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _create_http_client()
+    return _http_client
+
+# 后台任务（如本地索引定期刷新）：名称 -> 无参数的协程函数，随服务启动，关闭时取消
+background_tasks = {}
+
+def register_background_task(name: str, factory):
+    background_tasks[name] = factory
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _http_client
+    _http_client = _create_http_client()
+    running = [asyncio.ensure_future(factory()) for factory in background_tasks.values()]
+    try:
+        yield
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        await _http_client.aclose()
+        _http_client = None
+        query_log.close()
 
 # 初始化 FastAPI & MCP Server
-app = FastAPI(title="MCP工具聚合服务", version="0.1.0")
+app = FastAPI(title="MCP工具聚合服务", version="0.1.0", lifespan=lifespan)
 BASE_URL = os.getenv("APP_BASE_URL", "http://localhost:8000")
 mcp_server = add_mcp_server(
     app,
@@ -14,28 +97,205 @@ mcp_server = add_mcp_server(
     base_url=BASE_URL,
 )
 
+# 当前工具调用是否使用了过期缓存（上游故障时由访问层标记，每次工具调用开始时重置）
+stale_marker = contextvars.ContextVar("stale_marker", default=None)
+
+def mark_stale(reason: str):
+    stale_marker.set(reason)
+
+# 包装工具注册：记录每次调用的耗时、并发数与回应大小，并由此处负责序列化回应；
+# 超过 SLOW_CALL_THRESHOLD_MS 的调用连同参数与各步骤耗时写入慢调用记录
+_register_tool = mcp_server.tool
+
+def _instrumented_tool(*args, **kwargs):
+    register = _register_tool(*args, **kwargs)
+
+    def decorator(fn):
+        tool_name = kwargs.get("name") or fn.__name__
+        tool_modules[tool_name] = fn.__module__
+
+        @functools.wraps(fn)
+        async def wrapper(*a, **kw):
+            tool_token = metrics.current_tool.set(tool_name)
+            stale_token = stale_marker.set(None)
+            trace = []
+            trace_token = current_trace.set(trace)
+            metrics.tool_in_flight.inc(tool=tool_name)
+            started = time.perf_counter()
+            status = "exception"
+            serialize = 0.0
+            error = ""
+            text = None
+            # MCP Context（工具用來回報進度）不計入記錄的參數
+            arguments = {k: v for k, v in kw.items() if not isinstance(v, Context)}
+            try:
+                result = await fn(*a, **kw)
+                if isinstance(result, dict):
+                    status = result.get("status", "success")
+                    error = result.get("message", "") if status == "error" else ""
+                    # 直接输出紧凑 JSON（不转义中文），避免 MCP 默认 json.dumps 使回应变大
+                    serialize_started = time.perf_counter()
+                    result = text = json.dumps(result, ensure_ascii=False, default=str)
+                    serialize = time.perf_counter() - serialize_started
+                    metrics.tool_serialize.observe(serialize, tool=tool_name)
+                    metrics.tool_response_bytes.observe(len(result.encode("utf-8")), tool=tool_name)
+                else:
+                    status = "success"
+                return result
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.tool_latency.observe(elapsed, tool=tool_name)
+                metrics.tool_requests.inc(tool=tool_name, status=status)
+                metrics.tool_in_flight.dec(tool=tool_name)
+                if slow_calls.should_capture(elapsed):
+                    slow_calls.add(tool_name, arguments, status, elapsed, trace, serialize, error)
+                if MCP_QUERY_LOG:
+                    query_log.log(tool_name, arguments, raw_response=text, status=status,
+                                  duration_ms=round(elapsed * 1000, 1), **({"error": error} if error else {}))
+                current_trace.reset(trace_token)
+                stale_marker.reset(stale_token)
+                metrics.current_tool.reset(tool_token)
+
+        register(wrapper)
+        # 模块内保留原函数，直接以 Python 调用时仍返回 dict
+        fn._is_mcp_tool = True
+        return fn
+
+    return decorator
+
+mcp_server.tool = _instrumented_tool
+
+# 工具名称 -> 所在模块（供生成工具清单）
+tool_modules = {}
+
 # 提供给其他模块引用的 MCP 装饰器
 __mcp_server__ = mcp_server
 
 # 通用响应结构
 def success_response(result: dict):
-    return {"status": "success", "result": result}
+    response = {"status": "success", "result": result}
+    stale_reason = stale_marker.get()
+    if stale_reason:
+        response["stale"] = True
+        response["stale_reason"] = stale_reason
+    return response
 
 def error_response(message: str):
     return {"status": "error", "message": message}
 
+# 各模块注册的运行状态（如缓存命中率），统一通过 /stats 查看
+stats_providers = {}
+
+def register_stats(name: str, provider):
+    stats_providers[name] = provider
+
+# 在 add_mcp_server 之后注册，不会被转换为 MCP 工具
+@app.get("/stats", include_in_schema=False)
+async def get_stats():
+    return {name: provider() for name, provider in stats_providers.items()}
+
+# Prometheus 指标（text exposition 格式）
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# 管理接口（剖析、慢调用查询）：需设置 ADMIN_TOKEN，请求头带 X-Admin-Token 或 Authorization: Bearer
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="管理接口未启用（未设置 ADMIN_TOKEN）")
+    token = request.headers.get("X-Admin-Token", "")
+    authorization = request.headers.get("Authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="管理令牌无效")
+
+@app.post("/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_profile(seconds: float = 10, interval_ms: float = 5, all_threads: bool = False,
+                        include_idle: bool = False):
+    """取样 seconds 秒，返回 collapsed stack 文本（flamegraph.pl / speedscope 可直接读取）。"""
+    try:
+        folded, summary = await profiler.profile(seconds, interval_ms, all_threads, include_idle)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {f"X-Profile-{k.replace('_', '-').title()}": str(v) for k, v in summary.items()}
+    headers["Content-Disposition"] = f'attachment; filename="profile-{int(time.time())}.folded"'
+    return PlainTextResponse(folded, headers=headers)
+
+@app.get("/admin/slow_calls", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_slow_calls(limit: int = 50, tool: str = "", min_ms: float = 0):
+    return {"stats": slow_calls.stats(), "calls": slow_calls.query(limit, tool, min_ms)}
+
+@app.get("/admin/query_log", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def admin_query_log(method: str = "", limit: int = 20):
+    return {"stats": query_log.stats(), "entries": query_log.recent(method or None, limit)}
+
+register_stats("slow_calls", slow_calls.stats)
+register_stats("query_log", query_log.stats)
+
 # 自动递归导入 tools 目录下所有模块
 registered_tool_names = set()  # 记录所有注册的 MCP 工具函数名，用于检测重复
 
+# 默认按工具清单延迟加载（见 tools/_manifest.py）；TOOLS_LAZY=0 时启动即导入全部模块
+TOOLS_LAZY = os.getenv("TOOLS_LAZY", "1") == "1"
+TOOLS_IMPORT_REPORT = os.getenv("TOOLS_IMPORT_REPORT", "0") == "1"
+
+# 各模块加载方式与导入耗时（含首次导入的依赖模块）：
+# eager=启动时导入，lazy=尚未导入，loaded=首次调用时导入，shared=共用模块
+tool_import_report = {}
+
+def _import_module_timed(module_path: str, mode: str):
+    started = time.perf_counter()
+    mod = importlib.import_module(module_path)
+    tool_import_report[module_path] = {
+        "mode": mode,
+        "import_ms": round((time.perf_counter() - started) * 1000, 1),
+        "tools": sorted(name for name, module in tool_modules.items() if module == module_path),
+    }
+    return mod
+
+def load_tool_module(module_path: str):
+    """延迟加载的工具首次被调用时导入其模块。"""
+    if module_path in sys.modules:  # 并发的首次调用已导入
+        return
+    _import_module_timed(module_path, "loaded")
+    print(f"🧩 延迟加载工具模块: {module_path}（{tool_import_report[module_path]['import_ms']} ms）")
+
 def recursive_import_tools(base_dir="tools"):
+    manifest = load_manifest() if TOOLS_LAZY else None
+    lazy_modules = fresh_modules(manifest) if manifest else {}
     base_path = pathlib.Path(base_dir)
-    for path in base_path.rglob("*.py"):
-        if path.name.startswith("_"):  # 忽略 __init__.py 和 _xxx.py
+    for path in sorted(base_path.rglob("*.py")):
+        if path.name == "__init__.py":
             continue
         module_parts = path.with_suffix("").parts
         module_path = ".".join(module_parts)
+        if path.name.startswith("_"):
+            # 延迟加载时仍先导入共用模块（_xxx.py）：其中会设置上游传输层、注册 /stats 等
+            if lazy_modules:
+                try:
+                    _import_module_timed(module_path, "shared")
+                except Exception as e:
+                    print(f"❌ 模块导入失败: {module_path}，错误：{e}")
+            continue
+        if module_path in lazy_modules:
+            entries = lazy_modules[module_path]
+            for entry in entries:
+                if entry["name"] in registered_tool_names:
+                    print(f"⚠️ MCP工具函数重复注册: `{entry['name']}` 来源模块: {module_path}")
+                    continue
+                registered_tool_names.add(entry["name"])
+                tool_modules[entry["name"]] = module_path
+                mcp_server._tool_manager._tools[entry["name"]] = LazyTool(entry, mcp_server._tool_manager, load_tool_module)
+            tool_import_report[module_path] = {"mode": "lazy", "import_ms": None, "tools": sorted(e["name"] for e in entries)}
+            continue
         try:
-            mod = importlib.import_module(module_path)
+            mod = _import_module_timed(module_path, "eager")
             for attr_name in dir(mod):
                 attr = getattr(mod, attr_name)
                 if callable(attr) and getattr(attr, "_is_mcp_tool", False):
@@ -46,8 +306,31 @@ def recursive_import_tools(base_dir="tools"):
         except Exception as e:
             print(f"❌ 模块导入失败: {module_path}，错误：{e}")
 
+def tool_loading_stats():
+    modes = {}
+    for info in tool_import_report.values():
+        modes[info["mode"]] = modes.get(info["mode"], 0) + 1
+    return {
+        "lazy_enabled": TOOLS_LAZY,
+        "tools": len(tool_modules),
+        "modules_by_mode": modes,
+        "import_ms_total": round(sum(info["import_ms"] or 0 for info in tool_import_report.values()), 1),
+        "modules": tool_import_report,
+    }
+
+register_stats("tool_loading", tool_loading_stats)
+
 # 自动导入所有工具模块
+_import_started = time.perf_counter()
 recursive_import_tools()
+_loading = tool_loading_stats()
+print(
+    f"🧩 工具加载完成：{_loading['tools']} 个工具，模块 {_loading['modules_by_mode']}，"
+    f"导入 {_loading['import_ms_total']} ms，总计 {(time.perf_counter() - _import_started) * 1000:.1f} ms"
+)
+if TOOLS_IMPORT_REPORT:
+    for _module, _info in sorted(tool_import_report.items(), key=lambda item: -(item[1]["import_ms"] or 0)):
+        print(f"   {_info['mode']:<7} {_info['import_ms'] if _info['import_ms'] is not None else '-':>8} ms  {_module}")
 
 # 启动服务
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from tools.cebta._mirror import MirrorStore, parse_juan_html
+from tools.cebta._ngram import (
+    NgramIndex, _put, build_index, decode_postings, encode_positions, evaluate, normalize, parse_query,
+)
+
+# 本機全文 n-gram 索引（_ngram）：位置清單壓縮、查詢語法與求值
+#   python -m unittest discover -s tests -t .
+
+JUANS = {
+    ("T0001", 1): "如是我聞。一時佛在舍衛國，祇樹給孤獨園。",
+    ("T0001", 2): "佛告比丘：諸法無我。<span class='doube-line-note'>此云法鼓</span>擊大法鼓。",
+    ("T0002", 1): "迦葉白佛言：如是如是。迦葉佛時，法鼓常鳴。",
+    ("T0003", 1): "般若波羅蜜多心經。觀自在菩薩行深般若波羅密多時。",
+}
+
+
+def _blob(docs):
+    """依 build_index 的格式組出一段位置清單：{文件: [位置, ...]}。"""
+    out, last = bytearray(), -1
+    for doc, positions in sorted(docs.items()):
+        packed = encode_positions(positions)
+        _put(out, doc - last)
+        _put(out, len(positions))
+        _put(out, len(packed))
+        out += packed
+        last = doc
+    return bytes(out)
+
+
+class PostingsTest(unittest.TestCase):
+    def test_round_trip(self):
+        docs = {0: [0, 5, 130, 131, 20000], 3: [7], 200: list(range(0, 3000, 3))}
+        self.assertEqual(decode_postings([_blob(docs)]), docs)
+
+    def test_filter_docs(self):
+        docs = {0: [1, 2], 1: [300], 9: [4, 40000]}
+        self.assertEqual(decode_postings([_blob(docs)], {1, 9}), {1: [300], 9: [4, 40000]})
+        self.assertEqual(decode_postings([_blob(docs)], set()), {})
+
+    def test_segments(self):
+        first, second = {0: [1], 2: [5, 6]}, {5: [0], 6: [128, 16384]}
+        self.assertEqual(decode_postings([_blob(first), _blob(second)]), {**first, **second})
+
+
+class QueryTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_query('"法鼓" "聖嚴"'), ("and", [("term", "法鼓"), ("term", "聖嚴")]))
+        self.assertEqual(parse_query('"波羅蜜" | "波羅密"'), ("or", [("term", "波羅蜜"), ("term", "波羅密")]))
+        self.assertEqual(parse_query('"迦葉" !"迦葉佛"'), ("and", [("term", "迦葉"), ("not", ("term", "迦葉佛"))]))
+        self.assertEqual(parse_query('法鼓 NEAR/7 迦葉'), ("near", ("term", "法鼓"), ("term", "迦葉"), 7))
+
+    def test_parse_errors(self):
+        for query in ("", '("法鼓"', '!"法鼓"', '"法鼓" | !"迦葉"', '!"法鼓" !"迦葉"'):
+            with self.assertRaises(ValueError, msg=query):
+                parse_query(query)
+
+    def test_evaluate_near(self):
+        hits = {"甲": {0: [(0, 1), (50, 1)]}, "乙": {0: [(5, 1), (90, 1)], 1: [(0, 1)]}}
+        phrase = lambda term, docs: {d: h for d, h in hits[term].items() if docs is None or d in docs}
+        self.assertEqual(evaluate(parse_query("甲 NEAR/4 乙"), phrase), {0: [(0, 1), (5, 1)]})
+        self.assertEqual(evaluate(parse_query("甲 NEAR/3 乙"), phrase), {})
+
+
+class IndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        store = MirrorStore(os.path.join(cls.tmp.name, "mirror"))
+        for (work, juan), html in JUANS.items():
+            store.save(work, juan, parse_juan_html(html))
+        cls.db = os.path.join(cls.tmp.name, "fulltext.sqlite3")
+        build_index(MirrorStore(store.root, cache_juans=0), cls.db, flush=8)  # 小 flush 以產生多段
+        cls.index = NgramIndex(cls.db)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.index.close()
+        cls.tmp.cleanup()
+
+    def docs(self, query, note=True):
+        found = self.index.search(query, note=note)
+        return {(self.index.works[doc], self.index.juans[doc]) for doc in found}
+
+    def test_segments_written(self):
+        self.assertGreater(self.index.meta["segments"], 1)
+
+    def test_phrase(self):
+        found = self.index.search("如是")
+        doc = self.index.doc_id("T0002", 1)
+        text, _ = normalize(JUANS[("T0002", 1)])
+        self.assertEqual([text[s:s + n] for s, n in found[doc]], [normalize("如是")[0]] * 2)
+        self.assertEqual(self.docs("如是"), {("T0001", 1), ("T0002", 1)})
+        self.assertEqual(self.docs("舍衛國祇樹"), {("T0001", 1)})  # 標點不影響比對
+        self.assertEqual(self.docs("不存在的詞"), set())
+
+    def test_single_char(self):
+        self.assertEqual(self.docs("鳴"), {("T0002", 1)})
+        self.assertEqual(self.docs("佛"), {("T0001", 1), ("T0001", 2), ("T0002", 1)})
+
+    def test_fold(self):
+        self.assertEqual(self.docs("舍卫国"), self.docs("舍衛國"))
+
+    def test_and_or_not(self):
+        self.assertEqual(self.docs('"法鼓" "迦葉"'), {("T0002", 1)})
+        self.assertEqual(self.docs('"波羅蜜" | "波羅密"'), {("T0003", 1)})
+        self.assertEqual(self.docs('"法鼓" !"迦葉"'), {("T0001", 2)})
+        self.assertEqual(self.docs('("如是" | "般若") !"舍衛"'), {("T0002", 1), ("T0003", 1)})
+
+    def test_near(self):
+        self.assertEqual(self.docs('"迦葉" NEAR/3 "法鼓"'), {("T0002", 1)})
+        self.assertEqual(self.docs('"迦葉" NEAR/1 "法鼓"'), set())
+
+    def test_note(self):
+        doc = self.index.doc_id("T0001", 2)
+        self.assertEqual(len(self.index.search("法鼓")[doc]), 2)
+        self.assertEqual(len(self.index.search("法鼓", note=False)[doc]), 1)
+        self.assertEqual(self.docs("此云", note=False), set())
+
+    def test_fold_mode_mismatch(self):
+        path = os.path.join(self.tmp.name, "other.sqlite3")
+        with open(self.db, "rb") as src, open(path, "wb") as dst:
+            dst.write(src.read())
+        db = sqlite3.connect(path)
+        db.execute("UPDATE meta SET value = ? WHERE key = 'fold'", (json.dumps({"mode": "other", "version": ""}),))
+        db.commit()
+        db.close()
+        with self.assertRaises(ValueError):
+            NgramIndex(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+from mcp.server.fastmcp.tools import Tool
+from mcp.server.fastmcp.utilities.func_metadata import func_metadata
+from pydantic import Field, PrivateAttr
+
+# 工具清單（manifest）與延遲載入
+#
+# 清單記錄每個 MCP 工具的名稱、說明、參數 JSON Schema 與所在模組，並附上模組原始碼雜湊。
+# 啟動時依清單註冊 LazyTool 佔位（mcp Tool 子類別）：列出工具不需匯入實作，第一次呼叫時才匯入模組並改用真正的工具。
+# 原始碼雜湊與清單不符（或新增的模組）時，該模組照常於啟動時匯入，清單過期不影響正確性。
+#
+# 產生清單：
+#     python -m tools._manifest            # 寫入 tools_manifest.json（可用 TOOLS_MANIFEST 指定路徑）
+
+MANIFEST_PATH = os.getenv("TOOLS_MANIFEST", "tools_manifest.json")
+MANIFEST_VERSION = 1
+
+
+def module_file(module: str) -> str:
+    return module.replace(".", os.sep) + ".py"
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[Dict[str, Any]]:
+    """讀取清單；不存在或格式不符時回傳 None。"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 工具清單讀取失敗：{path}，錯誤：{e}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def fresh_modules(manifest: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """回傳原始碼雜湊與清單一致的模組及其工具：{模組: [工具項目, ...]}。"""
+    tools_by_module: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in manifest.get("tools", []):
+        tools_by_module.setdefault(entry["module"], []).append(entry)
+    fresh = {}
+    for module, digest in manifest.get("modules", {}).items():
+        path = module_file(module)
+        if os.path.exists(path) and file_hash(path) == digest:
+            fresh[module] = tools_by_module.get(module, [])
+    return fresh
+
+
+async def _not_loaded(**kwargs):
+    raise RuntimeError("工具模組尚未載入")
+
+
+class LazyTool(Tool):
+    """
+    延遲載入的工具佔位：mcp 的 Tool 子類別，名稱、說明與參數 schema 取自清單，列出工具時與真正的工具相同。
+
+    第一次 run 時移除佔位並匯入模組（模組內的 @__mcp_server__.tool() 會註冊真正的工具），
+    再把呼叫（含 context、convert_result 等參數）原樣轉給真正的工具；之後的呼叫由 ToolManager 直接取得真正的工具。
+    """
+
+    module: str = Field(exclude=True)
+    _tool_manager: Any = PrivateAttr()
+    _load_module: Callable[[str], None] = PrivateAttr()
+
+    def __init__(self, entry: Dict[str, Any], tool_manager, load_module: Callable[[str], None]):
+        super().__init__(
+            fn=_not_loaded,
+            name=entry["name"],
+            description=entry["description"],
+            parameters=entry["parameters"],
+            fn_metadata=func_metadata(_not_loaded),
+            is_async=True,
+            module=entry["module"],
+        )
+        self._tool_manager = tool_manager
+        self._load_module = load_module
+
+    async def run(self, arguments: Dict[str, Any], context=None, **kwargs) -> Any:
+        tools = self._tool_manager._tools
+        # 同模組的其他佔位一併移除，讓匯入時的註冊不被佔位擋下
+        placeholders = {
+            name: tool for name, tool in tools.items()
+            if isinstance(tool, LazyTool) and tool.module == self.module
+        }
+        for name in placeholders:
+            del tools[name]
+        try:
+            self._load_module(self.module)
+        except Exception:
+            tools.update(placeholders)
+            raise
+        # 匯入後仍未註冊的工具保留佔位，避免從清單中消失
+        for name, tool in placeholders.items():
+            tools.setdefault(name, tool)
+        real = tools.get(self.name)
+        if real is None or real is self:
+            raise RuntimeError(f"模組 {self.module} 匯入後未註冊工具 {self.name}，請重新產生工具清單")
+        return await real.run(arguments, context=context, **kwargs)
+
+
+def build_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    """以完整匯入模式載入主程序，收集所有工具資訊後寫入清單。"""
+    os.environ["TOOLS_LAZY"] = "0"
+    started = time.perf_counter()
+    import main
+
+    tools = []
+    for tool in main.mcp_server._tool_manager.list_tools():
+        module = main.tool_modules.get(tool.name)
+        if module is None:
+            continue
+        tools.append({
+            "name": tool.name,
+            "module": module,
+            "description": tool.description,
+            "parameters": tool.parameters,
+        })
+    modules = {module: file_hash(module_file(module)) for module in sorted(main.tool_import_report)}
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "generated_at": int(time.time()),
+        "modules": modules,
+        "tools": sorted(tools, key=lambda t: t["name"]),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ 工具清單已寫入 {path}：{len(tools)} 個工具、{len(modules)} 個模組（{time.perf_counter() - started:.2f}s）")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="產生 MCP 工具清單")
+    parser.add_argument("--output", default=MANIFEST_PATH)
+    args = parser.parse_args()
+    sys.path.insert(0, os.getcwd())
+    build_manifest(args.output)
@@ -0,0 +1,177 @@
+import bisect
+import contextvars
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# 輕量 Prometheus 指標（不依賴 prometheus_client）
+#
+# 提供 Counter / Gauge / Histogram 三種型別與 text exposition 格式輸出（/metrics）。
+# 另可註冊 collector 回呼，在抓取時才讀取其他模組的計數（如快取命中數）。
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# 目前正在執行的 MCP 工具名稱（由主程序的工具包裝設定，供上游指標標註來源工具）
+current_tool = contextvars.ContextVar("current_tool", default="")
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """collector 回傳完整的 exposition 行（含 HELP/TYPE），於每次抓取時呼叫。"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f"# collector error: {_escape(str(e))}")
+        return "\n".join(lines) + "\n"
+
+
+def counter_family(name: str, documentation: str, label: str, values: Dict[str, float],
+                   kind: str = "counter") -> List[str]:
+    """把 {標籤值: 數值} 的字典轉為一組 exposition 行，供 collector 使用。"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{{{label}="{_escape(key)}"}} {_number(value)}')
+    return lines
+
+
+registry = Registry()
+
+# ---------- 工具層 ----------
+tool_requests = registry.counter("mcp_tool_requests_total", "MCP 工具呼叫次數", ("tool", "status"))
+tool_in_flight = registry.gauge("mcp_tool_in_flight", "執行中的 MCP 工具呼叫數", ("tool",))
+tool_latency = registry.histogram("mcp_tool_duration_seconds", "MCP 工具總耗時", ("tool",))
+tool_serialize = registry.histogram("mcp_tool_serialize_seconds", "工具回應序列化耗時", ("tool",))
+tool_response_bytes = registry.histogram("mcp_tool_response_bytes", "工具回應大小（位元組）", ("tool",), BYTES_BUCKETS)
+
+# ---------- 上游層 ----------
+upstream_requests = registry.counter("cbeta_upstream_requests_total", "CBETA 上游請求數（含重試）", ("endpoint", "status"))
+upstream_in_flight = registry.gauge("cbeta_upstream_in_flight", "進行中的 CBETA 上游請求數", ("endpoint",))
+upstream_wait = registry.histogram("cbeta_upstream_wait_seconds", "等待 CBETA 上游回應的耗時（含重試與限流排隊）", ("tool", "endpoint"))
+upstream_decode = registry.histogram("cbeta_upstream_decode_seconds", "上游回應 JSON 解析耗時", ("tool", "endpoint"))
+upstream_response_bytes = registry.histogram("cbeta_upstream_response_bytes", "上游回應大小（位元組）", ("endpoint",), BYTES_BUCKETS)
@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import contextvars
+import itertools
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# 診斷工具：取樣式剖析器與慢呼叫紀錄
+#
+# - SamplingProfiler：在獨立執行緒中定期讀取事件迴圈執行緒的呼叫堆疊（sys._current_frames），
+#   輸出 collapsed stack 格式（flamegraph.pl / speedscope 可直接讀取），不需 hook 每次函式呼叫，開銷低
+# - SlowCallLog：工具呼叫耗時超過門檻時，連同參數與各步驟耗時寫入固定大小的環形緩衝區
+#
+# 各步驟耗時透過 current_trace 收集：主程序的工具包裝在每次呼叫開始時放入新串列，
+# 存取層（如 cbeta_get）以 trace_event() 追加事件並就地補上耗時等欄位。
+
+SLOW_CALL_THRESHOLD_MS = float(os.getenv("SLOW_CALL_THRESHOLD_MS", "2000"))  # 0 表示停用
+SLOW_CALL_BUFFER_SIZE = int(os.getenv("SLOW_CALL_BUFFER_SIZE", "200"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+# 目前工具呼叫的步驟事件串列；不在工具呼叫中時為 None
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 事件迴圈閒置（等待 I/O）時堆疊頂端的函式
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "run_forever", "run_until_complete"}
+
+
+def trace_event(step: str, **fields) -> Dict[str, Any]:
+    """新增一筆步驟事件並回傳之，呼叫端可於步驟結束後就地補上欄位。"""
+    event = {"step": step, **fields}
+    trace = current_trace.get()
+    if trace is not None:
+        trace.append(event)
+    return event
+
+
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, "dict"):
+        return value.dict()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class SlowCallLog:
+    def __init__(self, threshold_ms: float = SLOW_CALL_THRESHOLD_MS, size: int = SLOW_CALL_BUFFER_SIZE):
+        self.threshold_ms = threshold_ms
+        self._records = collections.deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self.counters = {"captured": 0}
+
+    def should_capture(self, duration: float) -> bool:
+        return self.threshold_ms > 0 and duration * 1000 >= self.threshold_ms
+
+    def add(self, tool: str, arguments: Dict[str, Any], status: str, duration: float,
+            trace: Optional[List[Dict[str, Any]]] = None, serialize: float = 0.0, error: str = ""):
+        record = {
+            "id": next(self._ids),
+            "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "tool": tool,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "serialize_ms": round(serialize * 1000, 2),
+            "arguments": _jsonable(arguments),
+            "steps": list(trace or []),
+        }
+        if error:
+            record["error"] = error
+        self._records.append(record)
+        self.counters["captured"] += 1
+
+    def query(self, limit: int = 50, tool: str = "", min_ms: float = 0) -> List[Dict[str, Any]]:
+        """由新到舊回傳符合條件的紀錄。"""
+        matched = [
+            r for r in reversed(self._records)
+            if (not tool or r["tool"] == tool) and r["duration_ms"] >= min_ms
+        ]
+        return matched[:limit]
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "buffered": len(self._records),
+            "capacity": self._records.maxlen,
+            "threshold_ms": self.threshold_ms,
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    else:
+        filename = "/".join(filename.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class ProfilerBusyError(RuntimeError):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._running = False
+        self.counters = {"sessions": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _sample(self, thread_ids: Optional[set], seconds: float, interval: float,
+                include_idle: bool) -> Tuple[collections.Counter, int]:
+        stacks = collections.Counter()
+        sampler_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id or (thread_ids is not None and thread_id not in thread_ids):
+                    continue
+                if not include_idle and frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                stack = _stack(frame)
+                if thread_ids is None:
+                    stack = (f"thread {names.get(thread_id, thread_id)}",) + stack
+                stacks[stack] += 1
+            samples += 1
+            time.sleep(interval)
+        return stacks, samples
+
+    async def profile(self, seconds: float, interval_ms: float = 5.0, all_threads: bool = False,
+                      include_idle: bool = False) -> Tuple[str, Dict[str, Any]]:
+        """
+        取樣 seconds 秒，回傳 (collapsed stack 文字, 摘要)。
+
+        預設只取樣事件迴圈所在執行緒，並略過閒置（等待 I/O）的樣本；同一時間只允許一個剖析工作。
+        """
+        if self._running:
+            raise ProfilerBusyError("已有剖析工作進行中")
+        seconds = max(0.1, min(seconds, PROFILE_MAX_SECONDS))
+        interval = max(0.001, interval_ms / 1000)
+        thread_ids = None if all_threads else {threading.get_ident()}
+        self._running = True
+        self.counters["sessions"] += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def deliver(result, error):
+            # 取樣執行緒結束才解除佔用；請求取消時執行緒仍會取樣到期滿，期間不得再開新的剖析
+            self._running = False
+            if future.done():  # 請求已取消
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        def run():
+            try:
+                result = self._sample(thread_ids, seconds, interval, include_idle)
+            except Exception as e:
+                loop.call_soon_threadsafe(deliver, None, e)
+            else:
+                loop.call_soon_threadsafe(deliver, result, None)
+
+        # 使用專屬執行緒，不佔用預設執行緒池（SQLite 快取等共用）
+        try:
+            threading.Thread(target=run, name="sampling-profiler", daemon=True).start()
+        except BaseException:
+            self._running = False
+            raise
+        stacks, samples = await future
+        folded = "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common())
+        summary = {
+            "seconds": seconds,
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "stacks": len(stacks),
+            "busy_samples": sum(stacks.values()),
+        }
+        return folded + "\n" if folded else "", summary
+
+
+slow_calls = SlowCallLog()
+profiler = SamplingProfiler()
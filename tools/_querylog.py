@@ -0,0 +1,252 @@
+import atexit
+import collections
+import glob
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# 查詢／回應日誌
+#
+# 取代逐次讀寫整個 JSON 檔的 add_to_cache：
+# - log() 只把紀錄放進佇列即返回，不在請求路徑上做序列化或檔案 I/O
+# - 背景執行緒批次寫入 JSON Lines（NDJSON），依大小與時間輪替，可選 gzip 壓縮，保留固定數量舊檔
+# - 佇列滿時丟棄新紀錄並計數，不會阻塞請求
+# - 保留各 method 最近幾筆紀錄的記憶體檢視（recent()）
+#
+# 主程序在 MCP_QUERY_LOG=1 時自動記錄每次工具呼叫；工具也可自行呼叫 add_to_cache() / query_log.log()。
+
+LOG_FILE = os.getenv("MCP_LOG_FILE", "logs/mcp_query_log.ndjson")
+LOG_MAX_BYTES = int(os.getenv("MCP_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_ROTATE_SECONDS = float(os.getenv("MCP_LOG_ROTATE_SECONDS", "86400"))
+LOG_BACKUPS = int(os.getenv("MCP_LOG_BACKUPS", "10"))
+LOG_COMPRESS = os.getenv("MCP_LOG_COMPRESS", "1") == "1"
+LOG_BATCH_SIZE = int(os.getenv("MCP_LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.getenv("MCP_LOG_FLUSH_INTERVAL", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("MCP_LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_RESPONSE_BYTES = int(os.getenv("MCP_LOG_MAX_RESPONSE_BYTES", str(64 * 1024)))
+RECENT_PER_METHOD = int(os.getenv("MCP_LOG_RECENT", "20"))
+
+_STOP = object()
+
+
+def _default(value: Any) -> Any:
+    # pydantic 參數模型在背景執行緒才轉為 dict，請求路徑不做轉換
+    if hasattr(value, "dict"):
+        return value.dict()
+    return str(value)
+
+
+def _encode(entry: Dict[str, Any]) -> str:
+    """序列化一筆紀錄；raw_response 為已序列化的 JSON 字串，直接嵌入不再重複編碼。"""
+    raw = entry.pop("raw_response", None)
+    line = json.dumps(entry, ensure_ascii=False, default=_default)
+    if raw is not None:
+        line = line[:-1] + ', "response": ' + raw + "}"
+    return line + "\n"
+
+
+class QueryLog:
+    def __init__(self, path: str = LOG_FILE, max_bytes: int = LOG_MAX_BYTES,
+                 rotate_seconds: float = LOG_ROTATE_SECONDS, backups: int = LOG_BACKUPS,
+                 compress: bool = LOG_COMPRESS, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, queue_size: int = LOG_QUEUE_SIZE,
+                 max_response_bytes: int = LOG_MAX_RESPONSE_BYTES, recent_per_method: int = RECENT_PER_METHOD):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_response_bytes = max_response_bytes
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._recent: Dict[str, collections.deque] = collections.defaultdict(
+            lambda: collections.deque(maxlen=recent_per_method)
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+        self.counters = {"logged": 0, "written": 0, "dropped": 0, "batches": 0, "rotations": 0, "write_errors": 0}
+
+    # ---------- 請求路徑 ----------
+
+    def log(self, method: str, request: Any, response: Any = None, *, raw_response: Optional[str] = None,
+            **fields):
+        """
+        記錄一筆查詢；不阻塞。response 為可序列化物件，或以 raw_response 傳入已序列化的 JSON 字串。
+
+        回應超過 MCP_LOG_MAX_RESPONSE_BYTES 時只保留前段文字，並標記 response_truncated。
+        """
+        entry = {"timestamp": round(time.time(), 3), "method": method, "request": request, **fields}
+        if raw_response is not None and len(raw_response) > self.max_response_bytes:
+            entry["response"] = raw_response[:self.max_response_bytes]
+            entry["response_truncated"] = True
+        elif raw_response is not None:
+            entry["raw_response"] = raw_response
+        else:
+            entry["response"] = response
+        self._recent[method].append(entry)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(entry)
+            self.counters["logged"] += 1
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def recent(self, method: Optional[str] = None, limit: int = RECENT_PER_METHOD) -> List[Dict[str, Any]]:
+        """由新到舊回傳最近的紀錄；未指定 method 時合併所有 method。"""
+        if method:
+            entries = list(self._recent.get(method, ()))
+        else:
+            entries = [e for items in list(self._recent.values()) for e in items]
+        entries.reverse()
+        entries.sort(key=lambda e: e["timestamp"], reverse=True)
+        return [self._view(e) for e in entries[:limit]]
+
+    @staticmethod
+    def _view(entry: Dict[str, Any]) -> Dict[str, Any]:
+        view = {k: v for k, v in entry.items() if k != "raw_response"}
+        if "raw_response" in entry:
+            try:
+                view["response"] = json.loads(entry["raw_response"])
+            except ValueError:
+                view["response"] = entry["raw_response"]
+        return view
+
+    # ---------- 背景寫入 ----------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if stopping:
+                # 關閉前把佇列中剩餘的紀錄一併寫出
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+            if batch:
+                self._write(batch)
+        self._close_file()
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        try:
+            lines = []
+            for entry in batch:
+                lines.append(_encode(dict(entry)))
+            data = "".join(lines)
+            self._maybe_rotate(len(data.encode("utf-8")))
+            if self._file is None:
+                self._open_file()
+            self._file.write(data)
+            self._file.flush()
+            self.counters["written"] += len(batch)
+            self.counters["batches"] += 1
+        except Exception as e:
+            self.counters["write_errors"] += 1
+            print(f"⚠️ 查詢日誌寫入失敗：{e}")
+
+    def _open_file(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _maybe_rotate(self, incoming: int):
+        if not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        if size == 0:
+            return
+        too_big = self.max_bytes > 0 and size + incoming > self.max_bytes
+        too_old = self.rotate_seconds > 0 and self._file is not None and time.time() - self._opened_at >= self.rotate_seconds
+        if too_big or too_old:
+            self.rotate()
+
+    def rotate(self):
+        """把目前的日誌檔改名為帶時間戳記的舊檔（可選 gzip），並清除超出保留數量的舊檔。"""
+        self._close_file()
+        if not os.path.exists(self.path):
+            return
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{base}.{time.strftime('%Y%m%d-%H%M%S')}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        self.counters["rotations"] += 1
+        if self.backups > 0:
+            old = sorted(glob.glob(f"{glob.escape(base)}.*{ext}") + glob.glob(f"{glob.escape(base)}.*{ext}.gz"),
+                         key=os.path.getmtime)
+            for path in old[:-self.backups]:
+                os.remove(path)
+
+    def close(self, timeout: float = 5.0):
+        """寫出佇列中剩餘的紀錄並停止背景執行緒。"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "pending": self._queue.qsize(),
+            "file": self.path,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+query_log = QueryLog()
+atexit.register(query_log.close)
+
+
+def add_to_cache(method: str, request: dict, response: dict):
+    """相容舊版開發說明中的 add_to_cache：改為非阻塞寫入查詢日誌。"""
+    query_log.log(method, request, response)
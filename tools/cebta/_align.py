@@ -0,0 +1,117 @@
+import importlib.util
+from typing import List, Tuple
+
+# Smith-Waterman 局部比對（相似搜尋用，純函式，可在子行程中執行）
+#
+# 計分：相同字 +gain，不同字與插入、刪除皆為 penalty（負數，線性空位罰分），分數不低於 0。
+#
+# score_windows()：一個查詢句對多個候選視窗，只求各視窗的最高分與其結束位置。
+# 有 numpy 時把視窗補齊成矩陣一次計算：逐一處理查詢句的每個字（一列），
+# 同列的水平相依 H[j] = max(E[j], max_{k<j} E[k] + (j-k)·penalty) 以前綴最大值（np.maximum.accumulate）求得，
+# 一列內所有視窗、所有位置都是向量運算；查詢句只有數十字，整批只需數十次陣列運算。
+# 沒有安裝 numpy 時退回逐格計算的純 Python 版本，結果相同。
+#
+# align()：單一視窗的完整比對（含回溯），供高分結果求出起點。
+
+_np = None
+if importlib.util.find_spec("numpy") is not None:
+    try:
+        import numpy as _np
+    except Exception as e:
+        print(f"⚠️ numpy 載入失敗，相似比對改用純 Python：{e}")
+        _np = None
+
+Score = Tuple[int, int, int]  # (最高分, 查詢句結束位置, 視窗結束位置)，結束位置不含
+
+
+def _codes(text: str, width: int):
+    codes = _np.zeros(width, dtype=_np.int64)
+    codes[:len(text)] = _np.frombuffer(text.encode("utf-32-le"), dtype=_np.uint32)
+    return codes
+
+
+def _score_numpy(query: str, windows: List[str], gain: int, penalty: int) -> List[Score]:
+    width = max(len(w) for w in windows) + 1
+    # 補位字元為 0，與任何查詢字都不相同，只會降低分數
+    text = _np.stack([_codes(w, width) for w in windows])
+    columns = _np.arange(width, dtype=_np.int64)
+    previous = _np.zeros(text.shape, dtype=_np.int64)
+    best = _np.zeros(len(windows), dtype=_np.int64)
+    best_i = _np.zeros(len(windows), dtype=_np.int64)
+    best_j = _np.zeros(len(windows), dtype=_np.int64)
+    rows = _np.arange(len(windows))
+    for i, ch in enumerate(query, 1):
+        match = _np.where(text == ord(ch), gain, penalty)
+        diagonal = _np.zeros(text.shape, dtype=_np.int64)
+        diagonal[:, 1:] = previous[:, :-1]
+        # 對角線與上方，再以前綴最大值處理同列左方的空位
+        current = _np.maximum(_np.maximum(diagonal + match, previous + penalty), 0)
+        shifted = current - columns * penalty
+        current = _np.maximum(current, _np.maximum.accumulate(shifted, axis=1) + columns * penalty)
+        j = current.argmax(axis=1)
+        row_best = current[rows, j]
+        better = row_best > best
+        best = _np.where(better, row_best, best)
+        best_i = _np.where(better, i, best_i)
+        best_j = _np.where(better, j + 1, best_j)
+        previous = current
+    return [(int(s), int(i), int(j)) for s, i, j in zip(best, best_i, best_j)]
+
+
+def _matrix(query: str, window: str, gain: int, penalty: int) -> List[List[int]]:
+    """DP 矩陣 H[i][j]（i、j 由 1 起算，第 0 列與第 0 行為 0）。"""
+    previous = [0] * (len(window) + 1)
+    matrix = [previous]
+    for ch in query:
+        current = [0]
+        for j, other in enumerate(window, 1):
+            current.append(max(0, previous[j - 1] + (gain if ch == other else penalty),
+                               previous[j] + penalty, current[j - 1] + penalty))
+        matrix.append(current)
+        previous = current
+    return matrix
+
+
+def _score_python(query: str, windows: List[str], gain: int, penalty: int) -> List[Score]:
+    scores = []
+    for window in windows:
+        best = (0, 0, 0)
+        for i, row in enumerate(_matrix(query, window, gain, penalty)):
+            j = max(range(len(row)), key=row.__getitem__)
+            if row[j] > best[0]:
+                best = (row[j], i, j)
+        scores.append(best)
+    return scores
+
+
+def score_windows(query: str, windows: List[str], gain: int = 2, penalty: int = -1) -> List[Score]:
+    """各視窗的 (最高分, 查詢句結束位置, 視窗結束位置)。"""
+    if not windows or not query:
+        return [(0, 0, 0) for _ in windows]
+    if _np is not None:
+        return _score_numpy(query, windows, gain, penalty)
+    return _score_python(query, windows, gain, penalty)
+
+
+def align(query: str, window: str, gain: int = 2, penalty: int = -1) -> Tuple[int, int, int, int, int]:
+    """完整比對，回傳 (分數, 查詢句起, 查詢句迄, 視窗起, 視窗迄)，迄位置不含。"""
+    matrix = _matrix(query, window, gain, penalty)
+    score, i, j = 0, 0, 0
+    for r, row in enumerate(matrix):
+        for c, value in enumerate(row):
+            if value > score:
+                score, i, j = value, r, c
+    end_i, end_j = i, j
+    while i > 0 and j > 0 and matrix[i][j] > 0:
+        value = matrix[i][j]
+        if value == matrix[i - 1][j - 1] + (gain if query[i - 1] == window[j - 1] else penalty):
+            i, j = i - 1, j - 1
+        elif value == matrix[i - 1][j] + penalty:
+            i -= 1
+        else:
+            j -= 1
+    return score, i, end_i, j, end_j
+
+
+def has_numpy() -> bool:
+    return _np is not None
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+import httpx
+from main import get_http_client, register_stats, mark_stale, set_transport_factory
+from tools.cebta._cache import response_cache, cache_key, ttl_for
+from tools.cebta._singleflight import SingleFlight
+from tools.cebta._limiter import upstream_limiter, backoff_delay, MAX_RETRIES, RETRYABLE_STATUS
+from tools.cebta._breaker import breakers, CircuitOpenError, is_upstream_failure, CLOSED, HALF_OPEN
+from tools.cebta._replay import build_transport
+from tools import _metrics as metrics
+from tools._profiler import trace_event
+
+# CBETA Online API 共用請求入口
+#
+# 所有 CBETA 工具都應透過 cbeta_get() 取得上游資料，而不是直接呼叫 httpx：
+# - 使用主程序共用的連線池客戶端，上游位址由 CBETA_API_BASE 設定（可指向本機替身伺服器）
+# - 依端點與正規化參數查詢兩層快取（記憶體 LRU + SQLite）
+# - 相同端點與參數的並發請求合併為一次上游請求
+# - 全域與端點兩級自適應並發限流，429/5xx 與連線錯誤以抖動退避重試
+# - 端點熔斷：上游故障時快速失敗，有過期快取則回傳並標記 stale，半開時於背景重新驗證
+# - 上游等待、解析耗時與回應大小記入 /metrics（依來源工具與端點區分）
+#
+# 上游 HTTP 錯誤會照常拋出 httpx.HTTPError，由各工具自行轉為 error_response。
+
+CBETA_API_BASE = os.getenv("CBETA_API_BASE", "https://api.cbetaonline.cn").rstrip("/")
+
+# CBETA_RECORD_DIR / CBETA_REPLAY_DIR 設定時，共用客戶端改用錄製或回放傳輸層
+set_transport_factory(build_transport)
+
+_inflight = SingleFlight()
+
+# 背景重新驗證的任務，保留引用避免被回收
+_background = set()
+
+# 可安全重試的連線層錯誤；讀取逾時不重試，避免慢上游時等待時間成倍增加
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+
+def _parse_json(resp: httpx.Response) -> Any:
+    return resp.json()
+
+
+async def cbeta_get(
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    *,
+    timeout: Optional[float] = None,
+    parse: Callable[[httpx.Response], Any] = _parse_json,
+    use_cache: bool = True,
+) -> Any:
+    """
+    以 GET 請求 CBETA API 端點（如 "/works"），回傳 parse(resp) 的結果（預設為 JSON）。
+
+    - params 中值為 None 的參數不會送出，也不計入快取鍵
+    - timeout 未指定時使用共用客戶端的預設逾時
+    - use_cache=False 時略過快取（仍會送出請求）
+    - 回傳值可能來自快取，呼叫端不可就地修改
+    - 上游故障或熔斷時若有過期快取則回傳之，並透過 mark_stale() 讓 success_response 標記 stale
+    - 熔斷且無快取時拋出 CircuitOpenError
+    """
+    query = {k: v for k, v in (params or {}).items() if v is not None}
+    # 慢呼叫紀錄的步驟事件；source 預設為 coalesced（等待他人發出的同鍵請求），實際取得方式在 _get 中補上
+    event = trace_event("cbeta_get", endpoint=path, params=query, source="coalesced")
+    started = time.perf_counter()
+    try:
+        return await _get(path, query, event, timeout, parse, use_cache)
+    except Exception as e:
+        event["error"] = type(e).__name__
+        raise
+    finally:
+        event["ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def _get(path: str, query: Dict[str, Any], event: Dict[str, Any], timeout: Optional[float],
+               parse: Callable[[httpx.Response], Any], use_cache: bool) -> Any:
+    key = cache_key(path, query)
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            event["source"] = "cache"
+            return cached
+
+    breaker = breakers.get(path)
+
+    async def fetch():
+        kwargs = {"params": query}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        tool = metrics.current_tool.get()
+        started = time.perf_counter()
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                resp = None
+                async with upstream_limiter.slot(path) as slot:
+                    metrics.upstream_in_flight.inc(endpoint=path)
+                    try:
+                        resp = await get_http_client().get(CBETA_API_BASE + path, **kwargs)
+                    except RETRYABLE_ERRORS as e:
+                        metrics.upstream_requests.inc(endpoint=path, status=type(e).__name__)
+                        if attempt == MAX_RETRIES:
+                            raise
+                    except Exception as e:
+                        metrics.upstream_requests.inc(endpoint=path, status=type(e).__name__)
+                        raise
+                    else:
+                        metrics.upstream_requests.inc(endpoint=path, status=str(resp.status_code))
+                        slot.observe(resp.status_code, resp.headers.get("Retry-After"))
+                    finally:
+                        metrics.upstream_in_flight.dec(endpoint=path)
+                if resp is not None and (resp.status_code not in RETRYABLE_STATUS or attempt == MAX_RETRIES):
+                    break
+                upstream_limiter.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, slot.retry_after))
+            resp.raise_for_status()
+        except Exception as e:
+            if is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        finally:
+            wait = time.perf_counter() - started
+            metrics.upstream_wait.observe(wait, tool=tool, endpoint=path)
+            if event["source"] != "stale":  # 背景重新驗證時，呼叫端早已取得過期快取
+                event.update(source="upstream", attempts=attempt + 1, wait_ms=round(wait * 1000, 1))
+        breaker.record_success()
+        metrics.upstream_response_bytes.observe(len(resp.content), endpoint=path)
+        decode_started = time.perf_counter()
+        data = parse(resp)
+        decode = time.perf_counter() - decode_started
+        metrics.upstream_decode.observe(decode, tool=tool, endpoint=path)
+        if event["source"] != "stale":
+            event.update(bytes=len(resp.content), decode_ms=round(decode * 1000, 2))
+        if use_cache:
+            await response_cache.set(key, data, ttl_for(path))
+        return data
+
+    state = breaker.state
+    if state != CLOSED:
+        stale = await response_cache.get_stale(key) if use_cache else None
+        probing = state == HALF_OPEN and breaker.try_probe()
+        if stale is not None:
+            if probing:
+                _revalidate(key, fetch)
+            mark_stale("上游熔斷中，回傳過期快取")
+            event["source"] = "stale"
+            return stale
+        if not probing:
+            breaker.counters["rejected"] += 1
+            raise CircuitOpenError(f"CBETA 上游暫時不可用（{path} 熔斷中），請稍後再試")
+
+    try:
+        return await _inflight.do(key, fetch)
+    except Exception as e:
+        if not (use_cache and is_upstream_failure(e)):
+            raise
+        stale = await response_cache.get_stale(key)
+        if stale is None:
+            raise
+        mark_stale("上游請求失敗，回傳過期快取")
+        event["source"] = "stale"
+        return stale
+
+
+def _revalidate(key: str, fetch: Callable[[], Any]):
+    """於背景重新抓取並寫回快取；失敗由熔斷器記錄，這裡不再拋出。"""
+    task = asyncio.ensure_future(_inflight.do(key, fetch))
+    _background.add(task)
+    task.add_done_callback(lambda t: (_background.discard(t), t.cancelled() or t.exception()))
+
+
+register_stats("cbeta_cache", response_cache.stats)
+register_stats("cbeta_singleflight", _inflight.stats)
+register_stats("cbeta_limiter", upstream_limiter.stats)
+register_stats("cbeta_breakers", breakers.stats)
+
+
+def _collect_metrics():
+    """抓取 /metrics 時讀取快取、合併、限流與熔斷器的計數。"""
+    cache = response_cache.stats()
+    lookups = {k: cache[k] for k in ("memory_hits", "disk_hits", "misses", "stale_hits") if k in cache}
+    lines = metrics.counter_family("cbeta_cache_lookups_total", "CBETA 回應快取查詢結果", "result", lookups)
+    flight = _inflight.stats()
+    lines += metrics.counter_family("cbeta_singleflight_requests_total", "上游請求合併情形", "role",
+                                    {"leader": flight["leaders"], "coalesced": flight["coalesced"]})
+    lines += metrics.counter_family("cbeta_upstream_retries_total", "上游請求重試次數", "scope",
+                                    {"all": upstream_limiter.retries})
+    states = {path: {CLOSED: 0, HALF_OPEN: 1}.get(info["state"], 2) for path, info in breakers.stats().items()}
+    lines += metrics.counter_family("cbeta_breaker_state", "端點熔斷狀態（0 關閉、1 半開、2 開啟）", "endpoint",
+                                    states, kind="gauge")
+    return lines
+
+
+metrics.registry.add_collector(_collect_metrics)
@@ -0,0 +1,88 @@
+import os
+import time
+from typing import Dict
+import httpx
+
+# 端點熔斷器
+#
+# closed    ：正常放行，連續失敗達 BREAKER_FAILURE_THRESHOLD 次即跳閘
+# open      ：直接失敗（或回傳過期快取），不再等待上游逾時
+# half_open ：冷卻 BREAKER_RECOVERY_TIMEOUT 秒後，只放行一個探測請求；
+#             成功則關閉，失敗則重新跳閘
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("CBETA_BREAKER_FAILURES", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("CBETA_BREAKER_RECOVERY", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """熔斷中且無可用快取時拋出，沿用 httpx.HTTPError 以便既有工具照常處理。"""
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """逾時、連線錯誤、5xx 與 429 視為上游故障；其餘 4xx 代表上游仍正常回應。"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return isinstance(exc, httpx.TransportError)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.counters = {"trips": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def try_probe(self) -> bool:
+        """半開狀態下取得唯一的探測名額。"""
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self._state = CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != OPEN:
+                self.counters["trips"] += 1
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> dict:
+        return {**self.counters, "state": self.state, "failures": self._failures}
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, path: str) -> CircuitBreaker:
+        breaker = self._breakers.get(path)
+        if breaker is None:
+            breaker = self._breakers[path] = CircuitBreaker(path)
+        return breaker
+
+    def stats(self) -> dict:
+        return {path: breaker.stats() for path, breaker in self._breakers.items()}
+
+
+breakers = BreakerRegistry()
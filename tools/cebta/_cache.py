@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode
+
+# CBETA 回應快取（兩層）：
+# - 第一層：行程內 LRU + TTL，容量以條目數限制
+# - 第二層：SQLite 持久化，服務重啟後仍可命中
+#
+# 快取鍵為「端點路徑 + 正規化後的查詢參數」，值為解析後的 JSON。
+# 過期條目在 CACHE_STALE_TTL 內仍保留，供上游故障時以 get_stale() 回退使用。
+# 記憶體層回傳的是同一個物件，呼叫端只可讀取，不可修改。
+
+CACHE_MAX_ENTRIES = int(os.getenv("CBETA_CACHE_MAX_ENTRIES", "2048"))
+CACHE_DB_PATH = os.getenv("CBETA_CACHE_DB", "cbeta_cache.sqlite3")  # 設為空字串可停用磁碟層
+CACHE_STALE_TTL = int(os.getenv("CBETA_CACHE_STALE_TTL", str(30 * 24 * 3600)))
+
+# 各端點 TTL（秒），以最長路徑前綴比對；目錄、卷文等幾乎不變，搜尋結果則較短
+DAY = 24 * 3600
+TTL_POLICIES = {
+    "/works": 1 * DAY,
+    "/toc": 7 * DAY,
+    "/juans": 7 * DAY,
+    "/lines": 7 * DAY,
+    "/catalog_entry": 7 * DAY,
+    "/search": 10 * 60,
+    "/search/synonym": 1 * DAY,
+    "/search/facet": 60 * 60,
+}
+DEFAULT_TTL = 10 * 60
+
+
+def ttl_for(path: str) -> int:
+    """依端點路徑取得 TTL，取最長相符前綴。"""
+    best, ttl = -1, DEFAULT_TTL
+    for prefix, seconds in TTL_POLICIES.items():
+        if (path == prefix or path.startswith(prefix + "/")) and len(prefix) > best:
+            best, ttl = len(prefix), seconds
+    return ttl
+
+
+def cache_key(path: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """端點 + 排序後的查詢參數（忽略 None），確保參數順序不同時仍命中同一鍵。"""
+    items = sorted((k, str(v)) for k, v in (params or {}).items() if v is not None)
+    return f"{path}?{urlencode(items)}"
+
+
+class TieredCache:
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, db_path: Optional[str] = CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expired": 0,
+            "stale_hits": 0,
+        }
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.execute(
+                    "DELETE FROM responses WHERE expires_at < ?", (time.time() - CACHE_STALE_TTL,)
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ 快取資料庫無法開啟，僅使用記憶體快取：{e}")
+                self._db = None
+
+    # ---------- 記憶體層 ----------
+    def _memory_get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        now = time.time()
+        if expires_at + CACHE_STALE_TTL < now:
+            del self._memory[key]
+            return None
+        if expires_at < now and not allow_stale:
+            # 過期條目先留在 LRU 中，作為回退用的舊資料，由 LRU 自然淘汰
+            self.counters["expired"] += 1
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: Any, expires_at: float):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    # ---------- 磁碟層（在執行緒中執行，避免阻塞事件迴圈） ----------
+    def _disk_get(self, key: str, allow_stale: bool = False):
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time() and not allow_stale:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key: str, text: str, expires_at: float):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, text, expires_at),
+            )
+            self._db.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    # ---------- 對外介面 ----------
+    async def get(self, key: str) -> Optional[Any]:
+        value = self._memory_get(key)
+        if value is not None:
+            self.counters["memory_hits"] += 1
+            return value
+        if self._db is not None:
+            try:
+                row = await self._run(self._disk_get, key)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"⚠️ 讀取快取資料庫失敗：{e}")
+                row = None
+            if row is not None:
+                value, expires_at = row
+                self._memory_set(key, value, expires_at)
+                self.counters["disk_hits"] += 1
+                return value
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: int):
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._memory_set(key, value, expires_at)
+        self.counters["sets"] += 1
+        if self._db is not None:
+            try:
+                text = json.dumps(value, ensure_ascii=False)
+                await self._run(self._disk_set, key, text, expires_at)
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"⚠️ 寫入快取資料庫失敗：{e}")
+
+    async def get_stale(self, key: str) -> Optional[Any]:
+        """取得條目（含已過期但仍在保留期內者），供上游故障時回退。"""
+        value = self._memory_get(key, allow_stale=True)
+        if value is None and self._db is not None:
+            try:
+                row = await self._run(self._disk_get, key, True)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"⚠️ 讀取快取資料庫失敗：{e}")
+                row = None
+            if row is not None:
+                value, expires_at = row
+                self._memory_set(key, value, expires_at)
+        if value is not None:
+            self.counters["stale_hits"] += 1
+        return value
+
+    def clear(self):
+        self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_capacity": self.max_entries,
+            "disk_enabled": self._db is not None,
+        }
+
+
+# 全域共用的回應快取
+response_cache = TieredCache()
@@ -0,0 +1,373 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from collections import ChainMap, OrderedDict
+from typing import Any, Dict, Iterable, List, MutableMapping, Optional, Set, Tuple
+import httpx
+from main import register_stats, register_background_task
+from tools.cebta._api import CBETA_API_BASE, cbeta_get
+from tools.cebta._breaker import is_upstream_failure
+from tools._profiler import trace_event
+
+# 本機佛典目錄樹（/catalog_entry）
+#
+# 以有限並行的爬蟲自 CBETA_CATALOG_ROOTS 起逐層下載整棵目錄樹，存成「節點編號 → 上游回應」的鄰接表：
+# - 每個節點保存上游原始回應與下載時間，子節點即回應中不帶 work 的項目（帶 work 者為佛典葉節點）
+# - 完整爬取時寫入新表再一次替換；失敗的節點沿用舊資料，並刪除已無法由根節點到達的節點
+# - 下載失敗的節點記下編號，之後只重試這些節點（自 CBETA_CATALOG_RETRY 秒起倍增退避）；
+#   上游回應 4xx 的節點視為不存在，不再重試。樹的節點數以 CBETA_CATALOG_MAX_NODES 為上限
+# - 增量更新：每輪只重新下載超過 CBETA_CATALOG_MAX_AGE 的節點（最多 CBETA_CATALOG_REFRESH_BATCH 個），
+#   子節點有增減時補爬新增的子樹、刪除消失的子樹
+# - 快照（CBETA_CATALOG_SNAPSHOT）讓重啟後不必重新爬取；快照記錄上游位址，與 CBETA_API_BASE 不同時不採用
+#
+# 查詢不在樹中的節點時請求上游補爬（query_catalog() 依需要補爬展開深度內缺少的下層節點），
+# 補爬的節點放在另一個 LRU（CBETA_CATALOG_EXTRA_NODES 個），不寫入快照；查無內容的節點不保留。
+# 回傳的節點資料為樹內的同一物件，呼叫端只可讀取，不可修改。
+
+CATALOG_TREE_ENABLED = os.getenv("CBETA_CATALOG_TREE", "1") == "1"
+CATALOG_ROOTS = [r.strip() for r in os.getenv("CBETA_CATALOG_ROOTS", "root").split(",") if r.strip()]
+CATALOG_CONCURRENCY = int(os.getenv("CBETA_CATALOG_CONCURRENCY", "8"))
+CATALOG_MAX_NODES = int(os.getenv("CBETA_CATALOG_MAX_NODES", "200000"))
+CATALOG_MAX_AGE = float(os.getenv("CBETA_CATALOG_MAX_AGE", str(7 * 24 * 3600)))
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CBETA_CATALOG_REFRESH_INTERVAL", "3600"))
+CATALOG_REFRESH_BATCH = int(os.getenv("CBETA_CATALOG_REFRESH_BATCH", "500"))
+CATALOG_SNAPSHOT = os.getenv("CBETA_CATALOG_SNAPSHOT", "cbeta_catalog_tree.json.gz")  # 空字串停用快照
+CATALOG_RETRY = float(os.getenv("CBETA_CATALOG_RETRY", "60"))
+CATALOG_EXTRA_NODES = int(os.getenv("CBETA_CATALOG_EXTRA_NODES", "2000"))
+
+_Node = Tuple[float, Dict[str, Any]]  # (下載時間, 上游回應)
+
+
+def child_ids(data: Dict[str, Any]) -> List[str]:
+    """可再展開的子節點編號；帶 work 的項目是佛典葉節點，不再往下查詢。"""
+    return [item["n"] for item in data.get("results") or [] if item.get("n") and not item.get("work")]
+
+
+class CatalogTree:
+    def __init__(self):
+        self._nodes: Dict[str, _Node] = {}
+        self._extra: "OrderedDict[str, _Node]" = OrderedDict()  # 不在樹中、因查詢而補爬的節點
+        self.failed: Set[str] = set()  # 下載失敗、待重試的節點
+        self.crawled_at = 0.0  # 0 表示尚未完整爬取過
+        self.counters = {
+            "local_hits": 0, "upstream_fetches": 0, "fetch_errors": 0, "crawls": 0, "retries": 0,
+            "refreshes": 0, "refreshed_nodes": 0, "changed_nodes": 0, "over_limit": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.crawled_at) and not self.failed
+
+    # ---------- 查詢 ----------
+
+    def get(self, q: str) -> Optional[Dict[str, Any]]:
+        node = self._nodes.get(q)
+        if node is None:
+            node = self._extra.get(q)
+            if node is not None:
+                self._extra.move_to_end(q)
+        return node[1] if node else None
+
+    def subtree(self, q: str, depth: int) -> Optional[Dict[str, Any]]:
+        """
+        節點 q 展開 depth 層：depth=1 即節點本身的回應；更深時每個可展開的項目加上 children（下層的 results）。
+        缺少的下層節點不展開（不帶 children）。
+        """
+        data = self.get(q)
+        if data is None or depth <= 1:
+            return data
+        results = []
+        for item in data.get("results") or []:
+            child = self.subtree(item["n"], depth - 1) if item.get("n") and not item.get("work") else None
+            results.append({**item, "children": child.get("results") or []} if child is not None else item)
+        return {**data, "results": results}
+
+    def missing(self, q: str, depth: int) -> List[str]:
+        """展開 q 到 depth 層時尚未在樹中的節點。"""
+        missing, level = [], [q]
+        for remaining in range(depth, 0, -1):
+            following = []
+            for node_id in level:
+                data = self.get(node_id)
+                if data is None:
+                    missing.append(node_id)
+                elif remaining > 1:
+                    following.extend(child_ids(data))
+            level = following
+        return missing
+
+    # ---------- 下載 ----------
+
+    async def _fetch(self, q: str) -> Dict[str, Any]:
+        # 目錄資料另存於樹中，不寫入回應快取
+        self.counters["upstream_fetches"] += 1
+        try:
+            return await cbeta_get("/catalog_entry", {"q": q}, use_cache=False)
+        except Exception:
+            self.counters["fetch_errors"] += 1
+            raise
+
+    async def crawl(self, roots: Iterable[str], nodes: Optional[MutableMapping[str, _Node]] = None,
+                    max_depth: Optional[int] = None, refetch: bool = True,
+                    concurrency: int = CATALOG_CONCURRENCY) -> Tuple[int, List[str]]:
+        """
+        自 roots 起以 concurrency 個 worker 逐層下載，結果寫入 nodes（預設為目前的樹）。
+
+        refetch=False 時已在樹中的節點不重新下載，只沿其子節點往下走；max_depth 為 roots 以下的層數。
+        nodes 已達 CATALOG_MAX_NODES 時新節點不再寫入。回傳 (下載節點數, 可重試的失敗節點)。
+        上游回應 4xx 的節點視為不存在，不列入失敗節點。
+        """
+        nodes = self._nodes if nodes is None else nodes
+        queue: asyncio.Queue = asyncio.Queue()
+        seen: Set[str] = set()
+        for root in roots:
+            if root not in seen:
+                seen.add(root)
+                queue.put_nowait((root, 0))
+        fetched = 0
+        failed: List[str] = []
+
+        async def worker():
+            nonlocal fetched
+            while True:
+                q, depth = await queue.get()
+                try:
+                    node = nodes.get(q)
+                    if node is None or refetch:
+                        try:
+                            node = (time.time(), await self._fetch(q))
+                            fetched += 1
+                        except Exception as e:
+                            if not isinstance(e, httpx.HTTPStatusError) or is_upstream_failure(e):
+                                failed.append(q)
+                            print(f"⚠️ 目錄節點下載失敗：{q}，錯誤：{e}")
+                        else:
+                            if q in nodes or len(nodes) < CATALOG_MAX_NODES:
+                                nodes[q] = node
+                            else:
+                                self.counters["over_limit"] += 1
+                    if node is None or (max_depth is not None and depth >= max_depth):
+                        continue
+                    for child in child_ids(node[1]):
+                        if child not in seen:
+                            seen.add(child)
+                            queue.put_nowait((child, depth + 1))
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return fetched, failed
+
+    async def ensure(self, q: str, depth: int = 1) -> Dict[str, _Node]:
+        """
+        補爬展開 q 到 depth 層所缺的節點，回傳本次下載的節點。
+
+        補爬的節點放在 _extra（有上限），查無內容者不保留。
+        """
+        fetched: Dict[str, _Node] = {}
+        if not self.missing(q, depth):
+            return fetched
+        await self.crawl([q], ChainMap(fetched, self._nodes, self._extra), max_depth=depth - 1, refetch=False)
+        for node_id, node in fetched.items():
+            if node[1].get("results"):
+                self._extra[node_id] = node
+                self._extra.move_to_end(node_id)
+        while len(self._extra) > CATALOG_EXTRA_NODES:
+            self._extra.popitem(last=False)
+        return fetched
+
+    def _reachable(self, nodes: Dict[str, _Node], roots: Iterable[str]) -> Set[str]:
+        reachable: Set[str] = set()
+        stack = [r for r in roots if r in nodes]
+        while stack:
+            q = stack.pop()
+            if q in reachable:
+                continue
+            reachable.add(q)
+            stack.extend(c for c in child_ids(nodes[q][1]) if c in nodes)
+        return reachable
+
+    async def rebuild(self, roots: List[str] = CATALOG_ROOTS) -> bool:
+        """完整重新爬取；失敗的節點沿用舊資料並記入 failed 待重試。"""
+        started = time.perf_counter()
+        nodes = dict(self._nodes)
+        fetched, failed = await self.crawl(roots, nodes)
+        reachable = self._reachable(nodes, roots)
+        self._nodes = {q: node for q, node in nodes.items() if q in reachable}
+        self.failed = set(failed)
+        self.crawled_at = time.time()
+        self.counters["crawls"] += 1
+        trace_event("catalog_crawl", fetched=fetched, failed=len(failed),
+                    nodes=len(self._nodes), ms=round((time.perf_counter() - started) * 1000, 1))
+        return self.complete
+
+    async def retry_failed(self) -> int:
+        """只重新下載先前失敗的節點（及其下新出現的子樹），回傳成功的節點數。"""
+        ids = sorted(self.failed)
+        if not ids:
+            return 0
+        self.counters["retries"] += 1
+        _, failed = await self.crawl(ids, max_depth=0)
+        self.failed = set(failed)
+        recovered = [q for q in ids if q not in self.failed and q in self._nodes]
+        # 重試成功的節點再往下補爬樹中還沒有的子節點
+        _, failed = await self.crawl(recovered, refetch=False)
+        self.failed.update(failed)
+        return len(recovered)
+
+    async def refresh(self, max_age: float = CATALOG_MAX_AGE, batch: int = CATALOG_REFRESH_BATCH) -> int:
+        """增量更新最舊的一批過期節點，回傳重新下載的節點數。"""
+        cutoff = time.time() - max_age
+        stale = sorted((node[0], q) for q, node in self._nodes.items() if node[0] < cutoff)[:batch]
+        if not stale:
+            return 0
+        semaphore = asyncio.Semaphore(max(1, CATALOG_CONCURRENCY))
+
+        async def refetch(q: str):
+            async with semaphore:
+                return await self._fetch(q)
+
+        ids = [q for _, q in stale]
+        fetched = await asyncio.gather(*(refetch(q) for q in ids), return_exceptions=True)
+        changed, added = 0, []
+        for q, data in zip(ids, fetched):
+            if isinstance(data, Exception) or q not in self._nodes:
+                continue
+            before = set(child_ids(self._nodes[q][1]))
+            self._nodes[q] = (time.time(), data)
+            after = child_ids(data)
+            if set(after) != before:
+                changed += 1
+                self._drop(before - set(after))
+                added.extend(c for c in after if c not in before)
+        if added:
+            _, failed = await self.crawl(added, refetch=False)
+            self.failed.update(failed)
+        self.counters["refreshes"] += 1
+        self.counters["refreshed_nodes"] += len(ids)
+        self.counters["changed_nodes"] += changed
+        return len(ids)
+
+    def _drop(self, removed: Iterable[str]):
+        stack = list(removed)
+        while stack:
+            node = self._nodes.pop(stack.pop(), None)
+            if node is not None:
+                stack.extend(child_ids(node[1]))
+
+    # ---------- 快照 ----------
+
+    def dump(self) -> Dict[str, Any]:
+        return {"saved_at": time.time(), "api_base": CBETA_API_BASE, "crawled_at": self.crawled_at,
+                "failed": sorted(self.failed), "nodes": {q: list(node) for q, node in self._nodes.items()}}
+
+    def load(self, snapshot: Dict[str, Any]):
+        self._nodes = {q: (node[0], node[1]) for q, node in snapshot["nodes"].items()}
+        self.failed = set(snapshot.get("failed") or [])
+        self.crawled_at = snapshot.get("crawled_at") or snapshot.get("saved_at") or 0.0
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "enabled": CATALOG_TREE_ENABLED,
+            "complete": self.complete,
+            "nodes": len(self._nodes),
+            "extra_nodes": len(self._extra),
+            "failed": len(self.failed),
+            "crawled_at": int(self.crawled_at),
+        }
+
+
+catalog_tree = CatalogTree()
+
+
+async def query_catalog(q: str, depth: int = 1) -> Dict[str, Any]:
+    """
+    /catalog_entry 查詢入口：由目錄樹回答，缺少的節點先向上游補爬。
+
+    depth=1 回傳與上游相同的結構；depth>1 時項目帶 children，見 CatalogTree.subtree()。
+    """
+    if not CATALOG_TREE_ENABLED:
+        return await cbeta_get("/catalog_entry", {"q": q})
+    missing = catalog_tree.missing(q, depth)
+    if missing:
+        fetched = await catalog_tree.ensure(q, depth)
+        if catalog_tree.get(q) is None:
+            if q not in fetched:
+                raise RuntimeError(f"無法取得目錄節點：{q}")
+            return fetched[q][1]  # 查無內容，不保留
+    else:
+        catalog_tree.counters["local_hits"] += 1
+    trace_event("catalog_tree", q=q, depth=depth, source="upstream" if missing else "local", missing=len(missing))
+    return catalog_tree.subtree(q, depth)
+
+
+# ---------- 快照與定期更新 ----------
+
+def _save_snapshot(snapshot: Dict[str, Any]):
+    tmp = CATALOG_SNAPSHOT + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp, CATALOG_SNAPSHOT)
+
+
+def _load_snapshot() -> Optional[Dict[str, Any]]:
+    if not CATALOG_SNAPSHOT or not os.path.exists(CATALOG_SNAPSHOT):
+        return None
+    try:
+        with gzip.open(CATALOG_SNAPSHOT, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 目錄樹快照讀取失敗：{e}")
+        return None
+    if snapshot.get("api_base") != CBETA_API_BASE:
+        print(f"⚠️ 目錄樹快照來自其他上游（{snapshot.get('api_base')}），不予採用")
+        return None
+    return snapshot
+
+
+async def _save():
+    if CATALOG_SNAPSHOT:
+        await asyncio.get_running_loop().run_in_executor(None, _save_snapshot, catalog_tree.dump())
+
+
+async def _refresh_loop():
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, _load_snapshot)
+    if snapshot:
+        catalog_tree.load(snapshot)
+    attempt = 0
+    while True:
+        try:
+            if not catalog_tree.crawled_at:
+                await catalog_tree.rebuild()
+                await _save()
+            else:
+                changed = await catalog_tree.retry_failed() if catalog_tree.failed else 0
+                if await catalog_tree.refresh() or changed:
+                    await _save()
+        except Exception as e:
+            print(f"⚠️ 目錄樹更新失敗：{e}")
+        # 有失敗節點（或尚未完整爬取）時以倍增間隔重試
+        if catalog_tree.complete:
+            attempt, delay = 0, CATALOG_REFRESH_INTERVAL
+        else:
+            attempt += 1
+            delay = min(CATALOG_REFRESH_INTERVAL, CATALOG_RETRY * 2 ** min(attempt - 1, 16))
+        await asyncio.sleep(delay)
+
+
+if CATALOG_TREE_ENABLED:
+    register_background_task("cbeta_catalog_tree", _refresh_loop)
+register_stats("cbeta_catalog_tree", catalog_tree.stats)
@@ -0,0 +1,179 @@
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# CBETA 引用格式解析（純函式，不請求上游）
+#
+# 支援的寫法（parse_citation）：
+# - 行首：T01n0001_p0066c25、T01n0001p0066c25、GA001n0001_p0001a01
+# - CBETA 引用格式：CBETA 2023.Q4, T01, no. 1, p. 66c25-27 / (T01, no. 1, p. 66, c25)
+# - 冊頁欄行：T01, p. 66c25 / T01p0066c25
+# - 經卷：T0001_004、T0001（卷 1）、X0001_002
+#
+# 解析結果為 dict，kind 為 "linehead" / "vol" / "work"，並依寫法帶有 canon、vol、work、juan、
+# file、lb、linehead 等欄位；無法解析時拋出 ValueError。
+#
+# parse_line_range() 另解析行段（起迄行首、CBETA 格式的 "p. 66c25-27"），供批次取行使用。
+
+# 藏經代碼，依長度排序讓「GA」優先於「G」
+CANONS = ("A", "B", "C", "CC", "D", "F", "G", "GA", "GB", "I", "J", "K", "L", "LC", "M", "N",
+          "P", "S", "T", "TX", "U", "X", "Y", "ZS", "ZW")
+_CANON = "|".join(sorted(CANONS, key=len, reverse=True))
+
+# 冊數位數（檔名中），未列出者為 2 位
+VOL_WIDTH = {"GA": 3, "GB": 3}
+
+_LB = re.compile(r"^(\w{4})([a-z])(\d+)$")
+_FILE = re.compile(r"^([A-Z]+)(\d+)n(\w+)$")
+_LINEHEAD = re.compile(r"^([A-Z]+\d+n\w+?)_?p(\w{4}[a-z]\d{2,3})$")
+_CBETA_FORMAT = re.compile(
+    rf"\b(?P<canon>{_CANON})\s*(?P<vol>\d+)\s*,\s*no\.\s*(?P<no>[A-Za-z]?\d+[A-Za-z]?)\s*,"
+    r"\s*p\.\s*(?P<page>[a-z]?\d+)\s*,?\s*(?P<col>[a-z])\s*(?P<line>\d+)"
+)
+_VOL_PAGE = re.compile(
+    rf"^(?P<canon>{_CANON})(?P<vol>\d+)\s*,?\s*p\.?\s*(?P<page>[a-z]?\d+)\s*,?\s*(?P<col>[a-z])(?P<line>\d+)$"
+)
+_RANGE_END = re.compile(r"^\s*[-~]\s*(?:(?P<page>[a-z]?\d+)?(?P<col>[a-z]))?(?P<line>\d+)")
+_WORK_JUAN = re.compile(rf"^(?P<canon>{_CANON})(?P<no>[A-Z]?\d{{3,}}[A-Za-z]?)(?:_(?P<juan>\d+))?$")
+
+LbKey = Tuple[str, str, int]
+
+
+def lb_key(lb: str) -> LbKey:
+    """行號（頁 4 碼 + 欄 + 行，如 "0066c25"）的排序鍵；行數以數值比較。"""
+    match = _LB.match(lb or "")
+    if not match:
+        return (lb or "", "", 0)
+    return match.group(1), match.group(2), int(match.group(3))
+
+
+def split_linehead(linehead: str) -> Tuple[str, str]:
+    """行首 "T01n0001_p0066c25" → ("T01n0001", "0066c25")；格式不符時拋出 ValueError。"""
+    match = _LINEHEAD.match((linehead or "").strip())
+    if not match:
+        raise ValueError(f"無法解析行首：{linehead}")
+    return match.group(1), match.group(2)
+
+
+def split_file(file: str) -> Optional[Tuple[str, int, str]]:
+    """檔名 "T05n0220" → ("T", 5, "0220")。"""
+    match = _FILE.match(file or "")
+    return (match.group(1), int(match.group(2)), match.group(3)) if match else None
+
+
+def work_of_file(file: str) -> Optional[str]:
+    """檔名 "T05n0220" → 佛典編號 "T0220"。"""
+    parts = split_file(file)
+    return parts[0] + parts[2] if parts else None
+
+
+def work_number(number: Any) -> str:
+    """經號補足 4 位："1" → "0001"、"150A" → "0150A"、"A42" → "A042"。"""
+    match = re.match(r"^([A-Za-z]*)(\d+)(\w*)$", str(number).strip())
+    if not match:
+        raise ValueError(f"無法解析經號：{number}")
+    prefix, digits, suffix = match.groups()
+    return prefix + digits.zfill(max(4 - len(prefix), len(digits))) + suffix
+
+
+def work_id(canon: str, number: Any) -> str:
+    return canon + work_number(number)
+
+
+def file_name(canon: str, vol: int, number: Any) -> str:
+    return f"{canon}{int(vol):0{VOL_WIDTH.get(canon, 2)}d}n{work_number(number)}"
+
+
+def make_lb(page: Any, col: str, line: Any) -> str:
+    page = str(page).strip()
+    return f"{page.zfill(4) if page.isdigit() else page}{col}{int(line):02d}"
+
+
+def _linehead_citation(file: str, lb: str) -> Dict[str, Any]:
+    canon, vol, number = split_file(file)
+    return {"kind": "linehead", "canon": canon, "vol": vol, "work": canon + number,
+            "file": file, "lb": lb, "linehead": f"{file}_p{lb}"}
+
+
+def parse_citation(text: str) -> Dict[str, Any]:
+    """解析一則引用字串，見模組說明。"""
+    text = (text or "").strip()
+    match = _LINEHEAD.match(text)
+    if match:
+        return _linehead_citation(match.group(1), match.group(2))
+    match = _CBETA_FORMAT.search(text)
+    if match:
+        g = match.groupdict()
+        return _linehead_citation(file_name(g["canon"], int(g["vol"]), g["no"]), make_lb(g["page"], g["col"], g["line"]))
+    match = _VOL_PAGE.match(text)
+    if match:
+        g = match.groupdict()
+        return {"kind": "vol", "canon": g["canon"], "vol": int(g["vol"]), "lb": make_lb(g["page"], g["col"], g["line"])}
+    match = _WORK_JUAN.match(text)
+    if match:
+        g = match.groupdict()
+        return {"kind": "work", "canon": g["canon"], "work": work_id(g["canon"], g["no"]),
+                "juan": int(g["juan"]) if g["juan"] else 1}
+    raise ValueError(f"無法解析引用：{text}")
+
+
+def parse_line_range(text: str) -> Tuple[str, str, str]:
+    """
+    行段引用 → (檔名, 起始行號, 結束行號)；單一行首時起迄相同。
+
+    支援 "T01n0001_p0001a04"、"T01n0001_p0001a04-T01n0001_p0001a10"（"~"、".." 亦可）、
+    "T01n0001_p0001a04-0001b02"、CBETA 引用格式 "T01, no. 1, p. 66c25-27" / "p. 66c25-67a3"。
+    """
+    text = (text or "").strip()
+    for separator in ("..", "~", "-"):
+        head, sep, tail = text.partition(separator)
+        if sep and _LINEHEAD.match(head.strip()):
+            file, start = split_linehead(head)
+            tail = tail.strip()
+            if _LINEHEAD.match(tail):
+                end_file, end = split_linehead(tail)
+                if end_file != file:
+                    raise ValueError(f"行段跨越不同檔案：{text}")
+                return file, start, end
+            if _LB.match(tail):
+                return file, start, tail
+            raise ValueError(f"無法解析行段結尾：{text}")
+    if _LINEHEAD.match(text):
+        file, lb = split_linehead(text)
+        return file, lb, lb
+    match = _CBETA_FORMAT.search(text)
+    if match:
+        g = match.groupdict()
+        file = file_name(g["canon"], int(g["vol"]), g["no"])
+        start = make_lb(g["page"], g["col"], g["line"])
+        end = start
+        tail = _RANGE_END.match(text[match.end():])
+        if tail:
+            end = make_lb(tail.group("page") or g["page"], tail.group("col") or g["col"], tail.group("line"))
+        return file, start, end
+    raise ValueError(f"無法解析行段：{text}")
+
+
+def citation_from_fields(canon: Optional[str] = None, work: Optional[str] = None, juan: Optional[int] = None,
+                         vol: Optional[int] = None, page: Optional[int] = None, col: Optional[str] = None,
+                         line: Optional[int] = None) -> Dict[str, Any]:
+    """
+    由 /juans/goto 的分欄參數組成引用：
+    - canon + work (+ juan / page / col / line)：經卷結構
+    - canon + vol + page (+ col / line)：書本結構；同時給 work 時可直接組出行首
+    """
+    if not canon:
+        raise ValueError("缺少 canon")
+    lb = make_lb(page, col or "a", line or 1) if page is not None else None
+    if work:
+        work = str(work).strip()
+        if work.startswith(canon) and re.match(r"^[A-Z]?\d{3,}", work[len(canon):]):
+            work = work[len(canon):]  # 完整佛典編號（如 T0001）
+        if vol is not None and lb:
+            return _linehead_citation(file_name(canon, vol, work), lb)
+        citation = {"kind": "work", "canon": canon, "work": work_id(canon, work), "juan": juan}
+        if lb:
+            citation["lb"] = lb
+        return citation
+    if vol is not None and lb:
+        return {"kind": "vol", "canon": canon, "vol": int(vol), "lb": lb}
+    raise ValueError("需提供 canon + work，或 canon + vol + page")
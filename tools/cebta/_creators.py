@@ -0,0 +1,131 @@
+import bisect
+import difflib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from tools.cebta._zhconv import fold
+
+# 作譯者索引（由佛典目錄的 creators / creators_with_id 建立）
+#
+# - 作譯者 ID → 佛典列表
+# - 姓名正規化（繁簡折疊，見 _zhconv.fold）後：
+#   · 排序後的姓名陣列：前綴比對（bisect，相當於壓平的前綴樹）
+#   · 單字 + 雙字 n-gram 倒排索引：部分姓名比對，取各 n-gram 倒排列表交集後再驗證
+#   · 模糊比對：以共有單字取候選，再依相似度排序
+# 建立後不可修改，佛典目錄更新時整個重建。
+
+MATCH_MODES = ("exact", "prefix", "substring", "fuzzy")
+FUZZY_MIN_RATIO = 0.5
+FUZZY_LIMIT = 20
+
+_CreatorId = Tuple[str, str]  # (姓名, ID)
+
+
+class _Name:
+    __slots__ = ("name", "ids", "works", "unconfirmed_works")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ids: Set[str] = set()
+        self.works: List[Dict[str, Any]] = []
+        self.unconfirmed_works: List[Dict[str, Any]] = []  # 此姓名在該佛典中尚無作譯者 ID
+
+
+def _grams(text: str) -> Set[str]:
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class CreatorIndex:
+    def __init__(self, rows: Iterable[Tuple[Dict[str, Any], List[str], List[_CreatorId]]] = ()):
+        """rows 為 (佛典資料, 全部姓名, [(姓名, ID), ...])。"""
+        names: Dict[str, _Name] = {}
+        by_id: Dict[str, List[Dict[str, Any]]] = {}
+        order: Dict[str, int] = {}  # 佛典在目錄中的順序，合併多個姓名的結果時依此排序
+        for work, all_names, confirmed in rows:
+            order.setdefault(work["work"], len(order))
+            confirmed_names = {name for name, _ in confirmed}
+            for name, cid in confirmed:
+                by_id.setdefault(cid, []).append(work)
+                names.setdefault(name, _Name(name)).ids.add(cid)
+            for name in dict.fromkeys(all_names):
+                entry = names.setdefault(name, _Name(name))
+                entry.works.append(work)
+                if name not in confirmed_names:
+                    entry.unconfirmed_works.append(work)
+
+        folded: Dict[str, List[_Name]] = {}
+        for entry in names.values():
+            folded.setdefault(fold(entry.name), []).append(entry)
+        self._keys = sorted(folded)
+        self._entries = [folded[key] for key in self._keys]
+        postings: Dict[str, List[int]] = {}
+        for position, key in enumerate(self._keys):
+            for gram in _grams(key):
+                postings.setdefault(gram, []).append(position)
+        self._postings = postings
+        self._by_id = by_id
+        self._order = order
+        self._id_names = {cid: entry.name for entry in names.values() for cid in entry.ids}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def id_count(self) -> int:
+        return len(self._by_id)
+
+    # ---------- 查詢 ----------
+
+    def by_id(self, creator_id: str) -> List[Dict[str, Any]]:
+        return list(self._by_id.get(creator_id, []))
+
+    def name_of(self, creator_id: str) -> Optional[str]:
+        return self._id_names.get(creator_id)
+
+    def _positions(self, query: str, mode: str) -> List[int]:
+        key = fold(query)
+        if not key:
+            return []
+        if mode == "exact":
+            position = bisect.bisect_left(self._keys, key)
+            return [position] if position < len(self._keys) and self._keys[position] == key else []
+        if mode == "prefix":
+            lo = bisect.bisect_left(self._keys, key)
+            hi = bisect.bisect_left(self._keys, key + "\U0010ffff")
+            return list(range(lo, hi))
+        # 部分比對：取所有雙字（單字查詢則取單字）倒排列表的交集，再驗證確實包含
+        grams = [key] if len(key) == 1 else [key[i:i + 2] for i in range(len(key) - 1)]
+        lists = sorted((self._postings.get(gram, []) for gram in dict.fromkeys(grams)), key=len)
+        if not lists or not lists[0]:
+            matched: List[int] = []
+        else:
+            candidates = set(lists[0])
+            for other in lists[1:]:
+                candidates.intersection_update(other)
+            matched = sorted(p for p in candidates if key in self._keys[p])
+        if mode != "fuzzy":
+            return matched
+        # 模糊：加上與查詢共有單字、相似度達門檻的姓名，依相似度排序
+        seen = set(matched)
+        scored = []
+        for char in set(key):
+            for position in self._postings.get(char, []):
+                if position in seen:
+                    continue
+                seen.add(position)
+                ratio = difflib.SequenceMatcher(None, key, self._keys[position]).ratio()
+                if ratio >= FUZZY_MIN_RATIO:
+                    scored.append((-ratio, position))
+        scored.sort()
+        return matched + [position for _, position in scored[:FUZZY_LIMIT]]
+
+    def match(self, query: str, mode: str = "substring") -> List[str]:
+        """回傳符合查詢的原始姓名（繁簡寫法各自列出）。"""
+        return [entry.name for position in self._positions(query, mode) for entry in self._entries[position]]
+
+    def works(self, query: str, mode: str = "substring", unconfirmed_only: bool = False) -> List[Dict[str, Any]]:
+        """符合姓名的佛典（去重，依目錄順序）。"""
+        results: Dict[str, Dict[str, Any]] = {}
+        for position in self._positions(query, mode):
+            for entry in self._entries[position]:
+                for work in (entry.unconfirmed_works if unconfirmed_only else entry.works):
+                    results.setdefault(work["work"], work)
+        return sorted(results.values(), key=lambda work: self._order[work["work"]])
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from main import register_stats
+from tools.cebta._mirror import mirror_store
+from tools.cebta._ngram import FULLTEXT_DB, NgramIndex, normalize, parse_query
+from tools.cebta._works_index import works_index
+from tools._profiler import trace_event
+
+# 本機全文檢索（選用）
+#
+# 以 _ngram 建好的索引（CBETA_FULLTEXT_DB）回答全文檢索，回傳與上游相同的結構：
+# - /search、/search/sc：{query_string, num_found, total_term_hits, results}，每卷一筆，含 term_hits
+#   與佛典目錄索引中的 title、canon、category、vol、creators、file、time_from、time_to
+# - /search/extended：{total, results: [{title, juan, content}]}，content 為第一個命中前後的卷文
+# - /search/all_in_one：同 /search，另附 kwics（需有鏡像卷文；facet 不支援，改請求上游）
+# - /search/similar：由 _similar 以索引選出候選段落後在本機做 Smith-Waterman 比對
+#
+# CBETA_FULLTEXT_MODE：
+# - off（預設）：不使用
+# - fallback：先請求上游，失敗（含熔斷）時改以本機索引回答
+# - prefer：索引就緒時直接本機回答，查詢語法不支援（含本機回答時拋出 ValueError）時才請求上游
+# 本機回答的結果帶 "source": "local"。索引檔被重建替換後，CBETA_FULLTEXT_RELOAD 秒內自動改用新檔。
+
+FULLTEXT_MODE = os.getenv("CBETA_FULLTEXT_MODE", "off")
+FULLTEXT_RELOAD = float(os.getenv("CBETA_FULLTEXT_RELOAD", "60"))
+
+# 回傳欄位取自佛典目錄索引
+WORK_FIELDS = ("canon", "category", "vol", "title", "creators", "file", "time_from", "time_to")
+KWIC_MAX_PER_JUAN = 200
+# 本機相似搜尋的查詢句字數（不含標點）
+SIMILAR_MIN_CHARS, SIMILAR_MAX_CHARS = 2, 200
+
+
+class LocalFulltext:
+    def __init__(self, db_path: str = FULLTEXT_DB):
+        self.db_path = db_path
+        self.index: Optional[NgramIndex] = None
+        self._checked = 0.0
+        self.counters = {"local_answers": 0, "fallbacks": 0, "unsupported": 0, "reloads": 0}
+
+    def current(self) -> Optional[NgramIndex]:
+        """目前的索引；定期檢查檔案是否被替換。"""
+        now = time.time()
+        if now - self._checked < FULLTEXT_RELOAD and self.index is not None:
+            return self.index
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.db_path)
+        except OSError:
+            return self.index
+        if self.index is None or mtime != self.index.mtime:
+            try:
+                index = NgramIndex(self.db_path)
+            except Exception as e:
+                print(f"⚠️ 本機全文索引載入失敗：{e}")
+                return self.index
+            # 舊索引不主動關閉：執行緒池中進行中的查詢仍持有它，待最後的引用釋放時由 GC 關閉連線
+            self.index = index
+            self.counters["reloads"] += 1
+        return self.index
+
+    @property
+    def ready(self) -> bool:
+        return FULLTEXT_MODE != "off" and self.current() is not None
+
+    # ---------- 結果 ----------
+
+    def _row(self, index: NgramIndex, doc: int, hits: int) -> Dict[str, Any]:
+        work = index.works[doc]
+        info = works_index.get(work) or {}
+        row = {"id": doc, "juan": index.juans[doc], "work": work, "term_hits": hits}
+        row.update({k: info[k] for k in WORK_FIELDS if info.get(k) is not None})
+        return row
+
+    @staticmethod
+    def _order(rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+        """order 如 "time_from-"、"canon+,term_hits-"；缺少該欄者排在最後。"""
+        for item in reversed([o.strip() for o in (order or "").split(",") if o.strip()]):
+            field, descending = item.rstrip("+-"), item.endswith("-")
+            present = [r for r in rows if r.get(field) is not None]
+            missing = [r for r in rows if r.get(field) is None]
+            present.sort(key=lambda r: r[field], reverse=descending)
+            rows = present + missing
+        return rows
+
+    def _kwics(self, index: NgramIndex, doc: int, hits, around: int, mark: bool = True) -> List[str]:
+        """由鏡像卷文取出命中前後 around 字；未鏡像時回傳空列表。"""
+        data = mirror_store.load(index.works[doc], index.juans[doc])
+        if data is None:
+            return []
+        text = data.get("text") or ""
+        _, offsets = normalize(text)
+        kwics = []
+        for start, length in hits[:KWIC_MAX_PER_JUAN]:
+            if start + length > len(offsets):
+                continue
+            s, e = offsets[start], offsets[start + length - 1] + 1
+            before, after = text[max(0, s - around):s], text[e:e + around]
+            kwics.append(before + (f"<mark>{text[s:e]}</mark>" if mark else text[s:e]) + after)
+        return kwics
+
+    def search(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """以本機索引回答；kind 為 search / sc / extended / all_in_one。"""
+        index = self.current()
+        if index is None:
+            raise ValueError("本機全文索引不存在")
+        started = time.perf_counter()
+        q = str(params.get("q") or "")
+        note = str(params.get("note", 1)) != "0"
+        found = index.search(q, note=note)
+        rows = [self._row(index, doc, len(hits)) for doc, hits in sorted(found.items())]
+        rows = self._order(rows, params.get("order"))
+        total_hits = sum(row["term_hits"] for row in rows)
+        start = int(params.get("start") or 0)
+        page = rows[start:start + int(params.get("rows") or 20)]
+        trace_event("fulltext_local", kind=kind, q=q, num_found=len(rows),
+                    ms=round((time.perf_counter() - started) * 1000, 2))
+
+        if kind == "extended":
+            around = 30
+            results = []
+            for row in page:
+                kwics = self._kwics(index, row["id"], found[row["id"]][:1], around, mark=False)
+                results.append({"title": row.get("title", ""), "juan": row["juan"], "content": kwics[0] if kwics else ""})
+            return {"total": len(rows), "results": results, "source": "local"}
+
+        if kind == "all_in_one":
+            around = int(params.get("around") or 10)
+            for row in page:
+                kwics = self._kwics(index, row["id"], found[row["id"]], around)
+                row["kwics"] = {"num_found": row["term_hits"], "results": [{"kwic": k} for k in kwics]}
+        fields = [f.strip() for f in str(params.get("fields") or "").split(",") if f.strip()]
+        if fields:
+            page = [{k: row[k] for k in fields + (["kwics"] if "kwics" in row else []) if k in row} for row in page]
+        data = {"query_string": q, "num_found": len(rows), "total_term_hits": total_hits, "results": page, "source": "local"}
+        if kind == "sc":
+            data["hits"] = len(rows)
+        return data
+
+    def supports(self, kind: str, params: Dict[str, Any]) -> bool:
+        if kind in ("all_in_one", "similar") and str(params.get("facet") or 0) != "0":
+            return False
+        if kind == "similar":
+            return SIMILAR_MIN_CHARS <= len(normalize(str(params.get("q") or ""))[0]) <= SIMILAR_MAX_CHARS
+        try:
+            parse_query(str(params.get("q") or ""))
+            return True
+        except ValueError:
+            return False
+
+    async def answer(self, kind: str, params: Dict[str, Any], upstream: Callable[[], Awaitable[Dict[str, Any]]],
+                     local: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None) -> Dict[str, Any]:
+        """
+        依 CBETA_FULLTEXT_MODE 決定本機回答或請求上游，見模組說明。
+
+        local 省略時以 search(kind, params) 在執行緒池中回答；相似搜尋等另有實作者自行傳入。
+        """
+        ready = self.ready
+        use_local = ready and self.supports(kind, params)
+        if ready and not use_local:
+            self.counters["unsupported"] += 1
+        if local is None:
+            local = lambda: asyncio.get_running_loop().run_in_executor(None, self.search, kind, params)
+        if use_local and FULLTEXT_MODE == "prefer":
+            try:
+                data = await local()
+            except ValueError:
+                self.counters["unsupported"] += 1
+                return await upstream()
+            self.counters["local_answers"] += 1
+            return data
+        try:
+            return await upstream()
+        except Exception:
+            if not use_local:
+                raise
+            self.counters["fallbacks"] += 1
+            return await local()
+
+    def stats(self) -> dict:
+        index = self.index
+        return {
+            **self.counters,
+            "mode": FULLTEXT_MODE,
+            "docs": len(index) if index is not None else 0,
+            "built_at": int(index.meta.get("built_at", 0)) if index is not None else 0,
+        }
+
+
+local_fulltext = LocalFulltext()
+
+
+register_stats("cbeta_fulltext", local_fulltext.stats)
@@ -0,0 +1,59 @@
+import bisect
+from typing import Any, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+# 靜態區間索引
+#
+# 以起點排序的陣列 + 終點最大值線段樹實作：
+# - overlap(lo, hi)：列出與 [lo, hi] 重疊的區間，O(log n + k log n)
+# - count(lo, hi)：只計數，兩次二分搜尋 O(log n)
+#   （與 [lo, hi] 重疊 = 起點 <= hi 的數量 − 終點 < lo 的數量；終點 < lo 者起點必然 <= hi）
+# 建立後不可修改，資料更新時整個重建。
+
+T = TypeVar("T")
+
+
+class IntervalIndex(Generic[T]):
+    def __init__(self, items: Iterable[Tuple[int, int, T]]):
+        ordered = sorted(((start, max(start, end), payload) for start, end, payload in items),
+                         key=lambda item: item[0])
+        self._starts = [start for start, _, _ in ordered]
+        self._ends = [end for _, end, _ in ordered]
+        self._payloads = [payload for _, _, payload in ordered]
+        self._sorted_ends = sorted(self._ends)
+        size = 1
+        while size < len(ordered):
+            size *= 2
+        self._size = size
+        tree = [float("-inf")] * (2 * size)
+        tree[size:size + len(self._ends)] = self._ends
+        for node in range(size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self._max_end = tree
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def count(self, lo: Optional[int] = None, hi: Optional[int] = None) -> int:
+        upto = len(self._starts) if hi is None else bisect.bisect_right(self._starts, hi)
+        before = 0 if lo is None else bisect.bisect_left(self._sorted_ends, lo)
+        return max(0, upto - before)
+
+    def overlap(self, lo: Optional[int] = None, hi: Optional[int] = None) -> List[T]:
+        """與 [lo, hi] 重疊的區間，依起點排序；lo / hi 為 None 表示不設限。"""
+        upto = len(self._starts) if hi is None else bisect.bisect_right(self._starts, hi)
+        if lo is None:
+            return self._payloads[:upto]
+        results: List[Any] = []
+        self._collect(1, 0, self._size, upto, lo, results)
+        return results
+
+    def _collect(self, node: int, left: int, right: int, upto: int, lo: int, results: List[Any]):
+        # 節點涵蓋 [left, right)；只走起點在範圍內、且子樹終點最大值 >= lo 的分支
+        if left >= upto or self._max_end[node] < lo:
+            return
+        if right - left == 1:
+            results.append(self._payloads[left])
+            return
+        middle = (left + right) // 2
+        self._collect(2 * node, left, middle, upto, lo, results)
+        self._collect(2 * node + 1, middle, right, upto, lo, results)
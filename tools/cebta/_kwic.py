@@ -0,0 +1,302 @@
+import asyncio
+import bisect
+import heapq
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from main import register_stats
+from tools.cebta._api import cbeta_get
+from tools.cebta._fulltext import local_fulltext
+from tools.cebta._mirror import mirror_store, parse_juan_html
+from tools.cebta._ngram import Hit, Hits, evaluate, normalize, parse_query
+from tools.cebta._singleflight import SingleFlight
+from tools.cebta._toc_index import get_toc_index
+from tools._profiler import trace_event
+
+# 本機 KWIC（cbeta_kwic_search）
+#
+# 單卷 KWIC 只需要卷文：卷文取自鏡像（_mirror），沒有鏡像時經 cbeta_get() 取 /juans（共用回應快取）再轉為純文字，
+# 解析後的卷以 LRU 保留 CBETA_KWIC_CACHE_JUANS 卷（含夾注與不含夾注各為一份）。查詢在本機完成：
+# - 卷文去除標點並逐字轉簡體（與 _ngram 相同），詞組以字串搜尋找出所有位置；單卷數萬字以內，
+#   直接掃描比建後綴陣列更快，也不必額外記憶體
+# - 語法同 _ngram：AND、|、NEAR/n、括號；另支援排除前後詞：「直心 -正直心 -直心是道場」
+#   （或上游的逗號寫法「直心,-正直心,-直心是道場」）表示命中的「直心」若落在「正直心」或「直心是道場」之內即不列入；
+#   逗號分隔的多個關鍵詞（如「老子,道」）本機不支援，supports() 回傳 False，由呼叫端改請求上游
+# - note=0 時卷文先去除夾注再查詢；mark=1 以 <mark> 標出命中；sort 為 f（依關鍵詞之後文字）、
+#   b（依關鍵詞之前文字，由近而遠）或 location（卷內位置）
+# - 可一次查整部佛典（省略 juan）或多部佛典；已建本機全文索引（_ngram）時先以索引剔除沒有命中的卷，
+#   其餘卷以 CBETA_KWIC_CONCURRENCY 並發載入並逐卷查詢，每卷查完只保留排序在前的 CBETA_KWIC_MAX_RESULTS 筆
+#   KWIC，不同時持有全部卷文；一次最多查詢 CBETA_KWIC_MAX_JUANS 卷（剔除後計）
+#
+# CBETA_KWIC_LOCAL=0 時改為逐卷請求上游 /search/kwic 並依序合併。
+
+KWIC_LOCAL = os.getenv("CBETA_KWIC_LOCAL", "1") == "1"
+KWIC_CACHE_JUANS = int(os.getenv("CBETA_KWIC_CACHE_JUANS", "128"))
+KWIC_CONCURRENCY = int(os.getenv("CBETA_KWIC_CONCURRENCY", "8"))
+KWIC_MAX_RESULTS = int(os.getenv("CBETA_KWIC_MAX_RESULTS", "10000"))
+KWIC_MAX_JUANS = int(os.getenv("CBETA_KWIC_MAX_JUANS", "1000"))
+KWIC_AROUND = 10
+
+SORTS = ("f", "b", "location")
+
+_EXCLUDE = re.compile(r'(?:^|(?<=\s))-("[^"]*"|[^\s"|!()]+)')
+# 引號以外的逗號
+_COMMA = re.compile(r'[,，](?=(?:[^"]*"[^"]*")*[^"]*$)')
+
+
+def split_exclusions(q: str) -> Tuple[str, List[str]]:
+    """
+    "直心 -正直心" 或 "直心,-正直心" → ("直心", ["正直心"])。
+
+    逗號分隔出多個關鍵詞（如 "老子,道"）時拋出 ValueError。
+    """
+    parts = [part.strip() for part in _COMMA.split(q or "")]
+    terms = [part for part in parts if part and not part.startswith("-")]
+    if len(terms) > 1:
+        raise ValueError("本機 KWIC 不支援逗號分隔的多個關鍵詞")
+    q = " ".join(terms + [part for part in parts if part.startswith("-")])
+    excluded = [m.group(1).strip('"') for m in _EXCLUDE.finditer(q)]
+    return _EXCLUDE.sub(" ", q).strip(), [t for t in excluded if t]
+
+
+def _strip_ranges(text: str, lines: List[List[Any]], ranges: List[List[int]]) -> Tuple[str, List[List[Any]]]:
+    """自卷文刪去 ranges（依序且不重疊），並調整行首位置；落在刪去範圍內的行首移到該範圍起點。"""
+    parts, cursor = [], 0
+    for start, end in ranges:
+        parts.append(text[cursor:start])
+        cursor = end
+    parts.append(text[cursor:])
+    starts = [start for start, _ in ranges]
+    removed = [0]  # 前 i 段共刪去的字數
+    for start, end in ranges:
+        removed.append(removed[-1] + end - start)
+
+    def moved(offset: int) -> int:
+        i = bisect.bisect_right(starts, offset)
+        if i and offset < ranges[i - 1][1]:
+            return ranges[i - 1][0] - removed[i - 1]
+        return offset - removed[i]
+
+    return "".join(parts), [[moved(offset), linehead] for offset, linehead in lines]
+
+
+class JuanText:
+    def __init__(self, work: str, juan: int, doc: Dict[str, Any], note: bool = True):
+        self.work = work
+        self.juan = juan
+        text, lines = doc.get("text") or "", doc.get("lines") or []
+        if not note and doc.get("notes"):
+            text, lines = _strip_ranges(text, lines, doc["notes"])
+        self.text = text
+        self._line_offsets = [offset for offset, _ in lines]
+        self._lineheads = [linehead for _, linehead in lines]
+        self.chars, self.offsets = normalize(text)
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def phrase(self, term: str, docs: Optional[Set[int]] = None) -> Hits:
+        key, _ = normalize(term)
+        if not key or (docs is not None and 0 not in docs):
+            return {}
+        hits, i = [], self.chars.find(key)
+        while i >= 0:
+            hits.append((i, len(key)))
+            i = self.chars.find(key, i + 1)
+        return {0: hits} if hits else {}
+
+    def hits(self, query: str, excluded: List[str]) -> List[Hit]:
+        found = evaluate(parse_query(query), self.phrase).get(0, [])
+        if found and excluded:
+            covers = [h for term in excluded for h in self.phrase(term).get(0, [])]
+            found = [(s, n) for s, n in found if not any(c <= s and s + n <= c + m for c, m in covers)]
+        return found
+
+    def linehead_at(self, offset: int) -> Optional[str]:
+        i = bisect.bisect_right(self._line_offsets, offset) - 1
+        return self._lineheads[i] if i >= 0 else (self._lineheads[0] if self._lineheads else None)
+
+    def kwic(self, hit: Hit, around: int, mark: bool) -> Dict[str, Any]:
+        start, length = hit
+        s, e = self.offsets[start], self.offsets[start + length - 1] + 1
+        word = self.text[s:e]
+        linehead = self.linehead_at(s)
+        file, _, lb = (linehead or "").partition("_p")
+        vol = re.match(r"^[A-Z]+\d+", file)
+        return {
+            "work": self.work,
+            "juan": self.juan,
+            "vol": vol.group(0) if vol else None,
+            "lb": lb or None,
+            "linehead": linehead,
+            "kwic": self.text[max(0, s - around):s] + (f"<mark>{word}</mark>" if mark else word) + self.text[e:e + around],
+        }
+
+    def sort_key(self, hit: Hit, sort: str, around: int):
+        start, length = hit
+        if sort == "b":
+            return self.chars[max(0, start - around):start][::-1]
+        if sort == "f":
+            return self.chars[start:start + length + around]
+        return start
+
+
+class KwicEngine:
+    def __init__(self, max_juans: int = KWIC_CACHE_JUANS):
+        self.max_juans = max_juans
+        self._juans: "OrderedDict[Tuple[str, int, bool], JuanText]" = OrderedDict()
+        self._loading = SingleFlight()
+        self.counters = {"queries": 0, "juans_searched": 0, "juans_pruned": 0, "cache_hits": 0,
+                         "mirror_loads": 0, "upstream_loads": 0, "upstream_queries": 0, "unsupported": 0,
+                         "too_many_juans": 0}
+
+    async def juan_text(self, work: str, juan: int, note: bool = True, mirror_only: bool = False) -> JuanText:
+        """解析後的卷文；mirror_only 時只讀鏡像，未鏡像即拋出 ValueError，不請求上游。"""
+        key = (work, int(juan), note)
+        item = self._juans.get(key)
+        if item is not None:
+            self._juans.move_to_end(key)
+            self.counters["cache_hits"] += 1
+            return item
+        return await self._loading.do(f"{work}:{juan}:{int(note)}:{int(mirror_only)}",
+                                      lambda: self._load(work, int(juan), note, mirror_only))
+
+    async def _load(self, work: str, juan: int, note: bool, mirror_only: bool = False) -> JuanText:
+        doc = await asyncio.get_running_loop().run_in_executor(None, mirror_store.load, work, juan)
+        if doc is not None:
+            self.counters["mirror_loads"] += 1
+        elif mirror_only:
+            raise ValueError(f"{work} 卷 {juan} 尚未鏡像")
+        else:
+            data = await cbeta_get("/juans", {"work": work, "juan": juan})
+            results = data.get("results") or []
+            if not results:
+                raise ValueError(f"查無 {work} 卷 {juan} 的內容")
+            doc = parse_juan_html(results[0].get("html") or "")
+            self.counters["upstream_loads"] += 1
+        item = JuanText(work, juan, doc, note)
+        self._juans[(work, juan, note)] = item
+        self._juans.move_to_end((work, juan, note))
+        while len(self._juans) > self.max_juans:
+            self._juans.popitem(last=False)
+        return item
+
+    async def targets(self, works: List[str], juan: Optional[int] = None) -> List[Tuple[str, int]]:
+        """(佛典, 卷) 列表；未指定卷時取該佛典目次中的全部卷。"""
+        if juan is not None:
+            return [(work, juan) for work in works]
+        indexes = await asyncio.gather(*(get_toc_index(work) for work in works))
+        return [(work, j) for work, index in zip(works, indexes) for j in (index.juans or [1])]
+
+    def supports(self, q: str) -> bool:
+        """本機能否回答此查詢；不支援的語法（如逗號分隔的多個關鍵詞）應改請求上游。"""
+        try:
+            parse_query(split_exclusions(q)[0])
+            return True
+        except ValueError:
+            self.counters["unsupported"] += 1
+            return False
+
+    def _check_size(self, targets: List[Tuple[str, int]]):
+        if len(targets) > KWIC_MAX_JUANS:
+            self.counters["too_many_juans"] += 1
+            raise ValueError(f"一次最多查詢 {KWIC_MAX_JUANS} 卷（此次 {len(targets)} 卷），請縮小範圍")
+
+    def _prune(self, targets: List[Tuple[str, int]], query: str, note: bool) -> List[Tuple[str, int]]:
+        """以本機全文索引剔除沒有命中的卷；索引未收錄的卷保留。"""
+        index = local_fulltext.current()
+        if index is None or len(targets) < 2:
+            return targets
+        ids = {target: index.doc_id(*target) for target in targets}
+        docs = {doc for doc in ids.values() if doc is not None}
+        if not docs:
+            return targets
+        matched = set(index.search(query, note=note, docs=docs))
+        kept = [t for t in targets if ids[t] is None or ids[t] in matched]
+        self.counters["juans_pruned"] += len(targets) - len(kept)
+        return kept
+
+    async def search(self, targets: List[Tuple[str, int]], q: str, note: bool = True, mark: bool = False,
+                     sort: str = "f", around: int = KWIC_AROUND) -> Dict[str, Any]:
+        """在各卷查詢 KWIC；回傳 {num_found, time, results, failed}，個別卷失敗不影響其他卷。"""
+        if sort not in SORTS:
+            raise ValueError(f"sort 僅支援 {', '.join(SORTS)}")
+        started = time.perf_counter()
+        query, excluded = split_exclusions(q)
+        parse_query(query)  # 語法錯誤時直接拋出
+        self.counters["queries"] += 1
+        targets = await asyncio.get_running_loop().run_in_executor(None, self._prune, targets, query, note)
+        self._check_size(targets)
+        gate = asyncio.Semaphore(max(1, KWIC_CONCURRENCY))
+        best: List[Tuple[Any, Dict[str, Any]]] = []  # (排序鍵, KWIC)，只保留前 KWIC_MAX_RESULTS 筆
+        failed: List[Tuple[int, Dict[str, Any]]] = []
+        found = 0
+
+        def first(entries):
+            return heapq.nsmallest(KWIC_MAX_RESULTS, entries, key=lambda entry: entry[0])
+
+        async def one(n, work, juan):
+            # 逐卷查完即只留下 KWIC，卷文不隨查詢累積（仍在 LRU 中）
+            nonlocal best, found
+            async with gate:
+                try:
+                    item = await self.juan_text(work, juan, note)
+                except Exception as e:
+                    failed.append((n, {"work": work, "juan": juan, "error": str(e)}))
+                    return
+                self.counters["juans_searched"] += 1
+                hits = item.hits(query, excluded)
+                if not hits:
+                    return
+                found += len(hits)
+                if sort == "location":
+                    keyed = [((n, hit[0]), hit) for hit in hits]
+                else:
+                    keyed = [((item.sort_key(hit, sort, around), n, hit[0]), hit) for hit in hits]
+                best = first(best + [(key, item.kwic(hit, around, mark)) for key, hit in first(keyed)])
+
+        await asyncio.gather(*(one(n, work, juan) for n, (work, juan) in enumerate(targets)))
+        elapsed = time.perf_counter() - started
+        trace_event("kwic_local", q=q, juans=len(targets), num_found=found, ms=round(elapsed * 1000, 2))
+        data = {"num_found": found, "time": round(elapsed, 6), "results": [kwic for _, kwic in best]}
+        if found > KWIC_MAX_RESULTS:
+            data["truncated"] = True
+        if failed:
+            data["failed"] = [item for _, item in sorted(failed, key=lambda f: f[0])]
+        return data
+
+    async def search_upstream(self, targets: List[Tuple[str, int]], params: Dict[str, Any]) -> Dict[str, Any]:
+        """逐卷請求 /search/kwic，依卷序合併；各筆補上 work、juan。"""
+        self._check_size(targets)
+        gate = asyncio.Semaphore(max(1, KWIC_CONCURRENCY))
+
+        async def one(work, juan):
+            async with gate:
+                self.counters["upstream_queries"] += 1
+                return await cbeta_get("/search/kwic", {**params, "work": work, "juan": juan}, timeout=10.0)
+
+        responses = await asyncio.gather(*(one(w, j) for w, j in targets), return_exceptions=True)
+        results, failed, elapsed = [], [], 0.0
+        for (work, juan), data in zip(targets, responses):
+            if isinstance(data, Exception):
+                failed.append({"work": work, "juan": juan, "error": str(data)})
+                continue
+            elapsed += float(data.get("time") or 0)
+            results.extend({"work": work, "juan": juan, **r} for r in data.get("results") or [])
+        data = {"num_found": len(results), "time": round(elapsed, 6), "results": results[:KWIC_MAX_RESULTS]}
+        if len(results) > KWIC_MAX_RESULTS:
+            data["truncated"] = True
+        if failed:
+            data["failed"] = failed
+        return data
+
+    def stats(self) -> dict:
+        return {**self.counters, "local": KWIC_LOCAL, "juans": len(self._juans), "max_juans": self.max_juans,
+                "max_target_juans": KWIC_MAX_JUANS}
+
+
+kwic_engine = KwicEngine()
+
+register_stats("cbeta_kwic", kwic_engine.stats)
@@ -0,0 +1,146 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+# 上游並發限流（AIMD 自適應視窗）
+#
+# 每個限流器維護一個並發視窗：
+# - 請求成功：視窗加法增長（約每一輪視窗 +1）
+# - 上游回應 429/503 或帶 Retry-After：視窗減半，並在 Retry-After 期間暫停發送（最多 CBETA_MAX_PAUSE 秒）
+# 全域限流器保護整個上游，端點限流器避免單一慢端點佔滿全部並發。
+
+MAX_CONCURRENCY = int(os.getenv("CBETA_MAX_CONCURRENCY", "32"))
+ENDPOINT_MAX_CONCURRENCY = int(os.getenv("CBETA_ENDPOINT_MAX_CONCURRENCY", "16"))
+MIN_CONCURRENCY = int(os.getenv("CBETA_MIN_CONCURRENCY", "1"))
+MAX_RETRIES = int(os.getenv("CBETA_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("CBETA_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("CBETA_RETRY_MAX_DELAY", "10"))
+# 上游 Retry-After 造成的全域暫停上限（秒），避免單一極長的 Retry-After 使所有請求停擺
+MAX_PAUSE = float(os.getenv("CBETA_MAX_PAUSE", "30"))
+
+# 視為上游過載、需要退避的狀態碼；502/504 只重試，不縮小視窗
+OVERLOAD_STATUS = {429, 503}
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After（秒數或 HTTP 日期），無法解析時回傳 None。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """指數退避 + full jitter；上游指定 Retry-After 時以其為下限。"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RETRY_MAX_DELAY))
+    return delay
+
+
+class AdaptiveLimiter:
+    def __init__(self, name: str, maximum: int, minimum: int = MIN_CONCURRENCY):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.window = float(self.maximum)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._cond = asyncio.Condition()
+        self.counters = {"throttled": 0, "decreases": 0}
+
+    async def acquire(self):
+        while True:
+            delay = self._paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._in_flight < int(self.window))
+            self._in_flight += 1
+
+    async def release(self, overloaded: bool = False, retry_after: Optional[float] = None):
+        async with self._cond:
+            self._in_flight -= 1
+            if overloaded:
+                self.counters["throttled"] += 1
+                self.counters["decreases"] += 1
+                self.window = max(float(self.minimum), self.window / 2)
+                if retry_after:
+                    pause = min(retry_after, MAX_PAUSE)
+                    self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            else:
+                self.window = min(float(self.maximum), self.window + 1 / self.window)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "window": round(self.window, 2),
+            "in_flight": self._in_flight,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+        }
+
+
+class Slot:
+    """一次上游請求的結果回報；在 limiter.slot() 內呼叫 observe()。"""
+
+    def __init__(self):
+        self.overloaded = False
+        self.retry_after: Optional[float] = None
+
+    def observe(self, status_code: int, retry_after_header: Optional[str] = None):
+        self.retry_after = parse_retry_after(retry_after_header)
+        self.overloaded = status_code in OVERLOAD_STATUS or (
+            self.retry_after is not None and status_code >= 400
+        )
+
+
+class UpstreamLimiter:
+    def __init__(self):
+        self.global_limiter = AdaptiveLimiter("global", MAX_CONCURRENCY)
+        self.endpoints: Dict[str, AdaptiveLimiter] = {}
+        self.retries = 0
+
+    def _endpoint(self, path: str) -> AdaptiveLimiter:
+        limiter = self.endpoints.get(path)
+        if limiter is None:
+            limiter = self.endpoints[path] = AdaptiveLimiter(path, ENDPOINT_MAX_CONCURRENCY)
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, path: str):
+        endpoint = self._endpoint(path)
+        await endpoint.acquire()
+        try:
+            await self.global_limiter.acquire()
+        except BaseException:
+            await endpoint.release()
+            raise
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            await self.global_limiter.release(slot.overloaded, slot.retry_after)
+            await endpoint.release(slot.overloaded, slot.retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "retries": self.retries,
+            "global": self.global_limiter.stats(),
+            "endpoints": {path: limiter.stats() for path, limiter in self.endpoints.items()},
+        }
+
+
+upstream_limiter = UpstreamLimiter()
@@ -0,0 +1,348 @@
+import asyncio
+import bisect
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from main import register_stats
+from tools.cebta._api import cbeta_get
+from tools.cebta._cache import ttl_for
+from tools.cebta._citation import LbKey, lb_key, split_linehead, parse_line_range
+from tools._profiler import trace_event
+
+# 行文區段快取（/lines）
+#
+# 依檔案（如 T01n0001）保存已取得的連續行段，每段記錄「已知完整」的行號區間 [lo, hi] 與區間內的各行：
+# - linehead_start ~ linehead_end：區間內已快取的部分直接取用，只對缺口請求上游，
+#   缺口兩端各與相鄰區段重疊一行，取回後與相鄰區段合併成一段
+# - linehead + before / after：行首所在區段前後不足的行數，以區段首行 before / 末行 after 補抓
+# - 區間有交集的區段一律合併；代理逐步擴大閱讀範圍時，每次只需一次上游請求取得新的部分
+# - 上游可能限制單次回傳的行數：回應不含缺口末行時，區段只記到實際取回的最後一行，其後下次再補抓；
+#   此次回應也只到該行為止（與上游截斷的結果一致，不留中間空缺）
+#
+# 行段不寫入回應快取（避免重複佔用），總行數超過 CBETA_LINE_CACHE_MAX_LINES 時以檔案為單位 LRU 淘汰，
+# 區段過期時間與 /lines 回應快取相同。跨檔案或無法辨識的請求照常轉送上游。
+
+LINE_CACHE_MAX_LINES = int(os.getenv("CBETA_LINE_CACHE_MAX_LINES", "200000"))
+
+# 批次取行：估計行距不超過 MERGE_GAP 的行段合併為一次請求，合併後估計不超過 MERGE_MAX_SPAN 行
+LINES_MERGE_GAP = int(os.getenv("CBETA_LINES_MERGE_GAP", "30"))
+LINES_MERGE_MAX_SPAN = int(os.getenv("CBETA_LINES_MERGE_MAX_SPAN", "600"))
+# 估計行距用的每欄行數（大正藏每頁 3 欄、每欄 29 行）；只影響合併與否，不影響結果正確性
+LINES_PER_COLUMN = 29
+
+
+class _Segment:
+    __slots__ = ("lo", "hi", "lo_linehead", "hi_linehead", "keys", "lines", "expires_at")
+
+    def __init__(self, lo: Tuple[LbKey, str], hi: Tuple[LbKey, str], lines: Dict[LbKey, Dict[str, Any]],
+                 expires_at: float):
+        self.lo, self.lo_linehead = lo
+        self.hi, self.hi_linehead = hi
+        self.keys = sorted(lines)
+        self.lines = lines
+        self.expires_at = expires_at
+
+    def covers(self, key: LbKey) -> bool:
+        return self.lo <= key <= self.hi
+
+
+def _file_lines(items: List[Dict[str, Any]]) -> Optional[Tuple[str, Dict[LbKey, Dict[str, Any]]]]:
+    """上游結果依檔案與行號整理；含多個檔案或無法解析的行首時回傳 None（不快取）。"""
+    file, lines = None, {}
+    for item in items:
+        try:
+            item_file, lb = split_linehead(item.get("linehead") or "")
+        except ValueError:
+            return None
+        if file is not None and item_file != file:
+            return None
+        file = item_file
+        lines[lb_key(lb)] = item
+    return (file, lines) if file else None
+
+
+class LineCache:
+    def __init__(self, max_lines: int = LINE_CACHE_MAX_LINES):
+        self.max_lines = max_lines
+        self._files: "OrderedDict[str, List[_Segment]]" = OrderedDict()  # 檔名 -> 依 lo 排序的區段
+        self._line_count = 0
+        self.counters = {
+            "hits": 0, "partial_hits": 0, "misses": 0, "bypass": 0,
+            "upstream_fetches": 0, "lines_fetched": 0, "lines_served": 0, "evictions": 0, "clamped": 0,
+        }
+
+    # ---------- 區段維護 ----------
+
+    def _segments(self, file: str) -> List[_Segment]:
+        segments = self._files.get(file)
+        if segments is None:
+            return []
+        now = time.time()
+        alive = [s for s in segments if s.expires_at > now]
+        if len(alive) != len(segments):
+            self._line_count -= sum(len(s.keys) for s in segments) - sum(len(s.keys) for s in alive)
+            self._files[file] = segments = alive
+        self._files.move_to_end(file)
+        return segments
+
+    def add(self, file: str, lo: Tuple[LbKey, str], hi: Tuple[LbKey, str], lines: Dict[LbKey, Dict[str, Any]]):
+        """加入已知完整的區間 [lo, hi]（(排序鍵, 行首)）及其各行，與有交集的區段合併。"""
+        segments = self._segments(file)
+        expires_at = time.time() + ttl_for("/lines")
+        kept, merged = [], []
+        for segment in segments:
+            (merged if segment.lo <= hi[0] and segment.hi >= lo[0] else kept).append(segment)
+        for segment in merged:
+            lo = min(lo, (segment.lo, segment.lo_linehead))
+            hi = max(hi, (segment.hi, segment.hi_linehead))
+            lines = {**segment.lines, **lines}
+            expires_at = min(expires_at, segment.expires_at)
+            self._line_count -= len(segment.keys)
+        new = _Segment(lo, hi, lines, expires_at)
+        kept.insert(bisect.bisect_left([s.lo for s in kept], new.lo), new)
+        self._files[file] = kept
+        self._files.move_to_end(file)
+        self._line_count += len(new.keys)
+        while self._line_count > self.max_lines and len(self._files) > 1:
+            _, evicted = self._files.popitem(last=False)
+            self._line_count -= sum(len(s.keys) for s in evicted)
+            self.counters["evictions"] += 1
+        return new
+
+    async def _fetch(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.counters["upstream_fetches"] += 1
+        data = await cbeta_get("/lines", params, use_cache=False)
+        results = list(data.get("results") or [])
+        self.counters["lines_fetched"] += len(results)
+        return results
+
+    def _respond(self, lines: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.counters["lines_served"] += len(lines)
+        return {"num_found": len(lines), "results": lines}
+
+    # ---------- 查詢 ----------
+
+    async def get_range(self, start: str, end: str) -> Optional[Dict[str, Any]]:
+        """linehead_start ~ linehead_end；跨檔案時回傳 None（由呼叫端直接請求上游）。"""
+        file, start_lb = split_linehead(start)
+        end_file, end_lb = split_linehead(end)
+        if end_file != file:
+            return None
+        lo, hi = (lb_key(start_lb), start), (lb_key(end_lb), end)
+        if lo[0] > hi[0]:
+            return None
+
+        # 缺口：未被任何區段涵蓋的部分，兩端與相鄰區段重疊一行以便合併
+        gaps = []
+        cursor, covered = lo, False
+        for segment in self._segments(file):
+            if segment.hi < lo[0] or segment.lo > hi[0]:
+                continue
+            if segment.lo > cursor[0]:
+                gaps.append((cursor, (segment.lo, segment.lo_linehead)))
+            if segment.hi >= cursor[0]:
+                cursor, covered = (segment.hi, segment.hi_linehead), True
+        if cursor[0] < hi[0] or not covered:
+            gaps.append((cursor, hi))
+
+        until = hi[0]  # 回應的最後一行；缺口被上游截斷時提前
+        if gaps:
+            self.counters["partial_hits" if len(gaps) > 1 or gaps[0] != (lo, hi) else "misses"] += 1
+            fetched = await asyncio.gather(*(
+                self._fetch({"linehead_start": a[1], "linehead_end": b[1]}) for a, b in gaps
+            ))
+            for (a, b), results in zip(gaps, fetched):
+                grouped = _file_lines(results)
+                if grouped is None:
+                    return None
+                lines = grouped[1]
+                if b[0] not in lines:
+                    last = max(lines)
+                    self.counters["clamped"] += 1
+                    until = min(until, max(last, a[0]))
+                    if last < a[0]:
+                        continue
+                    b = (last, lines[last]["linehead"])
+                self.add(file, a, b, lines)
+        else:
+            self.counters["hits"] += 1
+        trace_event("line_cache", file=file, mode="range", gaps=len(gaps))
+
+        # 有交集的區段都已合併，各區段互不重疊
+        lines = []
+        for segment in self._segments(file):
+            if segment.hi < lo[0] or segment.lo > until:
+                continue
+            i = bisect.bisect_left(segment.keys, lo[0])
+            j = bisect.bisect_right(segment.keys, until)
+            lines.extend(segment.lines[k] for k in segment.keys[i:j])
+        return self._respond(lines)
+
+    async def get_window(self, linehead: str, before: int = 0, after: int = 0) -> Optional[Dict[str, Any]]:
+        """linehead 前後各 before / after 行；行首不存在或結果跨檔案時回傳 None。"""
+        file, lb = split_linehead(linehead)
+        key = lb_key(lb)
+        segment = next((s for s in self._segments(file) if s.covers(key)), None)
+        fetches = []
+        if segment is None or key not in segment.lines:
+            fetches.append({"linehead": linehead, "before": before or None, "after": after or None})
+        else:
+            i = bisect.bisect_left(segment.keys, key)
+            if i < before:
+                first = segment.lines[segment.keys[0]]["linehead"]
+                fetches.append({"linehead": first, "before": before - i})
+            if len(segment.keys) - 1 - i < after:
+                last = segment.lines[segment.keys[-1]]["linehead"]
+                fetches.append({"linehead": last, "after": after - (len(segment.keys) - 1 - i)})
+
+        if fetches:
+            self.counters["partial_hits" if segment is not None and key in segment.lines else "misses"] += 1
+            fetched = await asyncio.gather(*(self._fetch(params) for params in fetches))
+            for results in fetched:
+                grouped = _file_lines(results)
+                if grouped is None or grouped[0] != file:
+                    return None
+                keys = sorted(grouped[1])
+                if not keys:
+                    continue
+                first, last = grouped[1][keys[0]], grouped[1][keys[-1]]
+                self.add(file, (keys[0], first["linehead"]), (keys[-1], last["linehead"]), grouped[1])
+        else:
+            self.counters["hits"] += 1
+        trace_event("line_cache", file=file, mode="window", fetches=len(fetches))
+
+        segment = next((s for s in self._segments(file) if s.covers(key)), None)
+        if segment is None or key not in segment.lines:
+            return None
+        i = bisect.bisect_left(segment.keys, key)
+        return self._respond([segment.lines[k] for k in segment.keys[max(0, i - before):i + after + 1]])
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "files": len(self._files),
+            "segments": sum(len(s) for s in self._files.values()),
+            "lines": self._line_count,
+            "max_lines": self.max_lines,
+        }
+
+
+line_cache = LineCache()
+
+
+async def query_lines(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    /lines 查詢入口：linehead（可帶 before / after）與 linehead_start ~ linehead_end 由行段快取回答，
+    其餘參數組合或快取無法處理時照常請求上游。回傳 {"num_found", "results"}。
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    keys = set(params)
+    result = None
+    try:
+        if keys == {"linehead_start", "linehead_end"}:
+            result = await line_cache.get_range(params["linehead_start"], params["linehead_end"])
+        elif "linehead" in keys and keys <= {"linehead", "before", "after"}:
+            result = await line_cache.get_window(params["linehead"], int(params.get("before") or 0),
+                                                 int(params.get("after") or 0))
+    except ValueError:  # 無法解析的行首交由上游判斷
+        result = None
+    if result is not None:
+        return result
+    line_cache.counters["bypass"] += 1
+    return await cbeta_get("/lines", params)
+
+
+def _line_number(key: LbKey) -> Optional[int]:
+    """行號的估計序號（頁 × 3 欄 × 每欄行數）；頁碼非數字時回傳 None。"""
+    page, col, line = key
+    if not page.isdigit() or not col:
+        return None
+    return (int(page) * 3 + ord(col) - ord("a")) * LINES_PER_COLUMN + line
+
+
+def _near(a: LbKey, b: LbKey, limit: int) -> bool:
+    """a <= b 且估計行距不超過 limit。"""
+    na, nb = _line_number(a), _line_number(b)
+    if na is None or nb is None:
+        return a[0] == b[0]
+    return nb - na <= limit
+
+
+def plan_line_ranges(ranges: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str, List[int]]]:
+    """
+    將行段 [(檔名, 起始行號, 結束行號), ...]（起始不晚於結束）依檔案與位置排序後，合併相鄰或相近者。
+
+    回傳 [(檔名, 起始行號, 結束行號, [原始行段序號, ...]), ...]。
+    """
+    order = sorted(range(len(ranges)), key=lambda i: (ranges[i][0], lb_key(ranges[i][1]), lb_key(ranges[i][2])))
+    blocks: List[Tuple[str, str, str, List[int]]] = []
+    for i in order:
+        file, start, end = ranges[i]
+        if blocks:
+            b_file, b_start, b_end, members = blocks[-1]
+            if (b_file == file and _near(lb_key(b_end), lb_key(start), LINES_MERGE_GAP)
+                    and _near(lb_key(b_start), max(lb_key(end), lb_key(b_end)), LINES_MERGE_MAX_SPAN)):
+                if lb_key(end) > lb_key(b_end):
+                    b_end = end
+                blocks[-1] = (b_file, b_start, b_end, members + [i])
+                continue
+        blocks.append((file, start, end, [i]))
+    return blocks
+
+
+async def query_line_batch(citations: List[str]) -> Dict[str, Any]:
+    """
+    批次取行：解析各則行段引用，合併成最少的 linehead_start ~ linehead_end 請求（經行段快取，只抓缺口），
+    並發取得後依原順序拆回各則引用。個別引用無法解析或取得時該項帶 error。
+    """
+    results: List[Dict[str, Any]] = [{"input": text} for text in citations]
+    ranges, valid = [], []
+    for i, result in enumerate(results):
+        try:
+            file, start, end = parse_line_range(result["input"])
+        except ValueError as e:
+            result["error"] = str(e)
+            continue
+        if lb_key(end) < lb_key(start):
+            start, end = end, start
+        result.update(linehead_start=f"{file}_p{start}", linehead_end=f"{file}_p{end}")
+        ranges.append((file, start, end))
+        valid.append(i)
+
+    blocks = plan_line_ranges(ranges)
+
+    async def fetch(block):
+        file, start, end, _ = block
+        params = {"linehead_start": f"{file}_p{start}", "linehead_end": f"{file}_p{end}"}
+        return await query_lines(params)
+
+    fetched = await asyncio.gather(*(fetch(block) for block in blocks), return_exceptions=True)
+    for (file, _, _, members), data in zip(blocks, fetched):
+        if isinstance(data, Exception):
+            for member in members:
+                results[valid[member]]["error"] = f"{type(data).__name__}: {data}"
+            continue
+        keyed = []
+        for line in data.get("results") or []:
+            try:
+                keyed.append((lb_key(split_linehead(line.get("linehead") or "")[1]), line))
+            except ValueError:
+                continue
+        keys = [key for key, _ in keyed]
+        for member in members:
+            _, start, end = ranges[member]
+            lo = bisect.bisect_left(keys, lb_key(start))
+            hi = bisect.bisect_right(keys, lb_key(end))
+            lines = [line for _, line in keyed[lo:hi]]
+            results[valid[member]].update(num_found=len(lines), results=lines)
+    trace_event("line_batch", citations=len(citations), requests=len(blocks))
+    return {
+        "num_found": len(results),
+        "requests": len(blocks),
+        "failed": sum(1 for r in results if "error" in r),
+        "results": results,
+    }
+
+
+register_stats("cbeta_line_cache", line_cache.stats)
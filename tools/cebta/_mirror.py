@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import gzip
+import html as html_lib
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# CBETA 卷文本機鏡像
+#
+# 把 /juans 的卷 HTML 轉成純文字存到 CBETA_MIRROR_DIR（每卷一個 gzip JSON：{目錄}/{佛典}/{佛典}_{卷:03d}.json.gz），
+# 供本機全文索引（_ngram）與 KWIC 等離線功能使用：
+# - text：去除標籤後的卷文（保留標點，不含卷末校注區與版權區）
+# - lines：[[text 內位置, 行首], ...]，由 <span class='lb' id='...'> 取得，可把位置換回行首
+# - notes：[[起, 迄), ...]，夾注（雙行小注）在 text 內的範圍，供「不含夾注」的查詢排除
+#
+# 鏡像以命令列建立（服務端與命令列預設同為 cbeta_mirror 目錄，不存在時視為尚未鏡像）：
+#   python -m tools.cebta._mirror T0001 T0099        # 指定佛典
+#   python -m tools.cebta._mirror --canon T           # 整部藏經
+# 已存在的卷預設略過，--refresh 重新下載。命令列以自己的 httpx 客戶端與 _limiter 限流器請求
+# CBETA_API_BASE（429/5xx 與連線錯誤退避重試），不經 cbeta_get()；本模組不匯入 main。
+
+MIRROR_DIR = os.getenv("CBETA_MIRROR_DIR", "cbeta_mirror")  # 空字串停用
+MIRROR_CONCURRENCY = int(os.getenv("CBETA_MIRROR_CONCURRENCY", "4"))
+MIRROR_CACHE_JUANS = int(os.getenv("CBETA_MIRROR_CACHE_JUANS", "256"))
+
+_TOKEN = re.compile(r"<!--.*?-->|<(/?)([a-zA-Z][\w-]*)([^>]*)>|([^<]+)", re.S)
+_CLASS = re.compile(r"""\bclass=["']([^"']*)["']""")
+_ID = re.compile(r"""\bid=["']([^"']*)["']""")
+
+VOID_TAGS = {"br", "img", "hr", "meta", "input", "link", "wbr", "col", "area", "source"}
+# 整段不計入卷文的元素（class 或 id）
+SKIP_CLASSES = {"lineInfo", "noteAnchor", "juan-info"}
+SKIP_IDS = {"back", "cbeta-copyright"}
+SKIP_TAGS = {"script", "style"}
+# 夾注
+NOTE_CLASSES = {"doube-line-note", "inline-note", "note-inline"}
+
+
+def indexable(ch: str) -> bool:
+    """計入索引與查詢的字元：文字與數字（含 CJK 擴充區），不含標點、空白與符號。"""
+    return unicodedata.category(ch)[0] in "LN"
+
+
+def parse_juan_html(html: str) -> Dict[str, Any]:
+    """卷 HTML → {"text", "lines", "notes"}，見模組說明。"""
+    parts: List[str] = []
+    size = 0
+    lines: List[List[Any]] = []
+    notes: List[List[int]] = []
+    stack: List[Tuple[str, Optional[str]]] = []  # (標籤, "skip" / "note" / None)
+    note_start = None
+    for match in _TOKEN.finditer(html or ""):
+        closing, tag, attrs, text = match.groups()
+        mode = stack[-1][1] if stack else None
+        if text is not None:
+            if mode != "skip":
+                text = html_lib.unescape(text)
+                parts.append(text)
+                size += len(text)
+            continue
+        if tag is None:  # 註解
+            continue
+        tag = tag.lower()
+        if closing:
+            while stack:
+                name, _ = stack.pop()
+                if name == tag:
+                    break
+            if mode == "note" and (not stack or stack[-1][1] != "note") and note_start is not None:
+                if size > note_start:
+                    notes.append([note_start, size])
+                note_start = None
+            continue
+        classes = set(_CLASS.search(attrs).group(1).split()) if "class" in attrs else set()
+        ident = _ID.search(attrs)
+        if tag == "span" and "lb" in classes and ident and mode != "skip":
+            lines.append([size, ident.group(1)])
+        if tag in VOID_TAGS or attrs.rstrip().endswith("/"):
+            continue
+        if mode != "skip" and (tag in SKIP_TAGS or classes & SKIP_CLASSES or (ident and ident.group(1) in SKIP_IDS)):
+            mode = "skip"
+        elif mode is None and classes & NOTE_CLASSES:
+            mode = "note"
+            note_start = size
+        stack.append((tag, mode))
+    return {"text": "".join(parts), "lines": lines, "notes": notes}
+
+
+class MirrorStore:
+    def __init__(self, root: str = MIRROR_DIR, cache_juans: int = MIRROR_CACHE_JUANS):
+        self.root = root
+        self.cache_juans = cache_juans
+        self._cache: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()  # 查詢在執行緒池中讀取
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def path(self, work: str, juan: int) -> str:
+        return os.path.join(self.root, work, f"{work}_{int(juan):03d}.json.gz")
+
+    def has(self, work: str, juan: int) -> bool:
+        return self.enabled and os.path.exists(self.path(work, juan))
+
+    def save(self, work: str, juan: int, doc: Dict[str, Any]):
+        path = self.path(work, juan)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"work": work, "juan": int(juan), "saved_at": time.time(), **doc}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        with self._lock:
+            self._cache.pop((work, int(juan)), None)
+
+    def load(self, work: str, juan: int) -> Optional[Dict[str, Any]]:
+        """讀取一卷（LRU 保留最近 cache_juans 卷）；未鏡像時回傳 None。回傳物件只可讀取。"""
+        key = (work, int(juan))
+        with self._lock:
+            doc = self._cache.get(key)
+            if doc is not None:
+                self._cache.move_to_end(key)
+                return doc
+        if not self.has(work, juan):
+            return None
+        with gzip.open(self.path(work, juan), "rt", encoding="utf-8") as f:
+            doc = json.load(f)
+        with self._lock:
+            self._cache[key] = doc
+            while len(self._cache) > self.cache_juans:
+                self._cache.popitem(last=False)
+        return doc
+
+    def juans(self, work: Optional[str] = None) -> List[Tuple[str, int]]:
+        """已鏡像的 (佛典, 卷)，依佛典、卷號排序。"""
+        if not self.enabled or not os.path.isdir(self.root):
+            return []
+        works = [work] if work else sorted(os.listdir(self.root))
+        found = []
+        for w in works:
+            folder = os.path.join(self.root, w)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                stem, _, juan = name[: -len(".json.gz")].rpartition("_") if name.endswith(".json.gz") else ("", "", "")
+                if stem == w and juan.isdigit():
+                    found.append((w, int(juan)))
+        return sorted(found)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for work, juan in self.juans():
+            with gzip.open(self.path(work, juan), "rt", encoding="utf-8") as f:
+                yield json.load(f)
+
+
+mirror_store = MirrorStore()
+
+
+# ---------- 下載 ----------
+
+Fetch = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+async def mirror_work(work: str, store: MirrorStore, fetch: Fetch, refresh: bool = False) -> Dict[str, Any]:
+    """下載一部佛典的各卷（卷列表取自 /toc）；回傳 {"work", "saved", "skipped", "failed"}。"""
+    toc = await fetch("/toc", {"work": work})
+    results = toc.get("results") or []
+    juans = sorted({int(item["juan"]) for item in (results[0].get("juan") or []) if item.get("juan")}) if results else []
+    report = {"work": work, "saved": 0, "skipped": 0, "failed": []}
+    for juan in juans or [1]:
+        if not refresh and store.has(work, juan):
+            report["skipped"] += 1
+            continue
+        try:
+            data = await fetch("/juans", {"work": work, "juan": juan}, use_cache=False)
+            found = data.get("results") or []
+            if not found:
+                raise ValueError("查無此卷內容")
+            store.save(work, juan, parse_juan_html(found[0].get("html") or ""))
+            report["saved"] += 1
+        except Exception as e:
+            report["failed"].append({"juan": juan, "error": str(e)})
+    return report
+
+
+async def mirror_works(works: List[str], store: MirrorStore, fetch: Fetch, refresh: bool = False,
+                       concurrency: int = MIRROR_CONCURRENCY) -> List[Dict[str, Any]]:
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(work):
+        async with gate:
+            try:
+                report = await mirror_work(work, store, fetch, refresh)
+            except Exception as e:
+                report = {"work": work, "saved": 0, "skipped": 0, "failed": [{"error": str(e)}]}
+            print(f"{work}: 新增 {report['saved']} 卷，略過 {report['skipped']} 卷，失敗 {len(report['failed'])} 卷")
+            return report
+
+    return list(await asyncio.gather(*(one(w) for w in works)))
+
+
+def http_fetch(client, base: str) -> Fetch:
+    """命令列用的上游請求：獨立的限流器，429/5xx 與連線錯誤以退避重試，回傳 JSON。"""
+    import httpx
+    from tools.cebta._limiter import UpstreamLimiter, backoff_delay, MAX_RETRIES, RETRYABLE_STATUS
+
+    limiter = UpstreamLimiter()
+
+    async def fetch(path: str, params: Optional[Dict[str, Any]] = None, **_) -> Dict[str, Any]:
+        for attempt in range(MAX_RETRIES + 1):
+            resp = None
+            async with limiter.slot(path) as slot:
+                try:
+                    resp = await client.get(base + path, params=params)
+                except httpx.TransportError:
+                    if attempt == MAX_RETRIES:
+                        raise
+                else:
+                    slot.observe(resp.status_code, resp.headers.get("Retry-After"))
+            if resp is not None and (resp.status_code not in RETRYABLE_STATUS or attempt == MAX_RETRIES):
+                break
+            await asyncio.sleep(backoff_delay(attempt, slot.retry_after))
+        resp.raise_for_status()
+        return resp.json()
+
+    return fetch
+
+
+async def _run(args):
+    import httpx
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(60, connect=10)) as client:
+        fetch = http_fetch(client, args.base.rstrip("/"))
+        works = list(args.works)
+        for canon in args.canon or []:
+            data = await fetch("/works", {"canon": canon, "vol_start": 1, "vol_end": 999})
+            works += [w["work"] for w in data.get("results") or [] if w.get("work")]
+        if not works:
+            print("請指定佛典編號或 --canon")
+            return
+        await mirror_works(works, MirrorStore(args.dir), fetch, args.refresh, args.concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="下載 CBETA 卷文至本機鏡像")
+    parser.add_argument("works", nargs="*", help="佛典編號，如 T0001")
+    parser.add_argument("--canon", action="append", help="整部藏經，如 T（可重複）")
+    parser.add_argument("--dir", default=MIRROR_DIR or "cbeta_mirror")
+    parser.add_argument("--base", default=os.getenv("CBETA_API_BASE", "https://api.cbetaonline.cn"),
+                        help="上游位址（預設同 CBETA_API_BASE）")
+    parser.add_argument("--refresh", action="store_true", help="重新下載已存在的卷")
+    parser.add_argument("--concurrency", type=int, default=MIRROR_CONCURRENCY)
+    args = parser.parse_args()
+    sys.path.insert(0, os.getcwd())
+    asyncio.run(_run(args))
@@ -0,0 +1,433 @@
+import argparse
+import bisect
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from tools.cebta._mirror import MIRROR_DIR, MirrorStore, indexable
+from tools.cebta._zhconv import fold, fold_mode
+
+# 本機全文 n-gram 索引
+#
+# 以鏡像卷文（_mirror）建立字元二元組（bigram）倒排索引，存於 SQLite（CBETA_FULLTEXT_DB）：
+# - 文件為「卷」；卷文先去除標點空白，再逐字轉為簡體（_zhconv.fold），繁簡查詢皆可命中
+# - postings(gram, seg, data)：每個二元組一份壓縮的位置清單，依文件遞增排列，
+#   每份文件記為 varint(文件差值) varint(次數) varint(位置區塊位元組數) + 位置差值 varint；
+#   位元組數讓只需要部分文件時可跳過其餘位置。建索引時每累積 CBETA_FULLTEXT_FLUSH 個位置寫出一段（seg），
+#   記憶體用量與藏經大小無關，整部大正藏約數分鐘可建完
+# - meta 記錄建立時的繁簡轉換方式（_zhconv.fold_mode()）；與執行時不同（opencc / 內建對照表）會漏掉命中，
+#   故載入時方式不同即拒絕載入，只有 opencc 版本不同時提出警告
+# - 卷末字另記為「字 + \0」，單字查詢以字首範圍掃描所有以該字開頭的二元組
+#
+# 查詢：
+# - 詞組：取覆蓋全部字元的二元組（位移 0, 2, 4, … 與最後一組），由最少見者開始依文件交集，再比對位置，結果為精確比對
+# - 擴充語法（同 /search/extended）："法鼓" "聖嚴"（AND）、"波羅蜜" | "波羅密"（OR）、
+#   "迦葉" !"迦葉佛"（NOT，以卷為單位排除）、"法鼓" NEAR/7 "迦葉"（兩詞間隔不超過 7 字）、括號分組；
+#   未加引號的詞亦可
+# - note=False 時略過落在夾注內的命中
+# 結果為 {文件: [(位置, 長度), ...]}，位置以去除標點後的字元計。
+#
+# 建立索引（寫入暫存檔後替換，服務端會自動改用新檔）：
+#   python -m tools.cebta._ngram --mirror cbeta_mirror --db cbeta_fulltext.sqlite3
+
+FULLTEXT_DB = os.getenv("CBETA_FULLTEXT_DB", "cbeta_fulltext.sqlite3")
+FULLTEXT_FLUSH = int(os.getenv("CBETA_FULLTEXT_FLUSH", "20000000"))
+
+END = "\0"  # 卷末字的第二字
+
+Hit = Tuple[int, int]  # (位置, 長度)
+Hits = Dict[int, List[Hit]]
+
+
+@lru_cache(maxsize=None)
+def _fold_char(ch: str) -> str:
+    folded = fold(ch)
+    return folded if len(folded) == 1 else ch
+
+
+def normalize(text: str) -> Tuple[str, List[int]]:
+    """去除標點空白並逐字轉簡體，回傳 (索引字串, 各字在原文的位置)。"""
+    offsets = [i for i, ch in enumerate(text) if indexable(ch)]
+    return "".join(_fold_char(text[i]) for i in offsets), offsets
+
+
+def compact_ranges(ranges: List[List[int]], offsets: List[int]) -> List[List[int]]:
+    """原文範圍 [起, 迄) → 索引字串範圍。"""
+    result = []
+    for start, end in ranges:
+        lo, hi = bisect.bisect_left(offsets, start), bisect.bisect_left(offsets, end)
+        if hi > lo:
+            result.append([lo, hi])
+    return result
+
+
+# ---------- 壓縮 ----------
+
+def _put(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get(data: bytes, i: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[i]
+        i += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, i
+        shift += 7
+
+
+def encode_positions(positions: List[int]) -> bytes:
+    out = bytearray()
+    last = 0
+    for p in positions:
+        _put(out, p - last)
+        last = p
+    return bytes(out)
+
+
+def decode_postings(blobs: Iterable[bytes], docs: Optional[Set[int]] = None) -> Dict[int, List[int]]:
+    """解開一個二元組的各段位置清單；docs 指定時只解開這些文件的位置。"""
+    result: Dict[int, List[int]] = {}
+    for data in blobs:
+        i, doc, size = 0, -1, len(data)
+        while i < size:
+            delta, i = _get(data, i)
+            doc += delta
+            count, i = _get(data, i)
+            nbytes, i = _get(data, i)
+            end = i + nbytes
+            if docs is None or doc in docs:
+                positions, p = [], 0
+                for _ in range(count):
+                    delta, i = _get(data, i)
+                    p += delta
+                    positions.append(p)
+                result[doc] = positions
+            i = end
+    return result
+
+
+# ---------- 建立 ----------
+
+def build_index(store: MirrorStore, db_path: str = FULLTEXT_DB, flush: int = FULLTEXT_FLUSH) -> Dict[str, Any]:
+    """由鏡像建立索引，寫入 db_path（先寫暫存檔再替換）；回傳統計。"""
+    started = time.time()
+    tmp = db_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    db.execute("CREATE TABLE docs (id INTEGER PRIMARY KEY, work TEXT, juan INTEGER, chars INTEGER, notes TEXT)")
+    db.execute("CREATE TABLE postings (gram TEXT, seg INTEGER, data BLOB, PRIMARY KEY (gram, seg)) WITHOUT ROWID")
+
+    buffers: Dict[str, bytearray] = {}
+    last_doc: Dict[str, int] = {}
+    pending = seg = docs = chars = 0
+
+    def write_segment():
+        db.executemany("INSERT INTO postings VALUES (?, ?, ?)", ((g, seg, bytes(b)) for g, b in buffers.items()))
+        db.commit()
+        buffers.clear()
+        last_doc.clear()
+
+    for doc in store:
+        text, offsets = normalize(doc.get("text") or "")
+        db.execute("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", (
+            docs, doc["work"], doc["juan"], len(text), json.dumps(compact_ranges(doc.get("notes") or [], offsets))))
+        grams: Dict[str, List[int]] = {}
+        for i in range(len(text) - 1):
+            grams.setdefault(text[i:i + 2], []).append(i)
+        if text:
+            grams.setdefault(text[-1] + END, []).append(len(text) - 1)
+        for gram, positions in grams.items():
+            out = buffers.get(gram)
+            if out is None:
+                out = buffers[gram] = bytearray()
+            packed = encode_positions(positions)
+            _put(out, docs - last_doc.get(gram, -1))
+            _put(out, len(positions))
+            _put(out, len(packed))
+            out += packed
+            last_doc[gram] = docs
+        docs += 1
+        chars += len(text)
+        pending += len(text)
+        if pending >= flush:
+            write_segment()
+            seg += 1
+            pending = 0
+    write_segment()
+    stats = {"docs": docs, "chars": chars, "segments": seg + 1, "built_at": time.time(),
+             "seconds": round(time.time() - started, 1), "fold": fold_mode()}
+    db.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in stats.items()])
+    db.commit()
+    db.close()
+    os.replace(tmp, db_path)
+    return stats
+
+
+# ---------- 查詢語法 ----------
+
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\|)|(!)|(\()|(\))|NEAR/(\d+)|([^\s"|!()]+)')
+
+
+def parse_query(query: str):
+    """擴充查詢語法 → 語法樹：("term", 詞) / ("and", [...]) / ("or", [...]) / ("not", 子樹) / ("near", 左, 右, 距離)。"""
+    tokens = []
+    for match in _QUERY_TOKEN.finditer(query or ""):
+        phrase, bar, bang, lparen, rparen, near, word = match.groups()
+        if phrase is not None or word is not None:
+            tokens.append(("term", phrase if phrase is not None else word))
+        elif near is not None:
+            tokens.append(("near", int(near)))
+        else:
+            tokens.append(((bar or bang or lparen or rparen), None))
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def expr():
+        nonlocal pos
+        items = [conjunction()]
+        while peek() == "|":
+            pos += 1
+            items.append(conjunction())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def conjunction():
+        items = [unary()]
+        while peek() in ("term", "!", "("):
+            items.append(unary())
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def unary():
+        nonlocal pos
+        if peek() == "!":
+            pos += 1
+            return ("not", unary())
+        node = atom()
+        while peek() == "near":
+            distance = tokens[pos][1]
+            pos += 1
+            node = ("near", node, atom(), distance)
+        return node
+
+    def atom():
+        nonlocal pos
+        kind = peek()
+        if kind == "term":
+            pos += 1
+            return ("term", tokens[pos - 1][1])
+        if kind == "(":
+            pos += 1
+            node = expr()
+            if peek() != ")":
+                raise ValueError("查詢語法錯誤：括號未閉合")
+            pos += 1
+            return node
+        raise ValueError(f"查詢語法錯誤：{query}")
+
+    if not tokens:
+        raise ValueError("查詢字串為空")
+    tree = expr()
+    if pos != len(tokens):
+        raise ValueError(f"查詢語法錯誤：{query}")
+    _check_not(tree)
+    return tree
+
+
+def _check_not(tree):
+    """NOT 只能出現在含肯定詞的 AND 之內（以卷為單位排除）；單獨的 NOT 無法求值，拋出 ValueError。"""
+    kind = tree[0]
+    if kind == "not":
+        raise ValueError("NOT 查詢需搭配至少一個肯定詞")
+    if kind == "or":
+        for child in tree[1]:
+            _check_not(child)
+    elif kind == "and":
+        positives = [child for child in tree[1] if child[0] != "not"]
+        if not positives:
+            raise ValueError("NOT 查詢需搭配至少一個肯定詞")
+        for child in positives + [child[1] for child in tree[1] if child[0] == "not"]:
+            _check_not(child)
+    elif kind == "near":
+        _check_not(tree[1])
+        _check_not(tree[2])
+
+
+def _merge(lists: Iterable[List[Hit]]) -> List[Hit]:
+    return sorted(set(hit for hits in lists for hit in hits))
+
+
+def _near(left: List[Hit], right: List[Hit], distance: int) -> List[Hit]:
+    """兩組命中中，間隔不超過 distance 字（重疊亦算）的命中。"""
+    if not left or not right:
+        return []
+    starts = [start for start, _ in right]
+    longest = max(length for _, length in right)
+    kept = set()
+    for a, a_len in left:
+        lo = bisect.bisect_left(starts, a - distance - longest)
+        hi = bisect.bisect_right(starts, a + a_len + distance)
+        for b, b_len in right[lo:hi]:
+            if b <= a + a_len + distance and b + b_len >= a - distance:
+                kept.add((a, a_len))
+                kept.add((b, b_len))
+    return sorted(kept)
+
+
+def evaluate(tree, phrase: Callable[[str, Optional[Set[int]]], Hits], docs: Optional[Set[int]] = None) -> Hits:
+    """
+    對語法樹求值；phrase(詞, 文件集合或 None) 回傳該詞的命中，由索引（或單卷文字）提供。
+
+    AND 依序縮小文件範圍，NOT 以文件為單位排除，NEAR 保留彼此相距不超過距離的命中。
+    """
+    kind = tree[0]
+    if kind == "term":
+        return phrase(tree[1], docs)
+    if kind == "or":
+        parts = [evaluate(child, phrase, docs) for child in tree[1]]
+        return {doc: _merge(p.get(doc, []) for p in parts) for doc in set().union(*parts)}
+    if kind == "and":
+        positives = [child for child in tree[1] if child[0] != "not"]
+        negatives = [child[1] for child in tree[1] if child[0] == "not"]
+        if not positives:
+            raise ValueError("NOT 查詢需搭配至少一個肯定詞")
+        parts = []
+        for child in positives:
+            part = evaluate(child, phrase, docs)
+            docs = set(part) if docs is None else docs & set(part)
+            parts.append(part)
+            if not docs:
+                return {}
+        for child in negatives:
+            docs -= set(evaluate(child, phrase, docs))
+        return {doc: _merge(p[doc] for p in parts) for doc in docs}
+    if kind == "near":
+        left = evaluate(tree[1], phrase, docs)
+        right = evaluate(tree[2], phrase, set(left)) if left else {}
+        hits = {doc: _near(left[doc], right[doc], tree[3]) for doc in set(left) & set(right)}
+        return {doc: doc_hits for doc, doc_hits in hits.items() if doc_hits}
+    raise ValueError("NOT 查詢需搭配至少一個肯定詞")
+
+
+# ---------- 索引 ----------
+
+class NgramIndex:
+    def __init__(self, db_path: str = FULLTEXT_DB):
+        self.path = db_path
+        self.mtime = os.path.getmtime(db_path)
+        self._db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        rows = self._db.execute("SELECT id, work, juan, chars, notes FROM docs ORDER BY id").fetchall()
+        self.works = [row[1] for row in rows]
+        self.juans = [row[2] for row in rows]
+        self.chars = [row[3] for row in rows]
+        self._notes = [json.loads(row[4]) if row[4] and row[4] != "[]" else None for row in rows]
+        self._doc_ids = {(row[1], row[2]): row[0] for row in rows}
+        self.meta = {k: json.loads(v) for k, v in self._db.execute("SELECT key, value FROM meta")}
+        self._check_fold()
+
+    def __len__(self) -> int:
+        return len(self.works)
+
+    def _check_fold(self):
+        built, current = self.meta.get("fold") or {}, fold_mode()
+        if built.get("mode") != current["mode"]:
+            self._db.close()
+            raise ValueError(f"索引以繁簡轉換 {built.get('mode') or '（未記錄）'} 建立，"
+                             f"目前為 {current['mode']}，查詢會漏掉命中，請重新建立索引")
+        if built.get("version") != current["version"]:
+            print(f"⚠️ 本機全文索引以 {built['mode']} {built.get('version')} 建立，目前為 {current['version']}，"
+                  "轉換結果可能略有不同，建議重新建立索引")
+
+    def close(self):
+        self._db.close()
+
+    def doc_id(self, work: str, juan: int) -> Optional[int]:
+        return self._doc_ids.get((work, int(juan)))
+
+    def _blobs(self, gram: str) -> List[bytes]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT data FROM postings WHERE gram = ? ORDER BY seg", (gram,))]
+
+    def postings(self, gram: str, docs: Optional[Set[int]] = None) -> Dict[int, List[int]]:
+        """二元組在各文件的位置（索引字串座標）。"""
+        return decode_postings(self._blobs(gram), docs)
+
+    def gram_size(self, gram: str) -> int:
+        """二元組位置清單的壓縮後位元組數，用來估計出現頻率。"""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM postings WHERE gram = ?", (gram,)).fetchone()[0]
+
+    def _prefixed(self, ch: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT DISTINCT gram FROM postings WHERE gram >= ? AND gram < ?", (ch, ch + "\U0010ffff"))]
+
+    def _in_note(self, doc: int, position: int) -> bool:
+        notes = self._notes[doc]
+        if not notes:
+            return False
+        i = bisect.bisect_right(notes, [position, float("inf")]) - 1
+        return i >= 0 and notes[i][0] <= position < notes[i][1]
+
+    def phrase(self, term: str, docs: Optional[Set[int]] = None, note: bool = True) -> Hits:
+        """詞組的精確命中；docs 指定時只查這些文件。"""
+        text, _ = normalize(term)
+        if not text:
+            return {}
+        if len(text) == 1:
+            found: Dict[int, List[int]] = {}
+            for gram in self._prefixed(text):
+                for doc, positions in self.postings(gram, docs).items():
+                    found.setdefault(doc, []).extend(positions)
+            hits = {doc: [(p, 1) for p in sorted(set(positions))] for doc, positions in found.items()}
+        else:
+            shifts = list(range(0, len(text) - 1, 2))
+            if shifts[-1] != len(text) - 2:
+                shifts.append(len(text) - 2)
+            grams = sorted(((self.gram_size(text[s:s + 2]), s) for s in shifts))
+            candidates: Dict[int, Set[int]] = {}  # 文件 → 詞組起點
+            for n, (_, shift) in enumerate(grams):
+                postings = self.postings(text[shift:shift + 2], docs if n == 0 else set(candidates))
+                if n == 0:
+                    candidates = {doc: {p - shift for p in positions} for doc, positions in postings.items()}
+                else:
+                    candidates = {doc: starts & {p - shift for p in postings[doc]}
+                                  for doc, starts in candidates.items() if doc in postings}
+                    candidates = {doc: starts for doc, starts in candidates.items() if starts}
+                if not candidates:
+                    return {}
+            hits = {doc: [(p, len(text)) for p in sorted(starts)] for doc, starts in candidates.items()}
+        if not note:
+            hits = {doc: [h for h in doc_hits if not self._in_note(doc, h[0])] for doc, doc_hits in hits.items()}
+            hits = {doc: doc_hits for doc, doc_hits in hits.items() if doc_hits}
+        return hits
+
+    def search(self, query: str, note: bool = True, docs: Optional[Set[int]] = None) -> Hits:
+        """以擴充語法查詢；回傳 {文件: 依位置排序的命中}。"""
+        return evaluate(parse_query(query), lambda term, subset: self.phrase(term, subset, note), docs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="由本機鏡像建立 CBETA 全文 n-gram 索引")
+    parser.add_argument("--mirror", default=MIRROR_DIR or "cbeta_mirror")
+    parser.add_argument("--db", default=FULLTEXT_DB)
+    parser.add_argument("--flush", type=int, default=FULLTEXT_FLUSH)
+    args = parser.parse_args()
+    sys.path.insert(0, os.getcwd())
+    print(build_index(MirrorStore(args.mirror, cache_juans=0), args.db, args.flush))
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from main import register_stats
+from tools._profiler import trace_event
+
+# 搜尋結果自動翻頁
+#
+# 上游搜尋端點只有 rows / start 分頁，要取得全部命中須逐頁請求。這裡先取第一頁得知總數
+# （num_found、total 或 response.numFound），其餘頁以 CBETA_PAGINATE_CONCURRENCY 並發請求：
+# - iter_pages() 為非同步產生器，依頁序逐頁產出（某頁與其之前各頁都完成即產出），
+#   呼叫端可邊收邊處理；中途停止時未完成的請求一併取消
+# - paginate() 收齊各頁，依頁序合併並去除重複（有 id 者依 id，否則依整筆內容），
+#   最多 max_results 筆（不超過 CBETA_PAGINATE_MAX_RESULTS），回傳與第一頁相同的結構，
+#   另帶 fetched、pages 與 truncated / failed；每頁完成時記一筆 trace_event，
+#   並以 progress(已取得筆數, 預計筆數) 回報進度——工具傳入 report_to(ctx)，經 MCP 進度通知送到呼叫端
+#   （呼叫端請求帶 progressToken 時才會送出；回報失敗不影響翻頁）
+# 上游實際每頁筆數少於請求時（有每頁上限），之後各頁改以實際筆數切分，避免漏掉結果。
+# 請求經呼叫端提供的 fetch(start, rows) 取得，通常即 cbeta_get()（共用快取、限流與熔斷）。
+
+PAGINATE_CONCURRENCY = int(os.getenv("CBETA_PAGINATE_CONCURRENCY", "4"))
+PAGINATE_MAX_RESULTS = int(os.getenv("CBETA_PAGINATE_MAX_RESULTS", "2000"))
+PAGINATE_PAGE_ROWS = int(os.getenv("CBETA_PAGINATE_PAGE_ROWS", "100"))
+
+FetchPage = Callable[[int, int], Awaitable[Dict[str, Any]]]
+Progress = Callable[[int, int], Awaitable[None]]
+
+
+def report_to(ctx) -> Optional[Progress]:
+    """MCP 工具的 Context → 進度回報函式；ctx 為 None（直接以 Python 呼叫工具）時回傳 None。"""
+    if ctx is None:
+        return None
+    return lambda fetched, total: ctx.report_progress(fetched, total)
+
+
+def num_found(data: Dict[str, Any]) -> int:
+    for key in ("num_found", "total"):
+        if data.get(key) is not None:
+            return int(data[key])
+    return int((data.get("response") or {}).get("numFound") or 0)
+
+
+def page_items(data: Dict[str, Any]) -> List[Any]:
+    if "results" in data:
+        return list(data.get("results") or [])
+    return list((data.get("response") or {}).get("docs") or [])
+
+
+def _with_items(data: Dict[str, Any], items: List[Any], start: int) -> Dict[str, Any]:
+    if "results" in data or "response" not in data:
+        return {**data, "results": items}
+    return {**data, "response": {**data["response"], "start": start, "docs": items}}
+
+
+def _item_key(item: Any) -> Tuple[str, Any]:
+    if isinstance(item, dict) and item.get("id") is not None:
+        return ("id", item["id"])
+    return ("item", json.dumps(item, ensure_ascii=False, sort_keys=True))
+
+
+class Paginator:
+    def __init__(self):
+        self.counters = {"runs": 0, "pages": 0, "page_errors": 0, "duplicates": 0, "truncated": 0,
+                         "progress_errors": 0}
+
+    async def iter_pages(self, fetch: FetchPage, start: int = 0, page_rows: int = PAGINATE_PAGE_ROWS,
+                         max_results: int = PAGINATE_MAX_RESULTS, concurrency: int = PAGINATE_CONCURRENCY
+                         ) -> AsyncIterator[Tuple[int, Union[Dict[str, Any], Exception]]]:
+        """依頁序產出 (起始位置, 該頁回應或例外)；第一頁失敗時直接拋出。"""
+        first = await fetch(start, page_rows)
+        yield start, first
+        got = len(page_items(first))
+        if 0 < got < page_rows:
+            page_rows = got
+        end = min(num_found(first), start + max_results)
+        starts = list(range(start + page_rows, end, page_rows))
+        gate = asyncio.Semaphore(max(1, concurrency))
+
+        async def one(s: int):
+            async with gate:
+                return await fetch(s, min(page_rows, end - s))
+
+        tasks = [asyncio.ensure_future(one(s)) for s in starts]
+        try:
+            for s, task in zip(starts, tasks):
+                try:
+                    yield s, await task
+                except Exception as e:
+                    yield s, e
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def paginate(self, fetch: FetchPage, start: int = 0, page_rows: int = PAGINATE_PAGE_ROWS,
+                       max_results: int = PAGINATE_MAX_RESULTS, concurrency: int = PAGINATE_CONCURRENCY,
+                       progress: Optional[Progress] = None) -> Dict[str, Any]:
+        """取回 start 起最多 max_results 筆並合併，見模組說明。"""
+        max_results = max(1, min(max_results, PAGINATE_MAX_RESULTS))
+        started = time.perf_counter()
+        self.counters["runs"] += 1
+        first, total, pages = None, 0, 0
+        results: List[Any] = []
+        seen = set()
+        failed = []
+        pager = self.iter_pages(fetch, start, min(page_rows, max_results), max_results, concurrency)
+        try:
+            async for s, data in pager:
+                if isinstance(data, Exception):
+                    self.counters["page_errors"] += 1
+                    failed.append({"start": s, "error": str(data)})
+                    continue
+                if first is None:
+                    first, total = data, num_found(data)
+                pages += 1
+                for item in page_items(data):
+                    key = _item_key(item)
+                    if key in seen:
+                        self.counters["duplicates"] += 1
+                        continue
+                    seen.add(key)
+                    results.append(item)
+                trace_event("paginate_page", start=s, fetched=len(results), num_found=total)
+                if progress is not None:
+                    try:
+                        await progress(min(len(results), max_results), min(max(total - start, 0), max_results))
+                    except Exception:
+                        self.counters["progress_errors"] += 1
+                if len(results) >= max_results:
+                    break
+        finally:
+            await pager.aclose()
+        self.counters["pages"] += pages
+        merged = _with_items(first, results[:max_results], start)
+        merged.update({"fetched": min(len(results), max_results), "pages": pages})
+        if total - start > max_results:
+            self.counters["truncated"] += 1
+            merged["truncated"] = True
+        if failed:
+            merged["failed"] = failed
+        trace_event("paginate", num_found=total, fetched=merged["fetched"], pages=pages,
+                    ms=round((time.perf_counter() - started) * 1000, 2))
+        return merged
+
+    def stats(self) -> dict:
+        return {**self.counters, "concurrency": PAGINATE_CONCURRENCY, "max_results": PAGINATE_MAX_RESULTS,
+                "page_rows": PAGINATE_PAGE_ROWS}
+
+
+paginator = Paginator()
+
+
+async def paginate(fetch: FetchPage, start: int = 0, max_results: int = PAGINATE_MAX_RESULTS,
+                   progress: Optional[Progress] = None) -> Dict[str, Any]:
+    """自動翻頁並合併（見 Paginator.paginate）；progress 見模組說明。"""
+    return await paginator.paginate(fetch, start, max_results=max_results, progress=progress)
+
+
+register_stats("cbeta_paginate", paginator.stats)
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+import httpx
+
+# CBETA 上游錄製／回放
+#
+# - RecordingTransport：包裝真實傳輸層，把每組請求／回應以 JSON Lines 追加寫入
+#   <錄製目錄>/<端點>.jsonl（例如 works.jsonl、search_kwic.jsonl）
+# - FixtureStore：讀取錄製檔，依「路徑 + 排序後查詢參數」查找回應
+# - FaultInjector：可設定的延遲、抖動與錯誤率
+# - ReplayTransport：不連網，直接由 FixtureStore 回應（CI、離線壓測用）
+#
+# 本機替身伺服器見 bench/mock_cbeta.py，與此處共用同一份錄製檔格式。
+
+RECORD_DIR = os.getenv("CBETA_RECORD_DIR", "")
+REPLAY_DIR = os.getenv("CBETA_REPLAY_DIR", "")
+REPLAY_LATENCY_MS = float(os.getenv("CBETA_REPLAY_LATENCY_MS", "0"))
+REPLAY_JITTER_MS = float(os.getenv("CBETA_REPLAY_JITTER_MS", "0"))
+REPLAY_ERROR_RATE = float(os.getenv("CBETA_REPLAY_ERROR_RATE", "0"))
+
+
+def canonical_query(query: str) -> str:
+    return urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+def fixture_name(path: str) -> str:
+    return (path.strip("/").replace("/", "_") or "root") + ".jsonl"
+
+
+class FixtureStore:
+    def __init__(self, directory: Optional[str] = None):
+        self._responses: Dict[Tuple[str, str], dict] = {}
+        if directory:
+            self.load(directory)
+
+    def load(self, directory: str):
+        if not os.path.isdir(directory):
+            print(f"⚠️ 錄製目錄不存在：{directory}")
+            return
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".jsonl"):
+                continue
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.add(json.loads(line))
+
+    def add(self, record: dict):
+        # 同一請求重複錄製時以最後一筆為準
+        self._responses[(record["path"], canonical_query(record.get("query", "")))] = record
+
+    def lookup(self, path: str, query: str) -> Optional[dict]:
+        return self._responses.get((path, canonical_query(query)))
+
+    def paths(self) -> List[str]:
+        return sorted({path for path, _ in self._responses})
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+
+class FaultInjector:
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0, error_status: int = 503):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    async def delay(self):
+        seconds = (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def error(self) -> Tuple[int, str, str]:
+        return self.error_status, "application/json", json.dumps({"error": "injected failure"})
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, inner: httpx.AsyncBaseTransport, directory: str):
+        self._inner = inner
+        self._directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._inner.handle_async_request(request)
+        body = await response.aread()
+        record = {
+            "method": request.method,
+            "path": request.url.path,
+            "query": canonical_query(request.url.query.decode("ascii")),
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type", "application/json"),
+            "body": body.decode("utf-8", errors="replace"),
+        }
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(os.path.join(self._directory, fixture_name(request.url.path)), "a", encoding="utf-8") as f:
+                f.write(line)
+        # body 已解壓，須移除與原始編碼相關的標頭
+        headers = [
+            (k, v) for k, v in response.headers.items()
+            if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=headers,
+            content=body,
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._inner.aclose()
+
+
+def replay_response(store: FixtureStore, path: str, query: str) -> Tuple[int, str, str]:
+    """回傳 (status, content_type, body)；供 ReplayTransport 與替身伺服器共用。"""
+    record = store.lookup(path, query)
+    if record is None:
+        return 404, "application/json", json.dumps({"error": f"no recording for {path}?{query}"})
+    return record["status"], record.get("content_type", "application/json"), record["body"]
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    def __init__(self, store: FixtureStore, injector: Optional[FaultInjector] = None):
+        self.store = store
+        self.injector = injector or FaultInjector()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self.injector.delay()
+        if self.injector.should_fail():
+            status, content_type, body = self.injector.error()
+        else:
+            status, content_type, body = replay_response(
+                self.store, request.url.path, request.url.query.decode("ascii")
+            )
+        return httpx.Response(
+            status_code=status,
+            headers={"content-type": content_type},
+            content=body.encode("utf-8"),
+            request=request,
+        )
+
+
+def build_transport(**transport_kwargs) -> Optional[httpx.AsyncBaseTransport]:
+    """依環境變數建立錄製或回放傳輸層；皆未設定時回傳 None（使用預設傳輸層）。"""
+    if REPLAY_DIR:
+        injector = FaultInjector(REPLAY_LATENCY_MS, REPLAY_JITTER_MS, REPLAY_ERROR_RATE)
+        return ReplayTransport(FixtureStore(REPLAY_DIR), injector)
+    if RECORD_DIR:
+        return RecordingTransport(httpx.AsyncHTTPTransport(**transport_kwargs), RECORD_DIR)
+    return None
@@ -0,0 +1,151 @@
+import asyncio
+import bisect
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlencode
+from main import register_stats
+from tools.cebta._api import CBETA_API_BASE
+from tools.cebta._cache import ttl_for
+from tools.cebta._citation import LbKey, lb_key, split_file
+from tools.cebta._singleflight import SingleFlight
+from tools.cebta._toc_index import get_toc_index
+from tools.cebta._works_index import works_index
+
+# CBETA 引用本機解析（cbeta_goto）
+#
+# 把 _citation 解析出的引用補齊佛典編號與卷號，不經 /juans/goto：
+# - 行首：檔名即得佛典，卷號以該佛典目次索引的各卷起點二分搜尋（見 _toc_index）
+# - 經卷：直接得出；另給頁欄行時同樣以各卷起點查出所在卷
+# - 冊頁欄行：以「冊 → 各佛典起始頁」對照表二分搜尋出佛典；對照表由佛典目錄索引列出該冊
+#   （及前兩冊最後一部，可能跨冊）的佛典，再取各佛典目次的卷起點建立，LRU 保留 CBETA_GOTO_VOLUME_MAPS 冊
+#
+# 目次與目錄都有快取，同一部佛典或同一冊的大量引用只在第一次下載，之後完全在本機完成。
+# 回傳的 url 與原本轉送 /juans/goto 時相同（上游端點加上查詢參數）。
+
+GOTO_VOLUME_MAPS = int(os.getenv("CBETA_GOTO_VOLUME_MAPS", "64"))
+
+# 跨冊佛典最多往前找幾冊
+VOLUME_LOOKBACK = 2
+
+
+def goto_url(query: Dict[str, Any]) -> str:
+    return f"{CBETA_API_BASE}/juans/goto?{urlencode(query)}"
+
+
+def goto_query(citation: Dict[str, Any]) -> Dict[str, Any]:
+    """已解析出行首時以行首跳轉，否則以經卷跳轉。"""
+    if citation.get("linehead"):
+        return {"linehead": citation["linehead"]}
+    return {"canon": citation["canon"], "work": citation["work"][len(citation["canon"]):], "juan": citation.get("juan") or 1}
+
+
+class VolumeMap:
+    def __init__(self, entries: List[Tuple[LbKey, str, str]]):
+        entries.sort()
+        self._keys = [key for key, _, _ in entries]
+        self._works = [(work, file) for _, work, file in entries]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def lookup(self, lb: str) -> Tuple[str, str]:
+        """行號所在的 (佛典編號, 檔名)；早於該冊第一部佛典時拋出 ValueError。"""
+        i = bisect.bisect_right(self._keys, lb_key(lb)) - 1
+        if i < 0:
+            raise ValueError(f"頁碼 {lb} 早於該冊第一部佛典")
+        return self._works[i]
+
+
+class CitationResolver:
+    def __init__(self, max_volumes: int = GOTO_VOLUME_MAPS):
+        self.max_volumes = max_volumes
+        self._volumes: "OrderedDict[Tuple[str, int], Tuple[float, VolumeMap]]" = OrderedDict()
+        self._building = SingleFlight()
+        self.counters = {"resolved": 0, "failed": 0, "volume_builds": 0}
+
+    async def volume_map(self, canon: str, vol: int) -> VolumeMap:
+        key = (canon, vol)
+        item = self._volumes.get(key)
+        if item is not None and item[0] > time.time():
+            self._volumes.move_to_end(key)
+            return item[1]
+        return await self._building.do(f"{canon}{vol}", lambda: self._build_volume(canon, vol))
+
+    async def _build_volume(self, canon: str, vol: int) -> VolumeMap:
+        if not works_index.has_canon(canon):
+            raise ValueError(f"佛典目錄索引尚未載入 {canon} 藏，無法以冊頁定位")
+        candidates = [w["work"] for w in works_index.by_vol(canon, vol, vol)]
+        for previous in range(vol - 1, max(0, vol - VOLUME_LOOKBACK - 1), -1):
+            works = works_index.by_vol(canon, previous, previous)
+            if works:
+                candidates.append(works[-1]["work"])
+        if not candidates:
+            raise ValueError(f"查無 {canon}{vol} 冊的佛典")
+        indexes = await asyncio.gather(*(get_toc_index(w) for w in candidates), return_exceptions=True)
+        entries = []
+        for index in indexes:
+            if isinstance(index, Exception):
+                continue
+            for _, file, lb in index.juan_starts():
+                parts = split_file(file)
+                if parts and parts[0] == canon and parts[1] == vol:
+                    entries.append((lb_key(lb), index.work, file))
+                    break
+        volume = VolumeMap(entries)
+        self.counters["volume_builds"] += 1
+        # 有佛典目次下載失敗時不快取，下次重建
+        if not any(isinstance(index, Exception) for index in indexes):
+            self._volumes[(canon, vol)] = (time.time() + ttl_for("/toc"), volume)
+            self._volumes.move_to_end((canon, vol))
+            while len(self._volumes) > self.max_volumes:
+                self._volumes.popitem(last=False)
+        return volume
+
+    async def resolve(self, citation: Dict[str, Any]) -> Dict[str, Any]:
+        """補齊 work / juan（有行號時另含 file、lb、linehead）；無法定位時拋出 ValueError。"""
+        citation = dict(citation)
+        kind = citation["kind"]
+        if kind == "vol":
+            work, file = (await self.volume_map(citation["canon"], citation["vol"])).lookup(citation["lb"])
+            citation.update(work=work, file=file, linehead=f"{file}_p{citation['lb']}")
+        elif kind == "work" and citation.get("lb"):
+            index = await get_toc_index(citation["work"])
+            starts = index.juan_starts()
+            if not starts:
+                raise ValueError(f"{citation['work']} 沒有卷資料")
+            files = [file for juan, file, _ in starts if juan == citation.get("juan")] or [starts[0][1]]
+            citation.update(file=files[0], linehead=f"{files[0]}_p{citation['lb']}")
+        if citation.get("file") and citation.get("lb"):
+            index = await get_toc_index(citation["work"])
+            juan = index.juan_of(citation["file"], citation["lb"])
+            if juan is None:
+                raise ValueError(f"{citation['file']} 不屬於 {citation['work']}")
+            citation["juan"] = juan
+        elif not citation.get("juan"):
+            citation["juan"] = 1
+        citation.pop("kind", None)
+        citation["url"] = goto_url(goto_query(citation))
+        return citation
+
+    async def resolve_many(self, citations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批次解析，個別失敗時該項回傳 {"error": ...}；同一佛典或同一冊的目次只下載一次。"""
+        async def one(citation):
+            try:
+                result = await self.resolve(citation)
+                self.counters["resolved"] += 1
+                return result
+            except Exception as e:
+                self.counters["failed"] += 1
+                return {"error": str(e)}
+
+        return list(await asyncio.gather(*(one(c) for c in citations)))
+
+    def stats(self) -> dict:
+        return {**self.counters, "volume_maps": len(self._volumes)}
+
+
+citation_resolver = CitationResolver()
+
+register_stats("cbeta_goto", citation_resolver.stats)
@@ -0,0 +1,181 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from main import register_stats
+from tools.cebta._align import align, has_numpy, score_windows
+from tools.cebta._fulltext import SIMILAR_MAX_CHARS, SIMILAR_MIN_CHARS, local_fulltext
+from tools.cebta._kwic import KWIC_CONCURRENCY, kwic_engine
+from tools.cebta._ngram import NgramIndex, normalize
+from tools.cebta._works_index import works_index
+from tools._profiler import trace_event
+
+# 本機相似搜尋（cbeta_similar_search）
+#
+# 以本機全文索引（_ngram）與鏡像卷文做與 /search/similar 相同參數的 Smith-Waterman 相似句搜尋：
+# 1. 種子：查詢句的每個二元組取出位置清單，位置減去其在查詢句中的位移即為對角線；
+#    依 (卷, 對角線 // 查詢句長度) 分區計票（同區命中的查詢句位置數，以單一 Counter 計），取票數最高的 k 區為候選。
+#    位置清單超過 CBETA_SIMILAR_MAX_POSTINGS 位元組的常見二元組（如「如是」）不當種子；
+#    二元組由最少見者開始讀取，一次查詢讀取的位置清單合計不超過 CBETA_SIMILAR_SEED_BUDGET 位元組
+# 2. 比對：每個候選區取前後各半個查詢句長度的視窗，以 _align.score_windows 批次計分
+#    （有 numpy 時為向量化核心），每 CBETA_SIMILAR_BATCH 個視窗一批，
+#    分送 CBETA_SIMILAR_WORKERS 個行程平行計算（預設為 CPU 數；設為 0 時在執行緒池中計算）
+#    候選卷只讀鏡像（CBETA_MIRROR_DIR，與建索引時相同），以 CBETA_KWIC_CONCURRENCY 並發載入，不請求上游；
+#    未鏡像的卷略過
+# 3. 分數達 score_min 者以 align() 回溯出起訖，同一卷重疊的結果只保留最高分
+#
+# 結果依分數排序，結構同上游：{query_string, time, num_found, results}，
+# 每筆含 work、juan、title、linehead、score、content（比對到的原文）與 highlight（前後文，比對段以 <mark> 標出）。
+# 由 local_fulltext.answer() 依 CBETA_FULLTEXT_MODE 決定是否使用，facet 一律請求上游。
+
+SIMILAR_WORKERS = int(os.getenv("CBETA_SIMILAR_WORKERS", str(os.cpu_count() or 1)))
+SIMILAR_BATCH = int(os.getenv("CBETA_SIMILAR_BATCH", "256"))
+SIMILAR_MAX_POSTINGS = int(os.getenv("CBETA_SIMILAR_MAX_POSTINGS", str(4 * 1024 * 1024)))
+SIMILAR_SEED_BUDGET = int(os.getenv("CBETA_SIMILAR_SEED_BUDGET", str(1024 * 1024)))
+
+MIN_VOTES = 2
+AROUND = 10
+
+
+def _param(params: Dict[str, Any], name: str, default: int) -> int:
+    """整數參數；只有省略（None）時用預設值，0 照實傳入由呼叫端檢查。"""
+    value = params.get(name)
+    return default if value is None else int(value)
+
+
+class SimilarSearch:
+    def __init__(self, workers: int = SIMILAR_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.counters = {"queries": 0, "candidates": 0, "windows_scored": 0, "results": 0, "unmirrored": 0}
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        # spawn：子行程只載入 _align，不複製服務端的執行緒與連線
+        if self.workers > 0 and self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    @staticmethod
+    def seeds(index: NgramIndex, query: str, k: int) -> List[Tuple[int, int]]:
+        """候選區 [(文件, 區起點), ...]，依票數排序。"""
+        offsets: Dict[str, List[int]] = {}
+        for i in range(len(query) - 1):
+            offsets.setdefault(query[i:i + 2], []).append(i)
+        # 讀取量以位置清單位元組數 × 該二元組在查詢句中的次數估計
+        sized = sorted((index.gram_size(gram) * len(offsets[gram]), gram) for gram in offsets)
+        grams, budget = [], SIMILAR_SEED_BUDGET
+        for size, gram in sized:
+            if not size or size > SIMILAR_MAX_POSTINGS * len(offsets[gram]):
+                continue
+            if size > budget:
+                break
+            grams.append(gram)
+            budget -= size
+        if not grams:
+            # 全是常見二元組時只取最少見的一個，仍受讀取上限約束
+            grams = [gram for size, gram in sized[:1] if 0 < size <= SIMILAR_SEED_BUDGET]
+        span = len(query)
+        # 每個查詢句位置對同一區只投一票，票數即同區命中的不同查詢句位置數
+        votes: Counter = Counter()
+        for gram in grams:
+            for doc, positions in index.postings(gram).items():
+                for i in offsets[gram]:
+                    votes.update({(doc, (p - i) // span) for p in positions})
+        needed = min(MIN_VOTES, len(offsets))
+        ranked = sorted(((-count, key) for key, count in votes.items() if count >= needed))
+        return [(doc, band * span) for _, (doc, band) in ranked[:k]]
+
+    async def search(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        index = local_fulltext.current()
+        if index is None:
+            raise ValueError("本機全文索引不存在")
+        query, _ = normalize(str(params.get("q") or ""))
+        if not SIMILAR_MIN_CHARS <= len(query) <= SIMILAR_MAX_CHARS:
+            raise ValueError(f"查詢句需為 {SIMILAR_MIN_CHARS}～{SIMILAR_MAX_CHARS} 字（不含標點）")
+        k, gain, penalty, score_min = (_param(params, name, default)
+                                       for name, default in (("k", 500), ("gain", 2), ("penalty", -1), ("score_min", 16)))
+        if gain <= 0 or penalty >= 0:
+            raise ValueError("gain 需為正數，penalty 需為負數")
+        if k < 1:
+            raise ValueError("k 需為正數")
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        self.counters["queries"] += 1
+
+        candidates = await loop.run_in_executor(None, self.seeds, index, query, k)
+        self.counters["candidates"] += len(candidates)
+        gate = asyncio.Semaphore(max(1, KWIC_CONCURRENCY))
+
+        async def load(doc):
+            async with gate:
+                return await kwic_engine.juan_text(index.works[doc], index.juans[doc], mirror_only=True)
+
+        docs = sorted({doc for doc, _ in candidates})
+        loaded = dict(zip(docs, await asyncio.gather(*(load(doc) for doc in docs), return_exceptions=True)))
+        self.counters["unmirrored"] += sum(1 for text in loaded.values() if isinstance(text, Exception))
+
+        pad = len(query) // 2
+        windows: List[Tuple[int, int, str]] = []  # (文件, 視窗起點, 視窗文字)
+        for doc, start in candidates:
+            text = loaded[doc]
+            if isinstance(text, Exception):
+                continue
+            lo = max(0, start - pad)
+            window = text.chars[lo:start + 2 * len(query) + pad]
+            if window:
+                windows.append((doc, lo, window))
+        batches = [windows[i:i + SIMILAR_BATCH] for i in range(0, len(windows), SIMILAR_BATCH)]
+        scored = await asyncio.gather(*(
+            loop.run_in_executor(self._executor(), score_windows, query, [w for _, _, w in batch], gain, penalty)
+            for batch in batches
+        ))
+        self.counters["windows_scored"] += len(windows)
+        passed = [window for batch, scores in zip(batches, scored) for window, (score, _, _) in zip(batch, scores)
+                  if score >= score_min]
+        results = await loop.run_in_executor(None, self._results, index, loaded, query, passed, gain, penalty)
+        self.counters["results"] += len(results)
+        elapsed = time.perf_counter() - started
+        trace_event("similar_local", q=query, candidates=len(candidates), windows=len(windows),
+                    num_found=len(results), ms=round(elapsed * 1000, 2))
+        return {"query_string": params.get("q"), "time": round(elapsed, 6), "num_found": len(results),
+                "results": results, "source": "local"}
+
+    @staticmethod
+    def _results(index: NgramIndex, loaded: Dict[int, Any], query: str, passed: List[Tuple[int, int, str]],
+                 gain: int, penalty: int) -> List[Dict[str, Any]]:
+        spans = []
+        for doc, lo, window in passed:
+            score, _, _, start, end = align(query, window, gain, penalty)
+            spans.append((score, doc, lo + start, lo + end))
+        # 同一卷重疊的結果只保留最高分
+        kept: Dict[int, List[Tuple[int, int]]] = {}
+        results = []
+        for score, doc, start, end in sorted(spans, key=lambda s: (-s[0], s[1], s[2])):
+            if any(start < e and s < end for s, e in kept.get(doc, [])):
+                continue
+            kept.setdefault(doc, []).append((start, end))
+            text = loaded[doc]
+            s, e = text.offsets[start], text.offsets[end - 1] + 1
+            work = index.works[doc]
+            info = works_index.get(work) or {}
+            results.append({
+                "work": work,
+                "juan": index.juans[doc],
+                "title": info.get("title"),
+                "linehead": text.linehead_at(s),
+                "score": score,
+                "content": text.text[s:e],
+                "highlight": text.text[max(0, s - AROUND):s] + f"<mark>{text.text[s:e]}</mark>" + text.text[e:e + AROUND],
+            })
+        return results
+
+    def stats(self) -> dict:
+        return {**self.counters, "workers": self.workers, "numpy": has_numpy(), "seed_budget": SIMILAR_SEED_BUDGET}
+
+
+similar_search = SimilarSearch()
+
+register_stats("cbeta_similar", similar_search.stats)
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+# 同鍵請求合併（single-flight）
+#
+# 同一時間內以相同鍵發起的多個呼叫只會真正執行一次，
+# 其餘呼叫等待同一個 Future 並取得相同結果（或相同例外）。
+# 任一等待者被取消不會中斷共用的請求，其他等待者仍可取得結果。
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        self.counters["leaders"] += 1
+        future = asyncio.ensure_future(factory())
+        self._calls[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return await asyncio.shield(future)
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # 所有等待者都已取消時，避免出現「例外未被讀取」的警告
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {**self.counters, "inflight": len(self._calls)}
@@ -0,0 +1,243 @@
+import asyncio
+import bisect
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from main import register_stats
+from tools.cebta._api import cbeta_get
+from tools.cebta._cache import ttl_for
+from tools.cebta._citation import LbKey, lb_key, split_linehead
+from tools.cebta._singleflight import SingleFlight
+from tools._profiler import trace_event
+
+# 佛典目次索引（/toc）
+#
+# 上游 /toc 回傳巢狀的 mulu 樹，要知道某一行屬於哪一品只能整棵走訪。這裡把每部佛典的目次攤平：
+# - 節點依先序排列，記錄深度與父節點位置；沒有 lb 的資料夾節點以第一個子孫的位置為起點
+# - 另建依 (卷, 行號) 排序的位置陣列；某位置所在的最內層節點即「起點不晚於它的最後一個節點」，
+#   以二分搜尋找到後沿父節點往上即得各層目次
+# - 行首（如 T01n0001_p0066c25）先以各卷起始行（toc 的 juan 列表，缺少時由目次推得）二分搜尋出卷號
+# - pruned() 由攤平陣列重建限定層數（可再限定卷號）的目次樹
+#
+# 索引以 LRU 保留 CBETA_TOC_INDEX_MAX_WORKS 部佛典，過期時間與 /toc 回應快取相同，
+# 上游資料仍經 cbeta_get() 取得（共用快取、合併與限流）。
+
+TOC_INDEX_MAX_WORKS = int(os.getenv("CBETA_TOC_INDEX_MAX_WORKS", "512"))
+TOC_BATCH_CONCURRENCY = int(os.getenv("CBETA_TOC_BATCH_CONCURRENCY", "8"))  # get_toc_indexes 同時下載的佛典數
+
+Position = Tuple[int, LbKey]  # (卷號, 行號)
+
+# 回傳給呼叫端的節點欄位
+ENTRY_FIELDS = ("title", "type", "n", "file", "juan", "lb")
+
+
+class TocIndex:
+    def __init__(self, work: str, mulu: List[Dict[str, Any]], juans: Optional[List[Dict[str, Any]]] = None):
+        self.work = work
+        self._nodes: List[Dict[str, Any]] = []       # 先序排列的節點（只含 ENTRY_FIELDS）
+        self._depth: List[int] = []
+        self._parent: List[int] = []
+        self._children: List[List[int]] = []
+        self._start: List[Optional[Position]] = []
+        for item in mulu or []:
+            self._add(item, 0, -1)
+
+        located = sorted((pos, i) for i, pos in enumerate(self._start) if pos is not None)
+        self._keys = [pos for pos, _ in located]
+        self._order = [i for _, i in located]
+        # 節點範圍止於其後第一個深度不大於它的節點
+        self._end: List[Optional[Position]] = [None] * len(self._nodes)
+        stack: List[int] = []
+        for pos, i in located:
+            while stack and self._depth[stack[-1]] >= self._depth[i]:
+                self._end[stack.pop()] = pos
+            stack.append(i)
+
+        self._build_juans(juans)
+
+    def _add(self, item: Dict[str, Any], depth: int, parent: int) -> Optional[Position]:
+        index = len(self._nodes)
+        self._nodes.append({k: item[k] for k in ENTRY_FIELDS if item.get(k) is not None})
+        self._depth.append(depth)
+        self._parent.append(parent)
+        self._children.append([])
+        self._start.append(None)
+        if parent >= 0:
+            self._children[parent].append(index)
+        start = None
+        if item.get("juan") is not None and item.get("lb"):
+            start = (int(item["juan"]), lb_key(item["lb"]))
+        for child in item.get("children") or []:
+            child_start = self._add(child, depth + 1, index)
+            if start is None:
+                start = child_start
+        self._start[index] = start
+        return start
+
+    def _build_juans(self, juans: Optional[List[Dict[str, Any]]]):
+        """各卷起點：以 (檔案順序, 行號) 排序，供行首查出卷號。"""
+        starts: Dict[int, Tuple[str, str]] = {}
+        for item in juans or []:
+            if item.get("juan") is not None and item.get("file") and item.get("lb"):
+                starts[int(item["juan"])] = (item["file"], item["lb"])
+        if not starts:  # 沒有卷列表時以各卷第一個目次節點為起點
+            for i in self._order:
+                node = self._nodes[i]
+                if node.get("file") and node.get("lb"):
+                    starts.setdefault(int(node["juan"]), (node["file"], node["lb"]))
+        self._file_rank: Dict[str, int] = {}
+        for juan in sorted(starts):
+            self._file_rank.setdefault(starts[juan][0], len(self._file_rank))
+        ordered = sorted(((self._file_rank[file], lb_key(lb)), juan) for juan, (file, lb) in starts.items())
+        self._juan_keys = [key for key, _ in ordered]
+        self._juan_ids = [juan for _, juan in ordered]
+        self._juan_start = starts
+        self.juans = sorted(starts)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    # ---------- 查詢 ----------
+
+    def juan_starts(self) -> List[Tuple[int, str, str]]:
+        """各卷起點 [(卷號, 檔名, 行號), ...]，依卷號排序。"""
+        return [(juan, self._juan_start[juan][0], self._juan_start[juan][1]) for juan in self.juans]
+
+    def files(self) -> List[str]:
+        """佛典分屬的檔案（跨冊佛典有多個），依卷序排列。"""
+        return list(self._file_rank)
+
+    def entry(self, i: int) -> Dict[str, Any]:
+        node = dict(self._nodes[i], depth=self._depth[i] + 1)
+        if node.get("file") and node.get("lb"):
+            node["linehead"] = f"{node['file']}_p{node['lb']}"
+        return node
+
+    def path(self, i: int) -> List[Dict[str, Any]]:
+        """節點 i 與其各層上層，由最外層排到最內層。"""
+        chain = []
+        while i >= 0:
+            chain.append(self.entry(i))
+            i = self._parent[i]
+        return chain[::-1]
+
+    def juan_of(self, file: str, lb: str) -> Optional[int]:
+        rank = self._file_rank.get(file)
+        if rank is None:
+            return None
+        i = bisect.bisect_right(self._juan_keys, (rank, lb_key(lb))) - 1
+        if i < 0 or self._juan_keys[i][0] != rank:
+            # 早於該檔第一個卷起點（如卷首經題）時歸入該檔第一卷
+            i = bisect.bisect_left(self._juan_keys, (rank,))
+        return self._juan_ids[i]
+
+    def enclosing(self, juan: int, lb: Optional[str] = None) -> List[Dict[str, Any]]:
+        """(juan, lb) 所在的各層目次；lb 省略時為卷首所在位置。"""
+        lb = lb or self._juan_start.get(juan, (None, None))[1]
+        target: Position = (juan, lb_key(lb)) if lb else (juan, ("", "", 0))
+        i = bisect.bisect_right(self._keys, target) - 1
+        return self.path(self._order[i]) if i >= 0 else []
+
+    def locate(self, linehead: str) -> Dict[str, Any]:
+        """行首所在的卷與各層目次；行首不屬於此佛典時拋出 ValueError。"""
+        file, lb = split_linehead(linehead)
+        juan = self.juan_of(file, lb)
+        if juan is None:
+            raise ValueError(f"行首 {linehead} 不在 {self.work} 的範圍內")
+        path = self.enclosing(juan, lb)
+        return {"linehead": linehead, "juan": juan, "section": path[-1] if path else None, "path": path}
+
+    def sections(self, juan: int, depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """卷內開始的節點（依位置排序），depth 限制最大深度（最外層為 1）。"""
+        lo = bisect.bisect_left(self._keys, (juan,))
+        hi = bisect.bisect_left(self._keys, (juan + 1,))
+        return [self.entry(i) for i in self._order[lo:hi] if depth is None or self._depth[i] < depth]
+
+    def pruned(self, depth: Optional[int] = None, juan: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        重建巢狀目次：depth 為保留層數（最外層為 1，None 不限）；被截去子節點的項目標記 isFolder 與 child_count。
+
+        指定 juan 時只保留範圍與該卷重疊的節點。
+        """
+        def keep(i: int) -> bool:
+            if juan is None:
+                return True
+            start, end = self._start[i], self._end[i]
+            return start is not None and start < (juan + 1,) and (end is None or end > (juan, ("", "", 0)))
+
+        def build(i: int, level: int) -> Dict[str, Any]:
+            node = dict(self._nodes[i])
+            children = [c for c in self._children[i] if keep(c)]
+            if children:
+                node["isFolder"] = True
+                if depth is None or level < depth:
+                    node["children"] = [build(c, level + 1) for c in children]
+                else:
+                    node["child_count"] = len(children)
+            return node
+
+        return [build(i, 1) for i, d in enumerate(self._depth) if d == 0 and keep(i)]
+
+
+class TocIndexCache:
+    def __init__(self, max_works: int = TOC_INDEX_MAX_WORKS):
+        self.max_works = max_works
+        self._items: "OrderedDict[str, Tuple[float, TocIndex]]" = OrderedDict()  # work -> (到期時間, 索引)
+        self.counters = {"hits": 0, "builds": 0, "evictions": 0}
+        self._building = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    async def get(self, work: str) -> TocIndex:
+        item = self._items.get(work)
+        if item is not None and item[0] > time.time():
+            self._items.move_to_end(work)
+            self.counters["hits"] += 1
+            return item[1]
+        return await self._building.do(work, lambda: self._build(work))
+
+    async def _build(self, work: str) -> TocIndex:
+        data = await cbeta_get("/toc", {"work": work})
+        results = data.get("results") or []
+        if not results:
+            raise ValueError(f"查無 {work} 的目次")
+        started = time.perf_counter()
+        index = TocIndex(work, results[0].get("mulu") or [], results[0].get("juan"))
+        self.counters["builds"] += 1
+        trace_event("toc_index", work=work, entries=len(index), ms=round((time.perf_counter() - started) * 1000, 2))
+        self._items[work] = (time.time() + ttl_for("/toc"), index)
+        self._items.move_to_end(work)
+        while len(self._items) > self.max_works:
+            self._items.popitem(last=False)
+            self.counters["evictions"] += 1
+        return index
+
+    def stats(self) -> dict:
+        return {**self.counters, "works": len(self._items), "max_works": self.max_works,
+                "entries": sum(len(index) for _, index in self._items.values())}
+
+
+toc_indexes = TocIndexCache()
+
+
+async def get_toc_index(work: str) -> TocIndex:
+    """取得佛典目次索引（必要時經 cbeta_get 下載 /toc 並建立）；索引建立後不可修改。"""
+    return await toc_indexes.get(work)
+
+
+async def get_toc_indexes(works: List[str], concurrency: int = TOC_BATCH_CONCURRENCY) -> Dict[str, Any]:
+    """多部佛典的目次索引，回傳 {work: TocIndex 或例外}，依輸入順序（重複者只列一次）。"""
+    works = list(dict.fromkeys(w.strip() for w in works if w and w.strip()))
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(work: str):
+        async with gate:
+            return await toc_indexes.get(work)
+
+    found = await asyncio.gather(*(one(w) for w in works), return_exceptions=True)
+    return dict(zip(works, found))
+
+
+register_stats("cbeta_toc_index", toc_indexes.stats)
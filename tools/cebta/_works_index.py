@@ -0,0 +1,440 @@
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import re
+import time
+import httpx
+from typing import Any, Dict, List, Optional, Tuple
+from main import register_stats, register_background_task
+from tools.cebta._api import CBETA_API_BASE, cbeta_get
+from tools._profiler import trace_event
+from tools.cebta._breaker import is_upstream_failure
+from tools.cebta._intervals import IntervalIndex
+from tools.cebta._creators import CreatorIndex, MATCH_MODES
+from tools.cebta._zhconv import fold
+
+# 本機佛典目錄索引（/works）
+#
+# 依藏經批次下載 /works 全部佛典資料，建立：
+# - 主索引：work 編號 → 佛典資料
+# - 次索引：藏經 → 依冊數排序的陣列（bisect 查冊數範圍）、朝代
+# - 作譯者索引：ID 與姓名（繁簡折疊、前綴／部分／模糊比對），見 _creators.CreatorIndex
+# - 年代區間索引：全部佛典與各朝代各一棵 IntervalIndex（time_from~time_to），重疊查詢與計數皆為對數時間
+#
+# 背景任務啟動時先讀取快照（CBETA_WORKS_INDEX_SNAPSHOT，上游位址不同的快照不採用），再每 CBETA_WORKS_INDEX_REFRESH 秒重新下載。
+# 各藏經分別下載：失敗的藏經沿用舊資料，只重試失敗者（自 CBETA_WORKS_INDEX_RETRY 秒起倍增退避）；
+# 上游回應 4xx（藏經不存在）視為空藏經。已載入的藏經即可回答該藏經的查詢，跨藏經的查詢（作譯者、年代）
+# 需全部藏經都已載入（ready）。
+# query_works() 能由索引回答的查詢直接本機回傳（與上游 /works 相同的 {num_found, results} 結構），
+# 索引尚未載入完整、查詢條件不支援或查無 work 編號時才請求上游。
+# 回傳的佛典資料為索引內的同一物件，呼叫端只可讀取，不可修改。
+
+WORKS_INDEX_ENABLED = os.getenv("CBETA_WORKS_INDEX", "1") == "1"
+WORKS_INDEX_REFRESH = float(os.getenv("CBETA_WORKS_INDEX_REFRESH", str(24 * 3600)))
+WORKS_INDEX_SNAPSHOT = os.getenv("CBETA_WORKS_INDEX_SNAPSHOT", "cbeta_works_index.json.gz")  # 空字串停用快照
+WORKS_INDEX_MAX_VOL = int(os.getenv("CBETA_WORKS_INDEX_MAX_VOL", "999"))
+WORKS_INDEX_RETRY = float(os.getenv("CBETA_WORKS_INDEX_RETRY", "60"))
+WORKS_INDEX_CANONS = [
+    c.strip() for c in os.getenv(
+        "CBETA_WORKS_INDEX_CANONS",
+        "A,B,C,CC,D,F,G,GA,GB,I,J,K,L,LC,M,N,P,S,T,TX,U,X,Y,ZS,ZW",
+    ).split(",") if c.strip()
+]
+# 批次查詢（query_works_batch）：逐部查詢的並發上限，以及同一藏經缺漏達幾部時改為整部藏經一次查詢
+WORKS_BATCH_CONCURRENCY = int(os.getenv("CBETA_WORKS_BATCH_CONCURRENCY", "8"))
+WORKS_BATCH_CANON_MIN = int(os.getenv("CBETA_WORKS_BATCH_CANON_MIN", "20"))
+
+_CREATOR_WITH_ID = re.compile(r"([^;()]+)\(([A-Z]\d+)\)")
+_DIGITS = re.compile(r"(\d+)")
+_CANON_PREFIX = re.compile(r"^([A-Z]+)\d")
+
+
+def vol_number(work: Dict[str, Any]) -> Optional[int]:
+    """由 vol（如 "T01"、"GA001"）取出冊數。"""
+    vol = str(work.get("vol") or "")
+    canon = str(work.get("canon") or "")
+    match = _DIGITS.search(vol[len(canon):] if vol.startswith(canon) else vol)
+    return int(match.group(1)) if match else None
+
+
+def creator_ids(work: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """由 creators_with_id（如 "佛陀耶舍(A000439);竺佛念(A000435)"）取出 [(姓名, ID), ...]。"""
+    return [(name.strip(), cid) for name, cid in _CREATOR_WITH_ID.findall(work.get("creators_with_id") or "")]
+
+
+def creator_names(work: Dict[str, Any]) -> List[str]:
+    return [name.strip() for name in (work.get("creators") or "").split(",") if name.strip()]
+
+
+def _interval(work: Dict[str, Any]) -> Tuple[int, int, Dict[str, Any]]:
+    time_to = work.get("time_to")
+    return work["time_from"], work["time_from"] if time_to is None else time_to, work
+
+
+def _time_order(work: Dict[str, Any]) -> Tuple[int, int, str]:
+    # 未記錄年代者排在最後
+    time_from = work.get("time_from")
+    return (time_from is None, time_from or 0, work.get("work") or "")
+
+
+class WorksIndex:
+    def __init__(self):
+        self._canons: Dict[str, List[Dict[str, Any]]] = {}
+        self._build({}, complete=False)
+        self.loaded_at = 0.0
+        self.counters = {"local_hits": 0, "upstream_fallbacks": 0, "refreshes": 0, "refresh_errors": 0}
+
+    # ---------- 建立 ----------
+
+    def load(self, canons: Dict[str, List[Dict[str, Any]]], complete: bool, loaded_at: Optional[float] = None):
+        """以 {藏經: [佛典資料, ...]} 重建全部索引；建好後一次替換，查詢不會看到半成品。"""
+        self._build(canons, complete)
+        self.loaded_at = loaded_at or time.time()
+
+    def _build(self, canons: Dict[str, List[Dict[str, Any]]], complete: bool):
+        works: Dict[str, Dict[str, Any]] = {}
+        by_vol: Dict[str, Tuple[List[int], List[Dict[str, Any]]]] = {}
+        by_dynasty: Dict[str, List[Dict[str, Any]]] = {}
+        creator_rows = []  # (佛典資料, 全部姓名, [(姓名, ID), ...])
+        for canon, items in canons.items():
+            ranked = []
+            for work in items:
+                if not work.get("work"):
+                    continue
+                works[work["work"]] = work
+                vol = vol_number(work)
+                if vol is not None:
+                    ranked.append((vol, work["work"], work))
+                creator_rows.append((work, creator_names(work), creator_ids(work)))
+                if work.get("time_dynasty"):
+                    by_dynasty.setdefault(work["time_dynasty"], []).append(work)
+            ranked.sort(key=lambda item: item[:2])
+            by_vol[canon] = ([vol for vol, _, _ in ranked], [work for _, _, work in ranked])
+        timeline = IntervalIndex(_interval(w) for w in works.values() if w.get("time_from") is not None)
+        dynasty_timelines = {
+            dynasty: IntervalIndex(_interval(w) for w in items if w.get("time_from") is not None)
+            for dynasty, items in by_dynasty.items()
+        }
+        for items in by_dynasty.values():
+            items.sort(key=_time_order)
+
+        self._canons = canons
+        self._works = works
+        self._by_vol = by_vol
+        self._by_dynasty = by_dynasty
+        self._timeline = timeline
+        self._dynasty_timelines = dynasty_timelines
+        self.creators = CreatorIndex(creator_rows)
+        self.complete = complete
+
+    @property
+    def ready(self) -> bool:
+        return self.complete and bool(self._works)
+
+    def has_canon(self, canon: str) -> bool:
+        """該藏經的資料已載入（其他藏經仍可能缺漏）。"""
+        return canon in self._canons
+
+    def missing_canons(self) -> List[str]:
+        return [c for c in WORKS_INDEX_CANONS if c not in self._canons]
+
+    # ---------- 查詢 ----------
+
+    def get(self, work_id: str) -> Optional[Dict[str, Any]]:
+        return self._works.get(work_id)
+
+    def by_vol(self, canon: str, vol_start: int, vol_end: int) -> List[Dict[str, Any]]:
+        vols, works = self._by_vol.get(canon, ([], []))
+        return works[bisect.bisect_left(vols, vol_start):bisect.bisect_right(vols, vol_end)]
+
+    def by_creator_id(self, creator_id: str) -> List[Dict[str, Any]]:
+        return self.creators.by_id(creator_id)
+
+    def by_creator(self, name: str, unconfirmed_only: bool = False, match: str = "substring") -> List[Dict[str, Any]]:
+        """姓名比對（繁簡皆可）；unconfirmed_only 時只比對尚無作譯者 ID 的姓名。"""
+        return self.creators.works(name, match, unconfirmed_only)
+
+    def by_time(self, dynasties: Optional[List[str]] = None, time_start: Optional[int] = None,
+                time_end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        朝代（可多個）與西元年範圍（與 time_from~time_to 重疊即符合），依 time_from、work 排序。
+
+        只給朝代時包含未記錄年代的佛典；給了年代範圍時只含有年代者。
+        """
+        ranged = time_start is not None or time_end is not None
+        if not dynasties:
+            return sorted(self._timeline.overlap(time_start, time_end), key=_time_order) if ranged else []
+        results = []
+        for dynasty in dict.fromkeys(dynasties):
+            if ranged:
+                timeline = self._dynasty_timelines.get(dynasty)
+                results.extend(timeline.overlap(time_start, time_end) if timeline else [])
+            else:
+                results.extend(self._by_dynasty.get(dynasty, []))
+        if len(dynasties) > 1 or ranged:
+            results.sort(key=_time_order)
+        return results
+
+    def dynasty_counts(self, dynasties: Optional[List[str]] = None, time_start: Optional[int] = None,
+                       time_end: Optional[int] = None) -> Dict[str, int]:
+        """各朝代符合的佛典數（未指定朝代時列出所有朝代），不展開結果列表。"""
+        ranged = time_start is not None or time_end is not None
+        counts = {}
+        for dynasty in dynasties or sorted(self._by_dynasty):
+            if ranged:
+                timeline = self._dynasty_timelines.get(dynasty)
+                count = timeline.count(time_start, time_end) if timeline else 0
+            else:
+                count = len(self._by_dynasty.get(dynasty, []))
+            if count or dynasties:
+                counts[dynasty] = count
+        return counts
+
+    def answer(self, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """以索引回答 /works 查詢；無法回答時回傳 None（需請求上游）。"""
+        keys = {k for k, v in params.items() if v is not None}
+        if keys == {"work"}:
+            work = self.get(params["work"])
+            return [work] if work is not None else None
+        if keys == {"canon", "vol_start", "vol_end"}:
+            if not self.has_canon(params["canon"]):  # 未納入索引或尚未載入的藏經
+                return None
+            return self.by_vol(params["canon"], int(params["vol_start"]), int(params["vol_end"]))
+        if not self.ready:
+            return None
+        if keys == {"creator_id"}:
+            return self.by_creator_id(params["creator_id"])
+        if keys == {"creator"}:
+            return self.by_creator(params["creator"])
+        if keys == {"creator_name"}:
+            return self.by_creator(params["creator_name"], unconfirmed_only=True)
+        if keys and keys <= {"dynasty", "time_start", "time_end"}:
+            dynasties = [d.strip() for d in str(params.get("dynasty") or "").split(",") if d.strip()]
+            start = int(params["time_start"]) if params.get("time_start") is not None else None
+            end = int(params["time_end"]) if params.get("time_end") is not None else None
+            return self.by_time(dynasties, start, end)
+        return None
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "enabled": WORKS_INDEX_ENABLED,
+            "ready": self.ready,
+            "works": len(self._works),
+            "canons": len(self._canons),
+            "missing_canons": self.missing_canons(),
+            "creators": self.creators.id_count,
+            "creator_names": len(self.creators),
+            "loaded_at": int(self.loaded_at),
+        }
+
+
+works_index = WorksIndex()
+
+
+async def query_works(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    /works 查詢入口：先查本機索引，無法回答時改以 cbeta_get 請求上游。
+
+    回傳與上游相同的 {"num_found": ..., "results": [...]} 結構。
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    results = works_index.answer(params) if WORKS_INDEX_ENABLED else None
+    if results is not None:
+        works_index.counters["local_hits"] += 1
+        trace_event("works_index", params=params, source="local", num_found=len(results))
+        return {"num_found": len(results), "results": results}
+    works_index.counters["upstream_fallbacks"] += 1
+    return await cbeta_get("/works", params)
+
+
+async def query_works_batch(works: List[str], concurrency: int = WORKS_BATCH_CONCURRENCY) -> Dict[str, Dict[str, Any]]:
+    """
+    多部佛典資料，回傳 {work: 佛典資料或 {"error": ...}}，依輸入順序（重複者只列一次）。
+
+    先查本機索引；其餘依藏經分組，同一藏經缺漏達 WORKS_BATCH_CANON_MIN 部時以一次 /works 藏經查詢
+    （單次回傳整部藏經）取得，其餘逐部查詢，並發數不超過 concurrency。
+    """
+    works = list(dict.fromkeys(w.strip() for w in works if w and w.strip()))
+    found: Dict[str, Dict[str, Any]] = {}
+    misses: Dict[str, List[str]] = {}
+    for work in works:
+        info = works_index.get(work) if WORKS_INDEX_ENABLED else None
+        if info is not None:
+            found[work] = info
+            continue
+        match = _CANON_PREFIX.match(work)
+        misses.setdefault(match.group(1) if match else "", []).append(work)
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(work: str):
+        async with gate:
+            try:
+                data = await query_works({"work": work})
+                results = data.get("results") or []
+                found[work] = results[0] if results else {"error": "查無此佛典資訊"}
+            except Exception as e:
+                found[work] = {"error": str(e)}
+
+    async def whole_canon(canon: str, items: List[str]):
+        async with gate:
+            try:
+                rows = {row.get("work"): row for row in await _fetch_canon(canon)}
+            except Exception:
+                rows = None
+        if rows is None:  # 整部查詢失敗時改為逐部查詢
+            await asyncio.gather(*(one(w) for w in items))
+            return
+        for work in items:
+            found[work] = rows.get(work) or {"error": "查無此佛典資訊"}
+
+    tasks = []
+    for canon, items in misses.items():
+        if canon and len(items) >= WORKS_BATCH_CANON_MIN:
+            tasks.append(whole_canon(canon, items))
+        else:
+            tasks.extend(one(w) for w in items)
+    await asyncio.gather(*tasks)
+    trace_event("works_index", params={"works": len(works)}, source="batch",
+                local=len(works) - sum(len(items) for items in misses.values()))
+    return {work: found[work] for work in works}
+
+
+async def query_creator(field: str, value: str, match: str = "substring") -> Dict[str, Any]:
+    """
+    單一作譯者條件（field 為 creator_id / creator / creator_name）的查詢入口。
+
+    回傳 {"num_found", "results", "matched_names"}；索引未就緒時以上游部分比對的結果在本機篩選，
+    此時 fuzzy 退回部分比對，matched_names 為結果中實際符合的姓名。
+    """
+    if match not in MATCH_MODES:
+        raise ValueError(f"match 僅支援 {', '.join(MATCH_MODES)}")
+    if WORKS_INDEX_ENABLED and works_index.ready:
+        works_index.counters["local_hits"] += 1
+        if field == "creator_id":
+            results = works_index.by_creator_id(value)
+            name = works_index.creators.name_of(value)
+            matched = [name] if name else []
+        else:
+            results = works_index.by_creator(value, unconfirmed_only=field == "creator_name", match=match)
+            matched = works_index.creators.match(value, match)
+        trace_event("works_index", params={field: value, "match": match}, source="local", num_found=len(results))
+        return {"num_found": len(results), "results": results, "matched_names": matched}
+
+    data = await query_works({field: value})
+    results = list(data.get("results") or [])
+    if field == "creator_id":
+        names = {name for work in results for name, cid in creator_ids(work) if cid == value}
+    else:
+        key = fold(value)
+        if match == "exact":
+            accept = lambda folded: folded == key
+        elif match == "prefix":
+            accept = lambda folded: folded.startswith(key)
+        else:
+            accept = lambda folded: key in folded
+        names = set()
+        kept = []
+        for work in results:
+            hits = {name for name in creator_names(work) if accept(fold(name))}
+            if hits:
+                names |= hits
+                kept.append(work)
+        results = kept
+    return {"num_found": len(results), "results": results, "matched_names": sorted(names)}
+
+
+# ---------- 下載、快照與定期更新 ----------
+
+async def _fetch_canon(canon: str) -> List[Dict[str, Any]]:
+    # 批次資料不寫入回應快取，避免佔用記憶體層容量
+    data = await cbeta_get(
+        "/works", {"canon": canon, "vol_start": 1, "vol_end": WORKS_INDEX_MAX_VOL}, use_cache=False
+    )
+    return list(data.get("results") or [])
+
+
+async def refresh_works_index(targets: Optional[List[str]] = None) -> List[str]:
+    """
+    重新下載指定藏經（預設全部）並併入索引，回傳下載失敗的藏經。
+
+    失敗的藏經沿用舊資料；全部藏經都有資料時標記為完整並寫入快照。
+    """
+    targets = list(targets or WORKS_INDEX_CANONS)
+    fetched = await asyncio.gather(*(_fetch_canon(c) for c in targets), return_exceptions=True)
+    canons = dict(works_index._canons)
+    failed = []
+    for canon, result in zip(targets, fetched):
+        if isinstance(result, httpx.HTTPStatusError) and not is_upstream_failure(result):
+            print(f"⚠️ 上游查無藏經 {canon}（{result.response.status_code}），以空藏經處理")
+            result = []
+        if isinstance(result, Exception):
+            failed.append(canon)
+            print(f"⚠️ 佛典目錄索引下載失敗：{canon}，錯誤：{result}")
+            continue
+        canons[canon] = result
+    complete = all(c in canons for c in WORKS_INDEX_CANONS)
+    works_index.load(canons, complete)
+    works_index.counters["refreshes"] += 1
+    if failed:
+        works_index.counters["refresh_errors"] += 1
+    if complete and WORKS_INDEX_SNAPSHOT:
+        await asyncio.get_running_loop().run_in_executor(None, _save_snapshot, canons)
+    return failed
+
+
+def _save_snapshot(canons: Dict[str, List[Dict[str, Any]]]):
+    tmp = WORKS_INDEX_SNAPSHOT + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump({"saved_at": time.time(), "api_base": CBETA_API_BASE, "canons": canons}, f, ensure_ascii=False)
+    os.replace(tmp, WORKS_INDEX_SNAPSHOT)
+
+
+def _load_snapshot() -> Optional[Dict[str, Any]]:
+    if not WORKS_INDEX_SNAPSHOT or not os.path.exists(WORKS_INDEX_SNAPSHOT):
+        return None
+    try:
+        with gzip.open(WORKS_INDEX_SNAPSHOT, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 佛典目錄索引快照讀取失敗：{e}")
+        return None
+    if snapshot.get("api_base") != CBETA_API_BASE:
+        print(f"⚠️ 佛典目錄索引快照來自其他上游（{snapshot.get('api_base')}），不予採用")
+        return None
+    return snapshot
+
+
+async def _refresh_loop():
+    snapshot = await asyncio.get_running_loop().run_in_executor(None, _load_snapshot)
+    delay, retry, attempt = 0.0, None, 0
+    if snapshot:
+        canons = {c: items for c, items in snapshot["canons"].items() if c in WORKS_INDEX_CANONS}
+        complete = all(c in canons for c in WORKS_INDEX_CANONS)
+        works_index.load(canons, complete, loaded_at=snapshot["saved_at"])
+        if complete:
+            delay = max(0.0, snapshot["saved_at"] + WORKS_INDEX_REFRESH - time.time())
+        else:  # 快照之後新增的藏經
+            retry = works_index.missing_canons()
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            failed = await refresh_works_index(retry)
+        except Exception as e:
+            works_index.counters["refresh_errors"] += 1
+            failed = retry or list(WORKS_INDEX_CANONS)
+            print(f"⚠️ 佛典目錄索引更新失敗：{e}")
+        if failed:
+            # 只重試失敗的藏經，間隔倍增
+            retry, attempt = failed, attempt + 1
+            delay = min(WORKS_INDEX_REFRESH, WORKS_INDEX_RETRY * 2 ** min(attempt - 1, 16))
+        else:
+            retry, attempt = None, 0
+            delay = WORKS_INDEX_REFRESH
+
+
+if WORKS_INDEX_ENABLED:
+    register_background_task("cbeta_works_index", _refresh_loop)
+register_stats("cbeta_works_index", works_index.stats)
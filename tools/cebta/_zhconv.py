@@ -0,0 +1,77 @@
+import importlib.util
+from functools import lru_cache
+
+# 繁簡正規化（比對用）
+#
+# fold() 把文字轉為簡體，使繁體、簡體與混寫的查詢都能對到同一個索引鍵。
+# 使用 opencc（requirements.txt 已列入）的 t2s 轉換；opencc 無法安裝或初始化失敗時退回內建的常用字對照表
+# （約三百組人名、經名、朝代常見字）。對照表只是盡力而為：表外的字不轉換，此時繁簡混寫的查詢可能比對不到，
+# 結果與安裝 opencc 時不同。只用於比對，不用於輸出。
+# fold_mode() 回傳目前使用的轉換方式，建立本機全文索引時記入索引，載入時比對。
+
+# 繁 → 簡，每組兩字
+_PAIRS = """
+萬万 與与 專专 業业 東东 絲丝 兩两 嚴严 喪丧 個个 豐丰 臨临 為为 爲为 麗丽 舉举 義义 烏乌 樂乐 習习 鄉乡
+書书 買买 亂乱 爭争 於于 虧亏 雲云 亞亚 產产 親亲 億亿 僅仅 從从 倉仓 儀仪 們们 價价 眾众 衆众 優优 會会
+偉伟 傳传 傷伤 倫伦 偽伪 體体 餘余 俠侠 侶侣 債债 傾倾 償偿 儲储 兒儿 內内 岡冈 冊册 寫写 軍军 農农 馮冯
+沖冲 決决 況况 凍冻 淨净 淩凌 減减 湊凑 凜凛 幾几 鳳凤 處处 憑凭 凱凯 擊击 鑿凿 劃划 劉刘 則则 剛刚 創创
+刪删 別别 剎刹 劑剂 劍剑 劇剧 勸劝 辦办 務务 動动 勵励 勁劲 勞劳 勢势 勳勋 勝胜 區区 醫医 華华 協协 單单
+賣卖 盧卢 衛卫 卻却 廠厂 廳厅 歷历 曆历 厲厉 壓压 厭厌 縣县 參参 雙双 發发 變变 敘叙 葉叶 號号 嘆叹 嘰叽
+嚇吓 呂吕 嗎吗 噸吨 聽听 啟启 吳吴 嘔呕 員员 響响 嗆呛 嗚呜 詠咏 嚨咙 嘩哗 嘵哓 喚唤 啞哑 喲哟 嗇啬
+團团 園园 圍围 圖图 圓圆 聖圣 場场 壞坏 塊块 堅坚 壇坛 壩坝 墳坟 墜坠 壟垄 壘垒 墾垦 執执 報报 塗涂 壺壶
+聲声 處处 備备 復复 複复 夠够 夢梦 頭头 誇夸 夾夹 奪夺 奮奋 獎奖 奧奥 妝妆 婦妇 媽妈 嫵妩 孫孙 學学 寧宁
+寶宝 實实 寵宠 審审 憲宪 宮宫 寬宽 賓宾 對对 尋寻 導导 壽寿 將将 爾尔 塵尘 嘗尝 層层 屬属 歲岁 豈岂 島岛
+嶺岭 嶽岳 峯峰 崗岗 巖岩 幣币 帥帅 師师 帳帐 帶带 幫帮 幹干 廣广 莊庄 慶庆 廬庐 廟庙 應应 廢废 開开 異异
+棄弃 張张 彌弥 彎弯 強强 歸归 當当 錄录 彥彦 徹彻 徑径 徵征 懷怀 態态 憂忧 憶忆 懺忏 懸悬 懼惧 戀恋 戰战
+戲戏 戶户 擇择 擔担 據据 攝摄 擬拟 擁拥 撥拨 擴扩 掃扫 揚扬 換换 擾扰 撫抚 搶抢 護护 報报 擬拟 敵敌 數数
+斷断 齋斋 時时 晝昼 顯显 曉晓 暫暂 暢畅 書书 會会 東东 條条 來来 楊杨 極极 構构 樣样 樓楼 標标 樹树 橋桥
+機机 權权 歡欢 歐欧 歷历 殘残 殺杀 殼壳 毀毁 氣气 漢汉 湯汤 溝沟 沒没 潔洁 濃浓 滅灭 滿满 濟济 潛潜 澤泽
+濤涛 灑洒 灣湾 災灾 爐炉 煉炼 鍊炼 為为 無无 煩烦 熱热 燈灯 營营 燦灿 爭争 牆墙 獨独 獄狱 獻献 猶犹 獅狮
+環环 現现 璽玺 產产 畫画 當当 疊叠 療疗 癡痴 發发 盡尽 監监 盤盘 盧卢 眾众 睜睁 礙碍 確确 祕秘 禮礼 禱祷
+禪禅 禍祸 種种 稱称 穀谷 積积 穩稳 窮穷 竊窃 競竞 筆笔 節节 範范 築筑 簡简 籌筹 糧粮 糾纠 紀纪 約约 紅红
+純纯 紙纸 級级 紛纷 細细 終终 組组 結结 給给 絕绝 統统 經经 綠绿 維维 網网 綱纲 緒绪 緣缘 編编 練练 總总
+績绩 織织 繩绳 繼继 續续 纏缠 罰罚 羅罗 羣群 習习 聞闻 聯联 聰聪 職职 肅肃 脫脱 腦脑 臉脸 臺台 與与 興兴
+舊旧 艱艰 藝艺 蘭兰 蓋盖 蒼苍 薦荐 薩萨 藍蓝 藥药 蘊蕴 蘇苏 蓮莲 葦苇 蔣蒋 蕭萧 虛虚 蟲虫 術术 補补 裝装
+裏里 製制 襲袭 見见 規规 視视 覺觉 覽览 觀观 觸触 計计 訂订 記记 設设 訪访 訓训 託托 許许 詩诗 話话 語语
+誠诚 誦诵 調调 談谈 請请 諍诤 講讲 證证 識识 讀读 讓让 評评 詞词 詳详 誌志 認认 說说 説说 誰谁 課课 論论
+諦谛 諸诸 謀谋 謂谓 謙谦 謹谨 譜谱 議议 譽誉 讚赞 贊赞 譯译 讖谶 訶诃 謝谢 貝贝 貞贞 財财 貧贫 貴贵 資资
+賴赖 貫贯 責责 賀贺 賜赐 賞赏 賢贤 質质 購购 贈赠 費费 趙赵 蹤踪 跡迹 車车 軌轨 輪轮 輕轻 輝辉 轉转 較较
+載载 輔辅 輯辑 辭辞 這这 邁迈 進进 連连 選选 遺遗 運运 過过 還还 邊边 達达 遠远 適适 遲迟 鄭郑 鄧邓 鄴邺
+醜丑 釋释 針针 鈔钞 銀银 銅铜 鐵铁 錯错 錢钱 錫锡 銘铭 鋒锋 錦锦 鑑鉴 鏡镜 鐘钟 鍾钟 鎮镇 鏈链 缽钵 鉢钵
+長长 門门 問问 閉闭 閏闰 閑闲 閒闲 間间 閣阁 閱阅 闊阔 關关 闕阙 闍阇 闡阐 陣阵 陰阴 陽阳 陳陈 陸陆 際际
+隊队 階阶 隨随 隱隐 險险 雖虽 雜杂 離离 難难 電电 靈灵 靜静 韓韩 韋韦 韻韵 頁页 頂顶 頓顿 須须 頌颂 領领
+題题 類类 顏颜 願愿 顧顾 風风 飄飘 飛飞 飯饭 飲饮 養养 館馆 馬马 駕驾 騎骑 驗验 驚惊 髮发 鬥斗 鬧闹 鬱郁
+魚鱼 鳥鸟 鳩鸠 鳴鸣 鴻鸿 鵝鹅 鶴鹤 鶯莺 鸞鸾 鹽盐 麥麦 麼么 黃黄 黨党 點点 齊齐 齒齿 齡龄 龍龙 龐庞 龜龟
+曇昙 婁娄 窺窥 綽绰 紹绍 晉晋 遼辽 後后 國国 蘿萝 嚕噜 囉啰 噠哒 彙汇 誡诫 懺忏 頗颇 護护 釋释
+"""
+
+_TABLE = {}
+for _pair in _PAIRS.split():
+    if len(_pair) == 2 and _pair[0] != _pair[1]:
+        _TABLE[ord(_pair[0])] = _pair[1]
+
+_converter = None
+if importlib.util.find_spec("opencc") is not None:
+    try:
+        import opencc
+        _converter = opencc.OpenCC("t2s")
+    except Exception as e:
+        print(f"⚠️ opencc 初始化失敗，改用內建繁簡對照表：{e}")
+else:
+    print("⚠️ 未安裝 opencc，繁簡比對改用內建常用字對照表（表外的字不轉換）")
+
+
+@lru_cache(maxsize=65536)
+def fold(text: str) -> str:
+    """轉為簡體並去除空白，供索引與查詢比對。"""
+    text = "".join(text.split())
+    if _converter is not None:
+        return _converter.convert(text)
+    return text.translate(_TABLE)
+
+
+def fold_mode() -> dict:
+    """目前的繁簡轉換方式：{"mode": "opencc" / "table", "version": opencc 版本或對照表字數}。"""
+    if _converter is not None:
+        return {"mode": "opencc", "version": str(getattr(opencc, "__version__", ""))}
+    return {"mode": "table", "version": str(len(_TABLE))}
@@ -1,11 +1,15 @@
 from pydantic import BaseModel
 from typing import Optional
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._catalog_tree import query_catalog
 import httpx
 
+MAX_DEPTH = 5
+
 # 定義請求參數模型，用於驗證輸入參數
 class CBETACatalogParams(BaseModel):
     q: str  # 查詢節點編號，例如 'root'、'CBETA'、'orig-T'、'CBETA.001' 等
+    depth: Optional[int] = 1  # 展開層數：1 只回傳該節點的下一層；2 以上時各項目帶 children（最多 5 層）
 
 # 註冊 MCP 工具函數，支援 POST 調用
 @__mcp_server__.tool()
@@ -26,6 +30,7 @@ async def get_cbeta_catalog(params: CBETACatalogParams):
 
     📥 輸入參數：
     - q (str): 查詢字串，對應 CBETA API 的查詢參數
+    - depth (int, 選填): 一次展開的層數，預設 1；例如 q="CBETA", depth=2 同時取得各部類的下層目錄
 
     📤 回傳格式（示例）：
     {
@@ -39,6 +44,9 @@ async def get_cbeta_catalog(params: CBETACatalogParams):
         ]
     }
 
+    depth >= 2 時，可展開的項目多一個 children 欄位（下層的 results，可再巢狀）：
+    {"n": "CBETA.001", "label": "01 阿含部類 ...", "children": [{"n": "CBETA.001.001", ...}, ...]}
+
     🔁 子節點查詢方式：
     可根據任一回傳項目的 `n` 字段進一步查詢下層，如：
     - 查詢 CBETA.001 的下層：q="CBETA.001"
@@ -46,14 +54,15 @@ async def get_cbeta_catalog(params: CBETACatalogParams):
 
     ⚠️ 注意事項：
     - 若 node_type 為 'alt'，代表該節點未直接收錄全文，可透過對應藏經節點查詢。
+    - 目錄樹在背景預先下載並定期更新，查詢通常不需請求上游。
 
     """
-    url = "https://api.cbetaonline.cn/catalog_entry"
+    depth = params.depth or 1
+    if depth < 1 or depth > MAX_DEPTH:
+        return error_response(f"depth 必須介於 1 到 {MAX_DEPTH} 之間")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params={"q": params.q})
-            response.raise_for_status()
-            return success_response(response.json())
+        data = await query_catalog(params.q, depth)
+        return success_response(data)
     except httpx.HTTPError as e:
         return error_response(f"HTTP 錯誤: {str(e)}")
     except Exception as e:
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
 import httpx
 
 # 定義請求參數模型
@@ -61,12 +62,9 @@ async def search_cbeta_texts(params: CBETATextSearchParams):
     但本工具仍支援 toc API，以兼容既有查詢邏輯。
 
     """
-    url = "https://api.cbetaonline.cn/toc"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params={"q": params.q})
-            response.raise_for_status()
-            return success_response(response.json())
+        data = await cbeta_get("/toc", {"q": params.q})
+        return success_response(data)
     except httpx.HTTPError as e:
         return error_response(f"HTTP 錯誤: {str(e)}")
     except Exception as e:
@@ -1,7 +1,7 @@
-import httpx
 from pydantic import BaseModel
 from typing import Optional
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._works_index import query_works
 
 # 定义请求参数格式
 class BuddhistCanonSearchParams(BaseModel):
@@ -25,7 +25,6 @@ async def search_buddhist_canons_by_vol(params: BuddhistCanonSearchParams):
 
     外部 API 來源：https://api.cbetaonline.cn/works?canon=T&vol_start=1&vol_end=2
     """
-    url = "https://api.cbetaonline.cn/works"
     query_params = {
         "canon": params.canon,
         "vol_start": params.vol_start,
@@ -33,14 +32,11 @@ async def search_buddhist_canons_by_vol(params: BuddhistCanonSearchParams):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params=query_params)
-            resp.raise_for_status()
-            data = resp.json()
-            return success_response({
-                "num_found": data.get("num_found"),
-                "results": data.get("results", [])
-            })
+        data = await query_works(query_params)
+        return success_response({
+            "num_found": data.get("num_found"),
+            "results": data.get("results", [])
+        })
     except Exception as e:
         return error_response(f"API 請求失敗: {str(e)}")
 
@@ -1,7 +1,9 @@
+import asyncio
 from pydantic import BaseModel
-from typing import Optional
-import httpx
+from typing import List, Optional
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._works_index import query_works, query_creator
+from tools.cebta._creators import MATCH_MODES
 
 # =======================
 # ✅ 定義請求參數
@@ -10,6 +12,10 @@ class TranslatorSearchParams(BaseModel):
     creator_id: Optional[str] = None  # 作譯者 ID，如 A000439
     creator: Optional[str] = None     # 作譯者姓名模糊搜尋，如 "竺"
     creator_name: Optional[str] = None  # 僅搜尋尚未確認 ID 的譯者，如 "竺"
+    creator_ids: Optional[List[str]] = None  # 多個作譯者 ID
+    creators: Optional[List[str]] = None     # 多個作譯者姓名
+    match: Optional[str] = None    # 姓名比對方式：substring（預設）、prefix、exact、fuzzy；繁簡皆可
+    combine: Optional[str] = "or"  # 多個條件：or 聯集、and 交集（同時符合）
 
 # =======================
 # ✅ 註冊 MCP 工具
@@ -20,10 +26,15 @@ async def search_works_by_translator(params: TranslatorSearchParams):
     📘 根據 CBETA Online 的作譯者資訊搜尋作品。
 
     支援三種搜尋方式：
-    1. 指定作譯者 ID 搜尋（creator_id）
-    2. 作譯者姓名模糊搜尋（creator）
+    1. 指定作譯者 ID 搜尋（creator_id，多個用 creator_ids）
+    2. 作譯者姓名模糊搜尋（creator，多個用 creators）
     3. 僅搜尋尚未確認 ID 的姓名（creator_name）
 
+    姓名比對由本機作譯者索引回答，繁體、簡體查詢皆可；match 可選 substring（部分比對，預設）、
+    prefix（開頭相符）、exact（完全相符）、fuzzy（近似姓名）。
+    給多個條件時以 combine 合併（or 聯集、and 交集），結果依 work 排序，
+    並在 criteria 列出每個條件符合的姓名與佛典編號。
+
     ✅ 示例請求：
     {
         "creator_id": "A000439"
@@ -36,6 +47,12 @@ async def search_works_by_translator(params: TranslatorSearchParams):
     {
         "creator_name": "竺"
     }
+    或：
+    {
+        "creators": ["鳩摩羅什", "玄奘"],
+        "creator_ids": ["A000439"],
+        "match": "prefix"
+    }
 
     ✅ 示例返回：
     {
@@ -68,25 +85,64 @@ async def search_works_by_translator(params: TranslatorSearchParams):
             ]
         }
     }
-    """
-    url = "https://api.cbetaonline.cn/works"
-    query_params = {}
 
+    多個條件時另外返回：
+    "criteria": [
+        {"creator": "玄奘", "matched_names": ["玄奘"], "num_found": 76, "works": ["T0220", ...]},
+        ...
+    ]
+    """
     # 根據參數建立對應查詢條件
-    if params.creator_id:
-        query_params["creator_id"] = params.creator_id
-    elif params.creator:
-        query_params["creator"] = params.creator
-    elif params.creator_name:
-        query_params["creator_name"] = params.creator_name
-    else:
-        return error_response("請至少提供一個搜尋參數：creator_id、creator 或 creator_name")
+    criteria = []
+    for creator_id in [params.creator_id] + list(params.creator_ids or []):
+        if creator_id:
+            criteria.append(("creator_id", creator_id))
+    for creator in [params.creator] + list(params.creators or []):
+        if creator:
+            criteria.append(("creator", creator))
+    if params.creator_name:
+        criteria.append(("creator_name", params.creator_name))
+    criteria = list(dict.fromkeys(criteria))
+    if not criteria:
+        return error_response("請至少提供一個搜尋參數：creator_id、creator、creator_name、creator_ids 或 creators")
+    match = params.match or "substring"
+    if match not in MATCH_MODES:
+        return error_response(f"match 僅支援：{', '.join(MATCH_MODES)}")
+    combine = (params.combine or "or").lower()
+    if combine not in ("or", "and"):
+        return error_response("combine 僅支援 or 或 and")
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params=query_params)
-            resp.raise_for_status()
-            data = resp.json()
+        if len(criteria) == 1 and match == "substring":
+            field, value = criteria[0]
+            data = await query_works({field: value})
             return success_response(data)
+
+        answers = await asyncio.gather(*(query_creator(field, value, match) for field, value in criteria))
+        works = {}
+        matched_ids = None
+        for answer in answers:
+            ids = set()
+            for work in answer["results"]:
+                works.setdefault(work["work"], work)
+                ids.add(work["work"])
+            matched_ids = ids if matched_ids is None else (
+                matched_ids | ids if combine == "or" else matched_ids & ids
+            )
+        results = [works[work_id] for work_id in sorted(matched_ids)]
+        data = {
+            "num_found": len(results),
+            "results": results,
+            "criteria": [
+                {
+                    field: value,
+                    "matched_names": answer["matched_names"],
+                    "num_found": answer["num_found"],
+                    "works": [work["work"] for work in answer["results"]],
+                }
+                for (field, value), answer in zip(criteria, answers)
+            ],
+        }
+        return success_response(data)
     except Exception as e:
         return error_response(f"查詢失敗: {str(e)}")
\ No newline at end of file
@@ -1,13 +1,37 @@
 from pydantic import BaseModel
 from typing import Optional, List
-import httpx
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._works_index import query_works, works_index
+
+# 排序可用字段（前缀 "-" 表示降序），缺值者一律排在最后
+SORT_FIELDS = {"time_from", "time_to", "work", "title", "juan", "cjk_chars"}
+MAX_ROWS = 1000
 
 # ✅ 定义请求参数模型
 class CBETADynastySearchParams(BaseModel):
     dynasty: Optional[str] = None  # 可传入单个朝代名称或多个朝代，以英文逗号分隔
     time_start: Optional[int] = None  # 可选：起始年份，如 600
     time_end: Optional[int] = None    # 可选：结束年份，如 700
+    rows: Optional[int] = None        # 可选：分页每页笔数；未提供时只返回前 2 笔示例
+    start: Optional[int] = 0          # 可选：分页起始位置
+    sort: Optional[str] = None        # 可选：排序字段，如 time_from、-time_to、work
+    counts_only: Optional[int] = 0    # 可选：1 = 只返回各朝代数量（时间轴统计用）
+
+
+def _sorted(results: List[dict], sort: str) -> List[dict]:
+    field = sort.lstrip("-")
+    # 先按 work 排序，同值时保持 work 升序（sort 为稳定排序，降序亦然）
+    present = sorted((w for w in results if w.get(field) is not None), key=lambda w: w.get("work") or "")
+    present.sort(key=lambda w: w[field], reverse=sort.startswith("-"))
+    return present + [w for w in results if w.get(field) is None]
+
+
+def _count_by_dynasty(results: List[dict]) -> dict:
+    counts = {}
+    for work in results:
+        dynasty = work.get("time_dynasty") or ""
+        counts[dynasty] = counts.get(dynasty, 0) + 1
+    return counts
 
 
 # ✅ 注册 MCP 工具接口
@@ -17,33 +41,59 @@ async def search_cbeta_by_dynasty(params: CBETADynastySearchParams):
     通过朝代名称或公元时间范围搜索 CBETA 佛典。
 
     - 可输入 dynasty 参数（支持多个朝代名，用英文逗号隔开）
-    - 可输入公元年范围：time_start 和 time_end
-    - 若二者皆为空，则返回错误
+    - 可输入公元年范围：time_start 和/或 time_end（与佛典成立年代区间重叠即符合）
+    - 若二者皆为空，则返回错误（counts_only=1 时可皆为空，统计所有朝代）
+    - rows / start：分页；sort：排序字段（默认按 time_from）
+    - counts_only=1：只返回各朝代数量，不返回佛典列表
+
+    本地佛典目录索引就绪时，由区间索引在本机以对数时间回答；否则请求上游后在本机排序分页。
     """
-    if not params.dynasty and not (params.time_start and params.time_end):
-        return error_response("请提供 dynasty 或 time_start 与 time_end 参数")
+    has_time = params.time_start is not None or params.time_end is not None
+    if not params.dynasty and not has_time and not params.counts_only:
+        return error_response("请提供 dynasty 或 time_start / time_end 参数")
+    sort = params.sort or "time_from"
+    if sort.lstrip("-") not in SORT_FIELDS:
+        return error_response(f"sort 仅支持：{', '.join(sorted(SORT_FIELDS))}（前缀 - 表示降序）")
+
+    dynasties = [d.strip() for d in (params.dynasty or "").split(",") if d.strip()]
 
     # 构建请求参数
     query_params = {}
     if params.dynasty:
         query_params["dynasty"] = params.dynasty
-    if params.time_start:
+    if params.time_start is not None:
         query_params["time_start"] = params.time_start
-    if params.time_end:
+    if params.time_end is not None:
         query_params["time_end"] = params.time_end
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/works", params=query_params)
-            resp.raise_for_status()
-            data = resp.json()
+        if params.counts_only:
+            if works_index.ready:
+                counts = works_index.dynasty_counts(dynasties, params.time_start, params.time_end)
+            elif query_params:
+                counts = _count_by_dynasty((await query_works(query_params)).get("results", []))
+            else:
+                return error_response("本地佛典目录索引尚未就绪，请提供 dynasty 或时间范围")
+            return success_response({"num_found": sum(counts.values()), "counts": counts})
+
+        data = await query_works(query_params)
+        results = _sorted(data.get("results", []), sort)
 
+        if params.rows is None:
             # ✅ 示例返回结构，便于 LLM 调用演示
             example = {
-                "num_found": data.get("num_found", 0),
-                "sample_result": data.get("results", [])[:2]  # 仅展示前2条用于示例
+                "num_found": data.get("num_found", len(results)),
+                "sample_result": results[:2]  # 仅展示前2条用于示例
             }
-
             return success_response(example)
+
+        start = max(params.start or 0, 0)
+        rows = min(max(params.rows, 0), MAX_ROWS)
+        return success_response({
+            "num_found": len(results),
+            "start": start,
+            "rows": rows,
+            "results": results[start:start + rows],
+        })
     except Exception as e:
         return error_response(f"CBETA 查詢失敗: {str(e)}")
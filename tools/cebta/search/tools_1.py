@@ -1,7 +1,10 @@
-import httpx
 from typing import Optional
 from pydantic import BaseModel
+from mcp.server.fastmcp import Context
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._fulltext import local_fulltext
+from tools.cebta._paginate import PAGINATE_MAX_RESULTS, paginate, report_to
 
 # 📘 CBETA 一般全文檢索工具
 # 說明：
@@ -14,6 +17,8 @@ from main import __mcp_server__, success_response, error_response
 # - rows (int): 【選填】每頁回傳筆數，預設為 20
 # - start (int): 【選填】回傳的起始筆數，預設為 0
 # - order (str): 【選填】排序欄位，例如 "time_from-" 表示依成立年代降序
+# - auto_paginate (int): 【選填】1 = 自動翻頁，由 start 起取回最多 max_results 筆（rows 不使用）
+# - max_results (int): 【選填】自動翻頁的筆數上限，預設與上限為 CBETA_PAGINATE_MAX_RESULTS
 # 
 # 📥 範例請求：
 # {
@@ -60,6 +65,11 @@ from main import __mcp_server__, success_response, error_response
 #     }
 #   ]
 # }
+#
+# 設定 CBETA_FULLTEXT_MODE 並建好本機全文索引後，可改由本機回答或在上游故障時回退（見 _fulltext），
+# 結構相同，另帶 "source": "local"。
+# 自動翻頁時各頁並發取得、依序合併去重（見 _paginate），結構同上，另帶 fetched、pages 與 truncated / failed；
+# 每頁完成時以 MCP 進度通知回報已取得筆數。
 
 class CBETASearchParams(BaseModel):
     q: str  # 搜尋關鍵字（必填）
@@ -67,18 +77,28 @@ class CBETASearchParams(BaseModel):
     rows: Optional[int] = 20  # 每頁筆數
     start: Optional[int] = 0  # 起始位置
     order: Optional[str] = None  # 排序規則
+    auto_paginate: Optional[int] = 0  # 1 = 自動翻頁取回全部結果
+    max_results: Optional[int] = None  # 自動翻頁的筆數上限
 
 @__mcp_server__.tool()
-async def cbeta_fulltext_search(params: CBETASearchParams):
+async def cbeta_fulltext_search(params: CBETASearchParams, ctx: Optional[Context] = None):
     """
     CBETA 一般全文檢索工具，使用 CBETA Open API 搜尋佛典。
     文件：https://api.cbetaonline.cn/search
     """
     try:
-        query_params = {k: v for k, v in params.dict().items() if v is not None}
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            resp = await client.get("https://api.cbetaonline.cn/search", params=query_params)
-            resp.raise_for_status()
-            return success_response(resp.json())
+        query_params = {k: v for k, v in params.dict(exclude={"auto_paginate", "max_results"}).items() if v is not None}
+
+        def fetch(page_params):
+            return local_fulltext.answer(
+                "search", page_params, lambda: cbeta_get("/search", page_params, timeout=20.0)
+            )
+
+        if params.auto_paginate:
+            data = await paginate(lambda start, rows: fetch({**query_params, "start": start, "rows": rows}),
+                                  params.start or 0, params.max_results or PAGINATE_MAX_RESULTS, report_to(ctx))
+        else:
+            data = await fetch(query_params)
+        return success_response(data)
     except Exception as e:
         return error_response(f"CBETA 搜尋失敗: {str(e)}")
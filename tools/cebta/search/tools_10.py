@@ -1,7 +1,9 @@
 from pydantic import BaseModel
 from typing import Optional
-import httpx
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._fulltext import local_fulltext
+from tools.cebta._similar import similar_search
 
 # ==========================
 # CBETA 相似搜尋工具模組
@@ -57,11 +59,18 @@ async def cbeta_similar_search(params: CBETASimilarSearchParams):
     - results: 命中資料陣列（含經文標題、段落、句子與比對標記）
 
     🔗 API 來源：https://api.cbetaonline.cn/search/similar
+
+    設定 CBETA_FULLTEXT_MODE 並建好本機全文索引後，可改在本機以相同參數比對（見 _similar），
+    結果另帶 "source": "local"；facet=1 時一律請求上游。
     """
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/search/similar", params=params.dict())
-            resp.raise_for_status()
-            return success_response(resp.json())
+        query_params = params.dict()
+        data = await local_fulltext.answer(
+            "similar",
+            query_params,
+            lambda: cbeta_get("/search/similar", query_params, use_cache=bool(params.cache)),
+            local=lambda: similar_search.search(query_params),
+        )
+        return success_response(data)
     except Exception as e:
         return error_response(f"CBETA 相似搜尋失敗: {str(e)}")
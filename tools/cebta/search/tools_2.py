@@ -2,9 +2,12 @@
 
 from pydantic import BaseModel
 from typing import Optional
-import httpx
 from urllib.parse import quote
+from mcp.server.fastmcp import Context
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._fulltext import local_fulltext
+from tools.cebta._paginate import PAGINATE_MAX_RESULTS, paginate, report_to
 
 # 📘 工具用途說明：
 # 本工具封裝 CBETA Online 擴充搜尋模式 API（https://api.cbetaonline.cn/search/extended），
@@ -21,14 +24,21 @@ from main import __mcp_server__, success_response, error_response
 # - q: str        👉 查詢語句（需自行加雙引號及格式語法）
 # - start: int    👉 起始位置（預設為 0）
 # - rows: int     👉 回傳筆數（預設為 20）
+# - auto_paginate: int 👉 1 = 自動翻頁，由 start 起並發取回最多 max_results 筆（rows 不使用），
+#                         回傳另帶 fetched、pages 與 truncated / failed（見 _paginate）；每頁完成時以 MCP 進度通知回報
+# - max_results: int   👉 自動翻頁的筆數上限（預設與上限為 CBETA_PAGINATE_MAX_RESULTS）
+#
+# 設定 CBETA_FULLTEXT_MODE 時可改由本機全文索引回答（見 _fulltext），語法相同，查詢語句不需編碼。
 
 class ExtendedSearchParams(BaseModel):
     q: str
     start: Optional[int] = 0
     rows: Optional[int] = 20
+    auto_paginate: Optional[int] = 0  # 1 = 自動翻頁取回全部結果
+    max_results: Optional[int] = None  # 自動翻頁的筆數上限
 
 @__mcp_server__.tool()
-async def extended_search(params: ExtendedSearchParams):
+async def extended_search(params: ExtendedSearchParams, ctx: Optional[Context] = None):
     """
     🧠 CBETA 擴充模式全文檢索工具
 
@@ -57,14 +67,21 @@ async def extended_search(params: ExtendedSearchParams):
         encoded_query = quote(params.q)
 
         # 發送 GET 請求至 CBETA 擴充搜尋 API
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                "https://api.cbetaonline.cn/search/extended",
-                params={"q": encoded_query, "start": params.start, "rows": params.rows},
-                timeout=20
+        def fetch(start, rows):
+            return local_fulltext.answer(
+                "extended",
+                {"q": params.q, "start": start, "rows": rows},
+                lambda: cbeta_get(
+                    "/search/extended",
+                    {"q": encoded_query, "start": start, "rows": rows},
+                    timeout=20
+                )
             )
-            resp.raise_for_status()
-            data = resp.json()
+
+        if params.auto_paginate:
+            data = await paginate(fetch, params.start or 0, params.max_results or PAGINATE_MAX_RESULTS, report_to(ctx))
+        else:
+            data = await fetch(params.start, params.rows)
 
         # 精簡回傳內容
         total = data.get("total", 0)
@@ -76,7 +93,8 @@ async def extended_search(params: ExtendedSearchParams):
             }
             for r in data.get("results", [])
         ]
-        return success_response({"total": total, "rows": rows})
+        extra = {k: data[k] for k in ("fetched", "pages", "truncated", "failed") if k in data}
+        return success_response({"total": total, "rows": rows, **extra})
 
     except Exception as e:
         return error_response(f"CBETA 擴充搜尋失敗: {str(e)}")
@@ -1,8 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional
-import httpx
 
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
 
 # ------------------------------
 # 📘 工具名称：CBETA Online 近义词搜索
@@ -43,10 +43,7 @@ class SynonymSearchParams(BaseModel):
 @__mcp_server__.tool()
 async def synonym_search(params: SynonymSearchParams):
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/search/synonym", params={"q": params.q})
-            resp.raise_for_status()
-            data = resp.json()
-            return success_response(data)
+        data = await cbeta_get("/search/synonym", {"q": params.q})
+        return success_response(data)
     except Exception as e:
         return error_response(f"近义词搜索失败: {str(e)}")
\ No newline at end of file
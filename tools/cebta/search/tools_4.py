@@ -1,7 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional
 from main import __mcp_server__, success_response, error_response
-import httpx
+from tools.cebta._api import cbeta_get
+from tools.cebta._fulltext import local_fulltext
 
 class CBETASearchSCParams(BaseModel):
     q: str  # 搜尋關鍵詞（支持簡體/繁體）
@@ -34,10 +35,8 @@ async def cbeta_search_sc(params: CBETASearchSCParams):
             "order": params.order
         }
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/search/sc", params=query_params)
-            resp.raise_for_status()
-            data = resp.json()
+        # 本機索引以簡體建立，繁簡查詢皆可直接比對
+        data = await local_fulltext.answer("sc", query_params, lambda: cbeta_get("/search/sc", query_params))
 
         return success_response({
             "q": params.q,
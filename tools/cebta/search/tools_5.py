@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import Optional
-import httpx
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
 
 # =====================
 # 📘 接口說明：CBETA Facet 多維面向查詢
@@ -44,15 +44,12 @@ class CbetaFacetParams(BaseModel):
 async def cbeta_facet_query(params: CbetaFacetParams):
     try:
         # 構建 URL
-        base_url = "https://api.cbetaonline.cn/search/facet"
-        url = f"{base_url}/{params.f}" if params.f else base_url
+        # 構建端點路徑
+        path = f"/search/facet/{params.f}" if params.f else "/search/facet"
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params={"q": params.q})
-            resp.raise_for_status()
-            data = resp.json()
+        data = await cbeta_get(path, {"q": params.q})
 
-            return success_response(data)
+        return success_response(data)
 
     except Exception as e:
         return error_response(f"CBETA facet 查詢失敗: {str(e)}")
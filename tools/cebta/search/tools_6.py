@@ -1,7 +1,8 @@
 from typing import Optional
 from pydantic import BaseModel
 from main import __mcp_server__, success_response, error_response
-import httpx
+from tools.cebta._api import cbeta_get
+from tools.cebta._fulltext import local_fulltext
 
 # 定義請求參數格式
 class CBETAAllInOneParams(BaseModel):
@@ -74,12 +75,13 @@ async def cbeta_all_in_one(params: CBETAAllInOneParams):
     }
     """
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(
-                "https://api.cbetaonline.cn/search/all_in_one",
-                params=params.dict(exclude_none=True)
-            )
-            response.raise_for_status()
-            return success_response(response.json())
+        query_params = params.dict(exclude_none=True)
+        # 本機全文索引不支援 facet，facet=1 時一律請求上游（見 _fulltext）
+        data = await local_fulltext.answer(
+            "all_in_one",
+            query_params,
+            lambda: cbeta_get("/search/all_in_one", query_params, timeout=15.0, use_cache=bool(params.cache))
+        )
+        return success_response(data)
     except Exception as e:
         return error_response(f"CBETA 檢索失敗: {str(e)}")
@@ -2,8 +2,10 @@
 
 from typing import Optional
 from pydantic import BaseModel
+from mcp.server.fastmcp import Context
 from main import __mcp_server__, success_response, error_response
-import httpx
+from tools.cebta._api import cbeta_get
+from tools.cebta._paginate import PAGINATE_MAX_RESULTS, paginate, report_to
 
 class CBETANotesSearchParams(BaseModel):
     q: str  # 要搜尋的字詞，需加雙引號（且需 URL encode）
@@ -11,9 +13,11 @@ class CBETANotesSearchParams(BaseModel):
     rows: Optional[int] = 20  # 每頁回傳筆數，預設為 20
     start: Optional[int] = 0  # 起始位置，預設為 0
     facet: Optional[int] = 0  # 是否回傳 facet，0=不回傳，1=回傳四種 facet
+    auto_paginate: Optional[int] = 0  # 1 = 自動翻頁取回全部結果
+    max_results: Optional[int] = None  # 自動翻頁的筆數上限
 
 @__mcp_server__.tool()
-async def search_cbeta_notes(params: CBETANotesSearchParams):
+async def search_cbeta_notes(params: CBETANotesSearchParams, ctx: Optional[Context] = None):
     """
     📘 CBETA Online 註解／校勘條目搜尋工具
 
@@ -30,6 +34,9 @@ async def search_cbeta_notes(params: CBETANotesSearchParams):
     - rows：回傳筆數，預設為 20。
     - start：分頁起始 index，預設為 0。
     - facet：是否回傳 facet 統計資訊，0=不回傳，1=回傳 canon/category/creator/work。
+    - auto_paginate：1 = 自動翻頁，由 start 起並發取回最多 max_results 筆（rows 不使用），
+      docs 依序合併去重，另帶 fetched、pages 與 truncated / failed；facet 只隨第一頁請求，每頁完成時以 MCP 進度通知回報。
+    - max_results：自動翻頁的筆數上限（預設與上限為 CBETA_PAGINATE_MAX_RESULTS）。
 
     🧪 API 範例：
     ```
@@ -79,9 +86,17 @@ async def search_cbeta_notes(params: CBETANotesSearchParams):
     """
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/search/notes", params=params.dict())
-            resp.raise_for_status()
-            return success_response(resp.json())
+        query_params = params.dict(exclude={"auto_paginate", "max_results"})
+        if params.auto_paginate:
+            first = params.start or 0
+            data = await paginate(
+                lambda start, rows: cbeta_get("/search/notes", {
+                    **query_params, "start": start, "rows": rows, "facet": query_params["facet"] if start == first else 0,
+                }),
+                first, params.max_results or PAGINATE_MAX_RESULTS, report_to(ctx),
+            )
+        else:
+            data = await cbeta_get("/search/notes", query_params)
+        return success_response(data)
     except Exception as e:
         return error_response(f"CBETA notes search failed: {str(e)}")
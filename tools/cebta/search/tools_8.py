@@ -2,8 +2,10 @@
 
 from pydantic import BaseModel
 from typing import Optional
-import httpx
+from mcp.server.fastmcp import Context
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._paginate import PAGINATE_MAX_RESULTS, paginate, report_to
 
 # 📘 工具說明：
 # 本工具接口功能為【搜尋佛典標題（經名）】。
@@ -16,6 +18,9 @@ from main import __mcp_server__, success_response, error_response
 # - q（str）：必填，搜尋關鍵字，至少三個字。
 # - rows（int）：選填，每頁回傳筆數，預設為 20。
 # - start（int）：選填，起始位置，預設為 0（用於分頁）。
+# - auto_paginate（int）：選填，1 = 自動翻頁，由 start 起並發取回最多 max_results 筆（rows 不使用），
+#   結果依序合併去重，另帶 fetched、pages 與 truncated / failed（見 _paginate）；每頁完成時以 MCP 進度通知回報。
+# - max_results（int）：選填，自動翻頁的筆數上限，預設與上限為 CBETA_PAGINATE_MAX_RESULTS。
 #
 # ✅ 示例 JSON 返回：
 # {
@@ -42,18 +47,24 @@ class SearchTitleParams(BaseModel):
     q: str  # 搜尋經名（至少三個字）
     rows: Optional[int] = 20  # 每頁回傳筆數，預設為 20
     start: Optional[int] = 0  # 起始位置，預設為 0（分頁使用）
+    auto_paginate: Optional[int] = 0  # 1 = 自動翻頁取回全部結果
+    max_results: Optional[int] = None  # 自動翻頁的筆數上限
 
 @__mcp_server__.tool()
-async def search_title(params: SearchTitleParams):
+async def search_title(params: SearchTitleParams, ctx: Optional[Context] = None):
     """搜尋佛典標題（經名）"""
     if len(params.q.strip()) < 3:
         return error_response("搜尋關鍵字至少需三個字以上")
 
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/search/title", params=params.dict())
-            resp.raise_for_status()
-            data = resp.json()
-            return success_response(data)
+        query_params = params.dict(exclude={"auto_paginate", "max_results"})
+        if params.auto_paginate:
+            data = await paginate(
+                lambda start, rows: cbeta_get("/search/title", {**query_params, "start": start, "rows": rows}),
+                params.start or 0, params.max_results or PAGINATE_MAX_RESULTS, report_to(ctx),
+            )
+        else:
+            data = await cbeta_get("/search/title", query_params)
+        return success_response(data)
     except Exception as e:
         return error_response(f"外部 API 請求失敗: {str(e)}")
@@ -1,7 +1,8 @@
 from pydantic import BaseModel
-from typing import Optional
-import httpx
+from typing import List, Optional
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._kwic import KWIC_AROUND, KWIC_LOCAL, kwic_engine
 
 # 📘 KWIC 檢索工具
 # 
@@ -9,12 +10,14 @@ from main import __mcp_server__, success_response, error_response
 # 提供 CBETA Online 的 KWIC（Keyword in Context）單卷前後文檢索功能，可支援關鍵詞 NEAR 查詢、排除詞、夾注開關與關鍵詞標記等參數。
 # 
 # 📥 請求參數說明：
-# - work (str, 必要)：佛典編號，如 T0001、X0600。
-# - juan (int, 必要)：卷號，如 1、11。
+# - work (Optional[str])：佛典編號，如 T0001、X0600；與 works 至少擇一。
+# - juan (Optional[int])：卷號，如 1、11；省略時查該佛典的全部卷（指定時只能查單一 work）。
+# - works (Optional[List[str]])：多部佛典編號，查各部的全部卷（最多 200 部）。
 # - q (str, 必要)：查詢關鍵詞，可含 NEAR、排除詞、雙引號、逗號等高級語法。
 # - note (Optional[int])：是否包含夾注，0=不含，1=包含（預設=1）。
 # - mark (Optional[int])：是否加 mark 標記，0=不加（預設），1=加。
 # - sort (Optional[str])：排序方式，f=關鍵詞後排序，b=前排序，location=依卷內出現位置排序。
+# - around (Optional[int])：本機模式下關鍵詞前後各取幾字（預設 10）。
 # 
 # 📤 回傳結果 JSON 示例如下：
 # {
@@ -28,27 +31,53 @@ from main import __mcp_server__, success_response, error_response
 #         }
 #     ]
 # }
+#
+# 🔁 本機模式（預設，CBETA_KWIC_LOCAL=0 停用）：
+# 卷文經快取或本機鏡像取得後在本機查詢（見 _kwic），不再逐次請求 /search/kwic；
+# 各筆另含 work、juan、linehead。省略 juan 可查整部佛典，works 可一次查多部佛典；
+# q 可用「-詞」排除落在該詞之內的命中，如 "直心 -正直心" 或 "直心,-正直心"。個別卷失敗時列於 failed。
+# 本機不支援的語法（如逗號分隔的多個關鍵詞 "老子,道"）自動改為逐卷請求上游 /search/kwic。
+# 一次最多查詢 CBETA_KWIC_MAX_JUANS 卷（預設 1000）。
+
+MAX_WORKS = 200
 
 class KwicSearchParams(BaseModel):
-    work: str
-    juan: int
+    work: Optional[str] = None         # 佛典編號
+    juan: Optional[int] = None         # 卷號；省略時查全部卷
+    works: Optional[List[str]] = None  # 多部佛典（全部卷）
     q: str
     note: Optional[int] = 1
     mark: Optional[int] = 0
     sort: Optional[str] = 'f'
+    around: Optional[int] = None       # 本機模式：關鍵詞前後字數（預設 10）
 
 @__mcp_server__.tool()
 async def cbeta_kwic_search(params: KwicSearchParams):
     """
     🔍 CBETA KWIC 單卷關鍵詞檢索工具
 
-    支援：NEAR/查詢、排除前後詞搭配、夾注開關、排序與標記控制。
+    支援：NEAR/查詢、排除前後詞搭配、夾注開關、排序與標記控制；可查整部佛典或多部佛典。
     """
-    url = "https://api.cbetaonline.cn/search/kwic"
+    works = list(dict.fromkeys((params.works or []) + ([params.work] if params.work else [])))
+    if not works:
+        return error_response("請提供 work 或 works")
+    if len(works) > MAX_WORKS:
+        return error_response(f"works 最多 {MAX_WORKS} 部")
+    if params.juan is not None and params.works:
+        return error_response("指定 juan 時只能查詢單一 work")
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(url, params=params.dict())
-            resp.raise_for_status()
-            return success_response(resp.json())
+        upstream_params = params.dict(exclude={"work", "juan", "works", "around"})
+        local = KWIC_LOCAL and kwic_engine.supports(params.q)
+        if not local and params.juan is not None:
+            data = await cbeta_get("/search/kwic", {"work": works[0], "juan": params.juan, **upstream_params}, timeout=10.0)
+            return success_response(data)
+        targets = await kwic_engine.targets(works, params.juan)
+        if not local:
+            return success_response(await kwic_engine.search_upstream(targets, upstream_params))
+        data = await kwic_engine.search(
+            targets, params.q, note=params.note != 0, mark=bool(params.mark), sort=params.sort or "f",
+            around=params.around if params.around is not None else KWIC_AROUND,
+        )
+        return success_response(data)
     except Exception as e:
         return error_response(f"CBETA KWIC 檢索失敗: {e}")
\ No newline at end of file
@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from typing import Optional
 import httpx
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._works_index import query_works
 
 # ✅ 請求參數模型：指定佛典編號
 class CBETAWorkInfoParams(BaseModel):
@@ -85,15 +86,11 @@ async def get_cbeta_work_info(params: CBETAWorkInfoParams):
     - 語義查詢、知識圖譜擴充、數據標註等需要取得佛典背景資訊之任務
     """
 
-    url = "https://api.cbetaonline.cn/works"
     query_params = {"work": params.work}
 
     try:
         # ⏱️ 非同步請求 CBETA API
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params=query_params)
-            resp.raise_for_status()
-            data = resp.json()
+        data = await query_works(query_params)
     except httpx.HTTPError as e:
         return error_response(f"取得佛典資料失敗：{str(e)}")
 
@@ -1,12 +1,15 @@
 # tools/cbeta/toc.py
 from pydantic import BaseModel
 from typing import Optional
-import httpx
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._toc_index import get_toc_index
 
 # 定义请求参数模型
 class CBETATocParams(BaseModel):
     work: str  # 佛典編號，例如 T0001
+    depth: Optional[int] = None  # 只保留前几层目次（最外层为 1），更深的节点以 child_count 表示
+    juan: Optional[int] = None   # 只保留与该卷重叠的目次节点
 
 # 注册 MCP 工具接口，获取 CBETA 佛典內的目次信息
 @__mcp_server__.tool()
@@ -63,12 +66,30 @@ async def get_cbeta_toc(params: CBETATocParams):
         ]
     }
 
+    ✂️ 精简目次（depth / juan 任一有值时）：
+    由服务端缓存的扁平目次索引重建，只返回需要的部分，不含上游的其他字段：
+    {
+        "work": "T0001",
+        "juans": [1, 2, ...],
+        "mulu": [
+            {"title": "序", "file": "T01n0001", "juan": 1, "lb": "0001a02", "type": "序"},
+            {"title": "1 分", ..., "isFolder": true, "child_count": 4}   # 被截去子节点
+        ]
+    }
+
+    💡 只需知道某一行属于哪一品时，请改用 cbeta_toc_lookup。
     """
+    if params.depth is not None and params.depth < 1:
+        return error_response("depth 必须大于等于 1")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get("https://api.cbetaonline.cn/toc", params={"work": params.work})
-            response.raise_for_status()
-            data = response.json()
-            return success_response(data)
+        if params.depth is not None or params.juan is not None:
+            index = await get_toc_index(params.work)
+            return success_response({
+                "work": params.work,
+                "juans": index.juans,
+                "mulu": index.pruned(params.depth, params.juan),
+            })
+        data = await cbeta_get("/toc", {"work": params.work})
+        return success_response(data)
     except Exception as e:
         return error_response(f"取得 CBETA 目次失敗: {str(e)}")
@@ -1,7 +1,13 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
 from pydantic import BaseModel
-from typing import Optional
-import httpx
+from typing import Optional, Tuple
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._cache import ttl_for
 
 # CBETA 卷 HTML 內容抓取工具
 #
@@ -31,21 +37,153 @@ from main import __mcp_server__, success_response, error_response
 # }
 #
 # 🔧 用途：可用於 CBETA 閱讀器前端渲染、段落分析、結構轉換等。
+#
+# 📦 分段模式（chunk_chars / lines / cursor 任一有值時啟用）：
+# 長卷整卷回傳可達數百 KB，分段模式每次只回傳一段 HTML，並附 next_cursor 供下次續讀：
+#   - chunk_chars：每段最多字元數（預設 20000，上限 200000）
+#   - lines：每段最多行數（依 <span class="lb"> 行首標記計算）
+#   - cursor：上一段回傳的 next_cursor；done=true 表示已讀完
+# 段落盡量在行首標記處切開，依序串接各段 html 即為完整內容。
+# 上游沒有分段端點，第一段仍須經 cbeta_get 取得整卷 /juans（經共用快取）；取出的 HTML 字串保留在
+# 小型 LRU（CBETA_JUAN_HTML_CACHE 卷，過期時間同 /juans 快取），續讀時直接切片，不必再從快取解碼整份回應。
+# 因此回傳給呼叫端的內容以一段為限，服務端記憶體則以整卷計（最多保留 CBETA_JUAN_HTML_CACHE 卷）。
+# work_info / toc 僅在第一段由 /works、/toc 取得。
+#
+# ✅ 分段模式返回格式範例：
+# {
+#   "work": "T0001", "juan": 1, "total_chars": 182345,
+#   "chunk": {"offset": 0, "chars": 19876, "line_start": 0, "line_count": 412,
+#             "first_linehead": "T01n0001_p0001a01", "last_linehead": "T01n0001_p0002c18"},
+#   "html": "...",
+#   "next_cursor": "T0001:1:412:19876",
+#   "done": false
+# }
+
+CHUNK_DEFAULT_CHARS = 20000
+CHUNK_MAX_CHARS = 200000
+JUAN_HTML_CACHE = int(os.getenv("CBETA_JUAN_HTML_CACHE", "16"))
+
+# 分段續讀用的卷 HTML：(佛典, 卷) → (到期時間, html)
+_juan_html: "OrderedDict[Tuple[str, int], Tuple[float, str]]" = OrderedDict()
+
+# CBETA 卷 HTML 的行首標記，如 <span class='lb' id='T01n0001_p0001a01'>
+LINEHEAD_TAG = re.compile(r"""<span\b[^>]*\bclass=["']lb["'][^>]*>""")
+LINEHEAD_ID = re.compile(r"""\bid=["']([^"']+)["']""")
 
 class GetJuanHTMLParams(BaseModel):
     work: str                    # 佛典編號，例如 T0001
     juan: int                   # 卷號（從 1 開始）
     work_info: Optional[int] = 0  # 是否回傳佛典資訊（0=否，1=是）
     toc: Optional[int] = 0        # 是否回傳目次（0=否，1=是）
+    chunk_chars: Optional[int] = None  # 分段模式：每段最多字元數
+    lines: Optional[int] = None        # 分段模式：每段最多行數
+    cursor: Optional[str] = None       # 分段模式：續讀位置（上一段的 next_cursor）
+
+def _parse_cursor(cursor: str, work: str, juan: int):
+    """cursor 格式為 work:juan:行序:字元位置，回傳 (行序, 字元位置)。"""
+    parts = cursor.rsplit(":", 3)
+    if len(parts) != 4 or parts[0] != work or parts[1] != str(juan):
+        raise ValueError("cursor 與 work / juan 不符")
+    return int(parts[2]), int(parts[3])
+
+def _linehead(tag) -> Optional[str]:
+    match = LINEHEAD_ID.search(tag.group(0))
+    return match.group(1) if match else None
+
+def _slice_chunk(html: str, offset: int, max_chars: int, max_lines: Optional[int]):
+    """
+    自 offset 起切出一段，回傳 (結束位置, 段內行首標記列表)。
+
+    只掃描本段範圍；超過字數時退回最後一個行首標記處切開，
+    單行過長時退回最後一個標籤起點，避免把標籤切斷。
+    """
+    limit = min(len(html), offset + max_chars)
+    marks = []
+    end = limit
+    for tag in LINEHEAD_TAG.finditer(html, offset, limit):
+        if tag.start() > offset and max_lines and len(marks) >= max_lines:
+            end = tag.start()
+            break
+        marks.append(tag)
+    else:
+        if limit < len(html):
+            boundary = marks[-1].start() if marks and marks[-1].start() > offset else html.rfind("<", offset + 1, limit)
+            if boundary > offset:
+                end = boundary
+            if marks and marks[-1].start() >= end:
+                marks.pop()
+    return end, marks
+
+async def _juan_html_of(work: str, juan: int) -> str:
+    """卷 HTML；續讀時由 LRU 取得，未命中或過期時經 cbeta_get 取 /juans。"""
+    key = (work, juan)
+    cached = _juan_html.get(key)
+    if cached is not None and cached[0] > time.time():
+        _juan_html.move_to_end(key)
+        return cached[1]
+    data = await cbeta_get("/juans", {"work": work, "juan": juan})
+    results = data.get("results") or []
+    if not results:
+        raise ValueError("查無此卷內容")
+    html = results[0].get("html") or ""
+    _juan_html[key] = (time.time() + ttl_for("/juans"), html)
+    _juan_html.move_to_end(key)
+    while len(_juan_html) > JUAN_HTML_CACHE:
+        _juan_html.popitem(last=False)
+    return html
+
+async def _get_juan_chunk(params: GetJuanHTMLParams):
+    line_start, offset = _parse_cursor(params.cursor, params.work, params.juan) if params.cursor else (0, 0)
+    max_chars = min(max(params.chunk_chars or CHUNK_DEFAULT_CHARS, 1000), CHUNK_MAX_CHARS)
+    max_lines = max(params.lines, 1) if params.lines else None
+
+    requests = [_juan_html_of(params.work, params.juan)]
+    first = not params.cursor
+    if first and params.work_info:
+        requests.append(cbeta_get("/works", {"work": params.work}))
+    if first and params.toc:
+        requests.append(cbeta_get("/toc", {"work": params.work}))
+    responses = await asyncio.gather(*requests)
+
+    html = responses[0]
+    if offset > len(html):
+        raise ValueError("cursor 超出卷內容範圍")
+
+    end, marks = _slice_chunk(html, offset, max_chars, max_lines)
+    done = end >= len(html)
+    data = {
+        "work": params.work,
+        "juan": params.juan,
+        "total_chars": len(html),
+        "chunk": {
+            "offset": offset,
+            "chars": end - offset,
+            "line_start": line_start,
+            "line_count": len(marks),
+            "first_linehead": _linehead(marks[0]) if marks else None,
+            "last_linehead": _linehead(marks[-1]) if marks else None,
+        },
+        "html": html[offset:end],
+        "next_cursor": None if done else f"{params.work}:{params.juan}:{line_start + len(marks)}:{end}",
+        "done": done,
+    }
+    extras = iter(responses[1:])
+    if first and params.work_info:
+        found = next(extras).get("results") or []
+        data["work_info"] = found[0] if found else None
+    if first and params.toc:
+        found = next(extras).get("results") or []
+        data["toc"] = found[0] if found else None
+    return data
 
 @__mcp_server__.tool()
 async def get_juan_html(params: GetJuanHTMLParams):
     try:
-        url = "https://api.cbetaonline.cn/juans"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params=params.dict())
-            resp.raise_for_status()
-            data = resp.json()
-            return success_response(data)
+        if params.chunk_chars or params.lines or params.cursor:
+            return success_response(await _get_juan_chunk(params))
+        data = await cbeta_get("/juans", params.dict())
+        return success_response(data)
+    except ValueError as e:
+        return error_response(f"分段讀取失敗: {str(e)}")
     except Exception as e:
         return error_response(f"CBETA API 請求失敗: {str(e)}")
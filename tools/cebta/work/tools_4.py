@@ -1,7 +1,9 @@
 from pydantic import BaseModel
-from typing import Optional
-import httpx
+from typing import List, Optional
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._api import cbeta_get
+from tools.cebta._citation import parse_citation, citation_from_fields
+from tools.cebta._resolver import citation_resolver, goto_url
 
 # 📘 工具名稱：CBETA 經文跳轉接口
 # 🧾 接口說明：
@@ -10,6 +12,13 @@ from main import __mcp_server__, success_response, error_response
 # 1. 經卷結構（canon, work, juan, page, col, line）
 # 2. 書本結構（canon, vol, page, col, line）
 # 3. 行首格式引用（linehead）
+#
+# 引用先在本機解析並補齊佛典編號與卷號（見 tools/cebta/_citation.py、_resolver.py），
+# 只用到快取的目次與佛典目錄，不需請求 /juans/goto；本機無法定位時才轉送上游。
+# citations 可一次傳入大量引用字串（行首、CBETA 引用格式、冊頁欄行、經卷），適合引用密集的文件。
+
+# 一次批次解析的引用數上限
+MAX_CITATIONS = 5000
 
 # 📥 請求參數：
 class CBETAGotoParams(BaseModel):
@@ -21,28 +30,38 @@ class CBETAGotoParams(BaseModel):
     col: Optional[str] = None    # 欄位，a, b, c
     line: Optional[int] = None   # 行數
     linehead: Optional[str] = None  # 行首引用，如 T01n0001_p0066c25 或 CBETA 格式
+    citations: Optional[List[str]] = None  # 批次引用，如 ["T01n0001_p0066c25", "T01, no. 1, p. 11b10", "T0001_002"]
 
 # 📤 返回示例：
 # {
 #     "status": "success",
 #     "result": {
-#         "url": "https://api.cbetaonline.cn/juans/goto?canon=T&work=1&page=11&col=b&line=10"
+#         "url": "https://api.cbetaonline.cn/juans/goto?linehead=T01n0001_p0066c25",
+#         "canon": "T", "vol": 1, "work": "T0001", "juan": 12,
+#         "file": "T01n0001", "lb": "0066c25", "linehead": "T01n0001_p0066c25"
 #     }
 # }
+# 批次（citations）：{"num_found": 2, "resolved": 1, "results": [{"input": "...", "work": ..., "juan": ..., "url": ...}, {"input": "...", "error": "..."}]}
 
 @__mcp_server__.tool()
 async def cbeta_goto(params: CBETAGotoParams):
     """
-    📌 功能：跳轉到 CBETA 對應的經文位置 URL。
+    📌 功能：跳轉到 CBETA 對應的經文位置 URL，並回傳所在佛典與卷號。
 
     ✅ 三種跳轉模式：
     - canon + work + (juan/page/col/line)
     - canon + vol + (page/col/line)
     - linehead (優先)
 
+    📚 批次模式：citations 傳入引用字串列表（最多 5000 則），逐則回傳結果，無法解析者帶 error。
+
     ⚠️ 注意：若 linehead 存在，則其他參數將被忽略。
     """
-    base_url = "https://api.cbetaonline.cn/juans/goto"
+    if params.citations:
+        if len(params.citations) > MAX_CITATIONS:
+            return error_response(f"citations 最多 {MAX_CITATIONS} 則")
+        return success_response(await _resolve_batch(params.citations))
+
     query_params = {}
 
     # 優先處理 linehead
@@ -55,10 +74,38 @@ async def cbeta_goto(params: CBETAGotoParams):
                 query_params[field] = value
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(base_url, params=query_params)
-            response.raise_for_status()
-            final_url = str(response.url)
-            return success_response({"url": final_url})
+        if params.linehead:
+            citation = parse_citation(params.linehead)
+        else:
+            citation = citation_from_fields(**query_params)
+        result = (await citation_resolver.resolve_many([citation]))[0]
+        if "error" not in result:
+            # url 維持與原本相同的查詢參數
+            return success_response({**result, "url": goto_url(query_params)})
+    except ValueError:
+        pass
+
+    try:
+        # 本機無法定位時轉送上游；只快取最終 URL，跳轉接口的回應內容本身不需要
+        data = await cbeta_get("/juans/goto", query_params, parse=lambda resp: {"url": str(resp.url)})
+        return success_response(data)
     except Exception as e:
-        return error_response(f"CBETA 跳轉失敗：{str(e)}")
\ No newline at end of file
+        return error_response(f"CBETA 跳轉失敗：{str(e)}")
+
+
+async def _resolve_batch(texts: List[str]) -> dict:
+    results = [{"input": text} for text in texts]
+    parsed = []
+    for result in results:
+        try:
+            parsed.append((result, parse_citation(result["input"])))
+        except ValueError as e:
+            result["error"] = str(e)
+    resolved = await citation_resolver.resolve_many([citation for _, citation in parsed])
+    for (result, _), data in zip(parsed, resolved):
+        result.update(data)
+    return {
+        "num_found": len(results),
+        "resolved": sum(1 for r in results if "error" not in r),
+        "results": results,
+    }
@@ -1,8 +1,8 @@
 from pydantic import BaseModel
 from typing import Optional
-import httpx
 
 from main import __mcp_server__, success_response, error_response
+from tools.cebta._line_cache import query_lines
 
 # 📘 工具名稱：CBETA 指定行段文字取得工具
 # 📌 工具功能說明：
@@ -32,6 +32,8 @@ from main import __mcp_server__, success_response, error_response
 # }
 
 # 🔗 API 來源：https://api.cbetaonline.cn/lines
+#
+# ♻️ 行段快取：已取得的行依檔案保存為連續區段，重疊或擴大的範圍只向上游請求缺少的部分（見 tools/cebta/_line_cache.py）。
 
 
 class CBETALineParams(BaseModel):
@@ -49,10 +51,7 @@ async def get_cbeta_lines(params: CBETALineParams):
     依據 CBETA 大正藏 API，抓取指定行或行段的 HTML 內容與註解。
     """
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get("https://api.cbetaonline.cn/lines", params=params.dict(exclude_none=True))
-            resp.raise_for_status()
-            data = resp.json()
-            return success_response(data)
+        data = await query_lines(params.dict(exclude_none=True))
+        return success_response(data)
     except Exception as e:
         return error_response(f"CBETA 行文擷取失敗: {str(e)}")
@@ -0,0 +1,80 @@
+import asyncio
+from pydantic import BaseModel
+from typing import List, Optional
+from main import __mcp_server__, success_response, error_response
+from tools.cebta._citation import split_linehead, work_of_file
+from tools.cebta._toc_index import get_toc_index
+
+# 📘 工具名稱：CBETA 行首 → 目次定位
+# 🧾 工具說明：
+# 查詢某一行（行首）或某一卷位於佛典的哪一品、哪一經，回傳由最外層到最內層的各層目次。
+# 目次於服務端攤平為依 (卷, 行號) 排序的索引並快取，查詢以二分搜尋完成，不必下載整份巢狀目次。
+#
+# ✅ 參數：
+# - linehead / lineheads：行首，如 "T01n0001_p0066c25"（可一次多個，可跨佛典）
+# - work：佛典編號；省略時由行首推得（T01n0001 → T0001）
+# - juan：卷號；回傳卷首所在的各層目次與卷內開始的目次節點
+# - depth：搭配 juan，卷內節點只列到第幾層（最外層為 1）
+#
+# 📤 返回示例：
+# {
+#   "status": "success",
+#   "result": {
+#     "results": [
+#       {
+#         "linehead": "T01n0001_p0012a03", "work": "T0001", "juan": 2,
+#         "section": {"title": "2 遊行經", "type": "經", "juan": 2, "lb": "0011a07", "depth": 2, ...},
+#         "path": [{"title": "1 分", "depth": 1, ...}, {"title": "2 遊行經", "depth": 2, ...}]
+#       }
+#     ]
+#   }
+# }
+# 個別行首無法定位時，該項帶 error 欄位，其餘照常回傳。
+
+class CBETATocLookupParams(BaseModel):
+    work: Optional[str] = None             # 佛典編號，如 T0001
+    linehead: Optional[str] = None         # 單一行首
+    lineheads: Optional[List[str]] = None  # 多個行首
+    juan: Optional[int] = None             # 卷號
+    depth: Optional[int] = None            # 卷內節點最大層數（搭配 juan）
+
+
+async def _locate(work: Optional[str], linehead: str) -> dict:
+    try:
+        work = work or work_of_file(split_linehead(linehead)[0])
+        index = await get_toc_index(work)
+        return {"work": work, **index.locate(linehead)}
+    except Exception as e:
+        return {"linehead": linehead, "work": work, "error": str(e)}
+
+
+@__mcp_server__.tool()
+async def cbeta_toc_lookup(params: CBETATocLookupParams):
+    """
+    📌 功能：由行首或卷號查出所在的各層目次（品、經、分等）。
+
+    ✅ 使用方式：
+    - linehead 或 lineheads：每個行首回傳 juan、section（最內層節點）與 path（各層節點）
+    - work + juan：回傳卷首所在的各層目次（path）與卷內開始的節點（sections，可用 depth 限制層數）
+    """
+    lineheads = list(params.lineheads or []) + ([params.linehead] if params.linehead else [])
+    if not lineheads and params.juan is None:
+        return error_response("請提供 linehead、lineheads 或 work + juan")
+    if params.juan is not None and not params.work:
+        return error_response("以卷號查詢時必須提供 work")
+    try:
+        result = {}
+        if lineheads:
+            # 同一部佛典的目次索引只建立一次（並發請求由 cbeta_get 合併）
+            result["results"] = list(await asyncio.gather(*(_locate(params.work, lh) for lh in lineheads)))
+        if params.juan is not None:
+            index = await get_toc_index(params.work)
+            result["juan"] = {
+                "work": params.work,
+                "juan": params.juan,
+                "path": index.enclosing(params.juan),
+                "sections": index.sections(params.juan, params.depth),
+            }
+        return success_response(result)
+    except Exception as e:
+        return error_response(f"CBETA 目次定位失敗：{str(e)}")
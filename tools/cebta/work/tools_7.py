@@ -0,0 +1,54 @@
+from pydantic import BaseModel
+from typing import List
+
+from main import __mcp_server__, success_response, error_response
+from tools.cebta._line_cache import query_line_batch
+
+# 📘 工具名稱：CBETA 批次行文擷取
+# 📌 工具功能說明：
+# 一次取得多則引用的行文，適合核對引文：同一檔案中相鄰或相近的行段先排序合併，
+# 以最少的 linehead_start / linehead_end 請求並發取得（經全域限流與行段快取），再依原順序拆回各則引用。
+
+# ✅ citations 每則可為：
+# - 單一行首："T01n0001_p0001a04"
+# - 行段："T01n0001_p0001a04-T01n0001_p0001a10"、"T01n0001_p0001a04~0001b02"
+# - CBETA 引用格式："T01, no. 1, p. 66c25-27"
+
+# 🧾 回傳範例 JSON：
+# {
+#   "num_found": 2,          # 引用則數
+#   "requests": 1,           # 合併後的行段請求數
+#   "failed": 0,
+#   "results": [
+#     {
+#       "input": "T01n0001_p0001a04",
+#       "linehead_start": "T01n0001_p0001a04", "linehead_end": "T01n0001_p0001a04",
+#       "num_found": 1,
+#       "results": [{"linehead": "T01n0001_p0001a04", "html": "...", "notes": {...}}]
+#     },
+#     {"input": "...", "error": "無法解析行段：..."}
+#   ]
+# }
+
+# 一次最多引用則數
+MAX_CITATIONS = 1000
+
+
+class CBETALineBatchParams(BaseModel):
+    citations: List[str]  # 行首、行段或 CBETA 引用格式
+
+
+@__mcp_server__.tool()
+async def get_cbeta_lines_batch(params: CBETALineBatchParams):
+    """
+    📘 CBETA 批次行文擷取工具
+    一次取得多則行首或行段的 HTML 與註解，相近的行段合併請求，結果依輸入順序逐則回傳。
+    """
+    if not params.citations:
+        return error_response("citations 不可為空")
+    if len(params.citations) > MAX_CITATIONS:
+        return error_response(f"citations 最多 {MAX_CITATIONS} 則")
+    try:
+        return success_response(await query_line_batch(params.citations))
+    except Exception as e:
+        return error_response(f"CBETA 批次行文擷取失敗: {str(e)}")
@@ -0,0 +1,54 @@
+from pydantic import BaseModel
+from typing import List
+
+from main import __mcp_server__, success_response, error_response
+from tools.cebta._works_index import query_works_batch
+
+# 📘 工具名稱：CBETA 批次佛典資訊
+# 📌 工具功能說明：
+# 一次取得多部佛典的資訊（欄位同 get_cbeta_work_info）：先查本機佛典目錄索引，
+# 其餘依藏經分組，同一藏經缺漏較多時以一次 /works 藏經查詢取得，否則逐部並發查詢（有並發上限）。
+# 個別佛典查無或失敗只在該筆標示 error，不影響其他佛典。
+
+# 🧾 回傳範例 JSON：
+# {
+#   "num_found": 2,          # 成功取得的佛典數
+#   "failed": 1,
+#   "results": {
+#     "T1501": {"work": "T1501", "title": "菩薩戒本", "byline": "...", ...},
+#     "T0001": {"work": "T0001", "title": "長阿含經", ...},
+#     "X9999": {"error": "查無此佛典資訊"}
+#   }
+# }
+
+# 一次最多佛典數
+MAX_WORKS = 500
+
+FIELDS = ("work", "title", "byline", "creators", "category", "orig_category", "time_dynasty",
+          "time_from", "time_to", "cjk_chars", "en_words", "file", "juan_start", "places")
+
+
+class CBETAWorkInfoBatchParams(BaseModel):
+    works: List[str]  # 佛典編號，例如 ["T1501", "T0001"]
+
+
+@__mcp_server__.tool()
+async def get_cbeta_work_info_batch(params: CBETAWorkInfoBatchParams):
+    """
+    📘 CBETA 批次佛典資訊工具
+    一次取得多部佛典的詳細資訊，結果以佛典編號為鍵，個別失敗的佛典以 error 標示。
+    """
+    if not params.works:
+        return error_response("works 不可為空")
+    if len(params.works) > MAX_WORKS:
+        return error_response(f"works 最多 {MAX_WORKS} 部")
+    try:
+        found = await query_works_batch(params.works)
+    except Exception as e:
+        return error_response(f"取得佛典資料失敗：{str(e)}")
+    results = {
+        work: info if "error" in info else {field: info.get(field) for field in FIELDS}
+        for work, info in found.items()
+    }
+    failed = sum(1 for info in results.values() if "error" in info)
+    return success_response({"num_found": len(results) - failed, "failed": failed, "results": results})
@@ -0,0 +1,56 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+from main import __mcp_server__, success_response, error_response
+from tools.cebta._toc_index import get_toc_indexes
+
+# 📘 工具名稱：CBETA 批次目次
+# 📌 工具功能說明：
+# 一次取得多部佛典的目次（精簡格式同 get_cbeta_toc 指定 depth / juan 時的回傳）：
+# 已建立的目次索引直接使用，其餘經 /toc 並發下載（有並發上限，共用快取與限流）。
+# 個別佛典失敗只在該筆標示 error，不影響其他佛典。
+
+# 🧾 回傳範例 JSON：
+# {
+#   "num_found": 2,
+#   "failed": 0,
+#   "results": {
+#     "T0001": {"juans": [1, 2, ...], "mulu": [{"title": "序", "juan": 1, "lb": "0001a02", ...}, ...]},
+#     "T0002": {"juans": [1], "mulu": [...]}
+#   }
+# }
+
+# 一次最多佛典數
+MAX_WORKS = 200
+
+
+class CBETATocBatchParams(BaseModel):
+    works: List[str]              # 佛典編號，例如 ["T0001", "T0002"]
+    depth: Optional[int] = None   # 只保留前幾層目次（最外層為 1）
+    juan: Optional[int] = None    # 只保留與該卷重疊的目次節點
+
+
+@__mcp_server__.tool()
+async def get_cbeta_toc_batch(params: CBETATocBatchParams):
+    """
+    📘 CBETA 批次目次工具
+    一次取得多部佛典的目次，結果以佛典編號為鍵；可用 depth 限定層數、juan 限定卷號。
+    """
+    if not params.works:
+        return error_response("works 不可為空")
+    if len(params.works) > MAX_WORKS:
+        return error_response(f"works 最多 {MAX_WORKS} 部")
+    if params.depth is not None and params.depth < 1:
+        return error_response("depth 必須大於等於 1")
+    try:
+        indexes = await get_toc_indexes(params.works)
+    except Exception as e:
+        return error_response(f"取得 CBETA 目次失敗: {str(e)}")
+    results = {}
+    for work, index in indexes.items():
+        if isinstance(index, Exception):
+            results[work] = {"error": str(index)}
+        else:
+            results[work] = {"juans": index.juans, "mulu": index.pruned(params.depth, params.juan)}
+    failed = sum(1 for item in results.values() if "error" in item)
+    return success_response({"num_found": len(results) - failed, "failed": failed, "results": results})